@@ -58,12 +58,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chat.middleware.ServerTimingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'chat.middleware.SlidingSessionMiddleware',
+    'chat.middleware.RateLimitHeadersMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -109,6 +112,15 @@ DATABASES = {
     # }
 }
 
+CACHES = {
+    "default": {
+        # Use a shared backend (Redis, Memcached, database) when running several workers so
+        # cache invalidation reaches all of them.
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "medassist-default"),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -157,12 +169,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "chat.authentication.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "EXCEPTION_HANDLER": "chat.api_utils.api_exception_handler",
 }
 
 raw_csrf_origins = os.getenv("CSRF_TRUSTED_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173")
@@ -172,10 +185,23 @@ raw_cors_origins = os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:5173,http
 CORS_ALLOWED_ORIGINS = [origin.strip() for origin in raw_cors_origins.split(",") if origin.strip()]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ["Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset"]
 
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_AGE = int(os.getenv("SESSION_COOKIE_AGE", "1209600"))
-SESSION_SAVE_EVERY_REQUEST = True
+
+# "db" keeps rows in django_session, "cache" stores sessions in CACHES["default"] (use a shared
+# backend with several workers) and "signed_cookie" keeps the session client-side.
+SESSION_MODE = os.getenv("SESSION_MODE", "db").strip().lower()
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "signed_cookie": "django.contrib.sessions.backends.signed_cookies",
+}
+SESSION_ENGINE = SESSION_ENGINES.get(SESSION_MODE, SESSION_ENGINES["db"])
+SESSION_SAVE_EVERY_REQUEST = os.getenv("SESSION_SAVE_EVERY_REQUEST", "0").lower() in {"1", "true", "yes"}
+# Sliding expiry: re-save the session only once its remaining lifetime drops below this many seconds.
+SESSION_REFRESH_THRESHOLD = int(os.getenv("SESSION_REFRESH_THRESHOLD", str(SESSION_COOKIE_AGE // 2)))
 
 if not DEBUG:
     SESSION_COOKIE_SAMESITE = "None"
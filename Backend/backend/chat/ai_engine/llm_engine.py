@@ -1,21 +1,68 @@
-import json
-import os
-from groq import Groq # type: ignore
+import time
+from ..knowledge_store import medical_store
+from ..llm_usage import record_llm_call
+from ..metrics import observe, span
 from ..models import ChatMessage
+from .providers import LLMTimeout, get_provider
+from .routing import route_for, router
+from .scheduler import LLMOverloaded, scheduler
+from .single_flight import flight_key, single_flight
+
+
+def complete(messages, *, priority="interactive", purpose=None, user=None, model=None, **params):
+    """Single entrypoint for provider calls; raises LLMOverloaded when the scheduler sheds the call.
+
+    The route for `purpose` picks the model (unless one is given) and may hedge a slow primary with a
+    second model. Identical concurrent prompts share one routed call, and every attempt that reached
+    the provider gets an LLMCallLog row.
+    """
+    purpose = purpose or priority
+    route, config, routed_model = route_for(purpose, messages)
+    if model:
+        config, routed_model = {**config, "hedge_model": None}, model
+    model = routed_model
+
+    def attempt(attempt_model, kind, *, wait, race, on_admitted):
+        with scheduler.slot(priority, wait=wait):
+            if on_admitted:
+                on_admitted()
+            started = time.monotonic()
+            status, usage, won = "error", None, False
+            try:
+                completion = get_provider().complete(attempt_model, messages, **params)
+                status, usage = "ok", completion.usage
+                won = race.claim(kind)
+            except LLMTimeout:
+                status = "timeout"
+                raise
+            finally:
+                latency = time.monotonic() - started
+                outcome = ("won" if won else "lost") if status == "ok" else status
+                observe("llm_attempt_seconds", latency, route=route, attempt=kind, outcome=outcome)
+                record_llm_call(
+                    model=attempt_model,
+                    purpose=purpose,
+                    status=status,
+                    latency_ms=latency * 1000,
+                    user=user,
+                    usage=usage,
+                    attempt=kind,
+                    won=won,
+                )
+        return completion.content
+
+    with span("llm"):
+        try:
+            return single_flight.do(
+                flight_key(model, messages, params), lambda: router.run(route, config, model, attempt)
+            )
+        except LLMOverloaded:
+            record_llm_call(model=model, purpose=purpose, status="shed", latency_ms=0, user=user)
+            raise
 
-groq_api_key = os.getenv("GROQ_API") or os.getenv("GROQ_API_KEY")
-if not groq_api_key:
-    raise RuntimeError("Missing GROQ_API (or GROQ_API_KEY) environment variable.")
-
-client = Groq(api_key=groq_api_key)
-
-DATA_PATH = "chat/data/medical_data.json"
-
-with open(DATA_PATH) as f:
-    MEDICAL_DATA = json.load(f)
 
 def build_medical_context():
-    return json.dumps(MEDICAL_DATA, indent=2)
+    return medical_store.prompt_context()
 
 
 def build_conversation(session):
@@ -34,6 +81,20 @@ def build_conversation(session):
 
 
 def generate_ai_response(user_query, session, document_context=""):
+    with span("prompt"):
+        messages = build_prompt(user_query, session, document_context)
+    return complete(
+        messages,
+        priority="interactive",
+        purpose="chat",
+        user=session.user,
+        temperature=0.2,
+        max_completion_tokens=250,
+        top_p=1
+    )
+
+
+def build_prompt(user_query, session, document_context=""):
     doc_context_block = ""
     if (document_context or "").strip():
         doc_context_block = f"""
@@ -70,12 +131,4 @@ Medical data:
         "content": user_query
     }
 
-    completion = client.chat.completions.create(
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        messages=[system_message] + conversation + [user_message],
-        temperature=0.2,
-        max_completion_tokens=250,
-        top_p=1
-    )
-
-    return completion.choices[0].message.content
+    return [system_message] + conversation + [user_message]
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+
+
+# groq: Groq API (or a Groq-compatible server via LLM_BASE_URL); openai: any OpenAI-compatible
+# /chat/completions endpoint; echo: deterministic offline replies for development and tests.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").strip().lower()
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or os.getenv("GROQ_BASE_URL") or None
+LLM_API_KEY = os.getenv("LLM_API_KEY") or os.getenv("GROQ_API") or os.getenv("GROQ_API_KEY")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_ECHO_TEMPLATE = os.getenv("LLM_ECHO_TEMPLATE", "MedAssist is running offline. You asked: {prompt}")
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMTimeout(Exception):
+    pass
+
+
+class LLMConfigurationError(RuntimeError):
+    pass
+
+
+class Usage:
+    def __init__(self, prompt_tokens=0, completion_tokens=0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+class Completion:
+    def __init__(self, content, usage=None):
+        self.content = content or ""
+        self.usage = usage
+
+
+class GroqProvider:
+    name = "groq"
+
+    def __init__(self, *, api_key=None, base_url=None, timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES):
+        if not api_key and not base_url:
+            raise LLMConfigurationError("Missing GROQ_API (or GROQ_API_KEY / LLM_API_KEY) environment variable.")
+        # Imported here: the SDK and its HTTP stack are most of a worker's import time.
+        from groq import Groq
+
+        self.client = Groq(api_key=api_key or "local", base_url=base_url, timeout=timeout, max_retries=max_retries)
+
+    def complete(self, model, messages, **params):
+        from groq import APITimeoutError
+
+        try:
+            completion = self.client.chat.completions.create(model=model, messages=messages, **params)
+        except APITimeoutError as exc:
+            raise LLMTimeout(str(exc)) from exc
+        return Completion(completion.choices[0].message.content, completion.usage)
+
+
+class OpenAICompatibleProvider:
+    """Plain HTTP client for servers exposing `POST {base_url}/chat/completions` (vLLM, Ollama, OpenAI, ...)."""
+
+    name = "openai"
+
+    def __init__(self, *, api_key=None, base_url=None, timeout=LLM_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES):
+        if not base_url:
+            raise LLMConfigurationError("LLM_BASE_URL is required for the openai provider.")
+        import httpx
+
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._httpx = httpx
+        self.client = httpx.Client(base_url=base_url.rstrip("/"), headers=headers, timeout=timeout)
+        self.max_retries = max(max_retries, 0)
+
+    def complete(self, model, messages, **params):
+        payload = {"model": model, "messages": messages, **params}
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.post("/chat/completions", json=payload)
+            except self._httpx.TimeoutException as exc:
+                if attempt == self.max_retries:
+                    raise LLMTimeout(str(exc)) from exc
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                try:
+                    delay = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    delay = 0.5 * 2**attempt
+                time.sleep(min(delay, 8))
+                continue
+            response.raise_for_status()
+            break
+        body = response.json()
+        usage = body.get("usage") or {}
+        return Completion(
+            body["choices"][0]["message"].get("content"),
+            Usage(usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0),
+        )
+
+
+class EchoProvider:
+    name = "echo"
+
+    def __init__(self, *, template=LLM_ECHO_TEMPLATE, **_):
+        self.template = template
+
+    def complete(self, model, messages, **params):
+        prompt = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        words = self.template.format(prompt=" ".join(prompt.split()), model=model).split()
+        limit = params.get("max_completion_tokens") or params.get("max_tokens")
+        if limit:
+            words = words[:limit]
+        prompt_tokens = sum(len(str(m.get("content") or "").split()) for m in messages)
+        return Completion(" ".join(words), Usage(prompt_tokens, len(words)))
+
+
+PROVIDERS = {
+    GroqProvider.name: GroqProvider,
+    OpenAICompatibleProvider.name: OpenAICompatibleProvider,
+    EchoProvider.name: EchoProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def build_provider(name=LLM_PROVIDER, **overrides):
+    if name not in PROVIDERS:
+        raise LLMConfigurationError(f"Unknown LLM_PROVIDER: {name}")
+    options = {"api_key": LLM_API_KEY, "base_url": LLM_BASE_URL, **overrides}
+    return PROVIDERS[name](**options)
+
+
+def get_provider():
+    """The configured provider, built on first use so imports and management commands never need it."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = build_provider()
+    return _provider
+
+
+def config_status():
+    """Health check of the provider settings that does not build a client."""
+    if LLM_PROVIDER not in PROVIDERS:
+        return {"ok": False, "detail": f"Unknown LLM_PROVIDER: {LLM_PROVIDER}."}
+    if LLM_PROVIDER == "echo":
+        return {"ok": True, "detail": "Offline echo provider (no model calls)."}
+    if LLM_PROVIDER == "openai" and not LLM_BASE_URL:
+        return {"ok": False, "detail": "Missing LLM_BASE_URL for the openai provider."}
+    if LLM_PROVIDER == "groq" and not (LLM_API_KEY or LLM_BASE_URL):
+        return {"ok": False, "detail": "Missing GROQ_API key."}
+    where = f" at {LLM_BASE_URL}" if LLM_BASE_URL else ""
+    return {"ok": True, "detail": f"{LLM_PROVIDER} provider configured{where}."}
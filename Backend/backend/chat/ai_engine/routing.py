@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+
+from .scheduler import LLMOverloaded
+
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL = os.getenv("LLM_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+LLM_CHAT_MODEL = os.getenv("LLM_CHAT_MODEL") or LLM_MODEL
+# Unset by default: every request then uses its route's configured model and nothing is hedged.
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL") or None
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "False").lower() == "true"
+# With LLM_FAST_MODEL set, chat prompts whose non-system messages fit this many tokens use it.
+LLM_SMALL_INPUT_TOKENS = int(os.getenv("LLM_SMALL_INPUT_TOKENS", "32"))
+
+# Per request class: model tiers by input size (first whose limit fits; None = no limit), the model
+# to hedge with once the primary has run for hedge_after_ms, and the latency SLO it is judged by.
+# LLM_ROUTES (JSON) overrides any of these per route, e.g. {"chat": {"hedge_after_ms": 2000}}.
+ROUTES = {
+    "chat": {
+        "tiers": ([[LLM_SMALL_INPUT_TOKENS, LLM_FAST_MODEL]] if LLM_FAST_MODEL else []) + [[None, LLM_CHAT_MODEL]],
+        "hedge_model": LLM_FAST_MODEL,
+        "hedge_after_ms": 3000,
+        "slo_ms": 5000,
+    },
+    "report_analysis": {
+        "tiers": [[None, os.getenv("LLM_REPORT_MODEL") or LLM_MODEL]],
+        "hedge_model": LLM_FAST_MODEL,
+        "hedge_after_ms": 12000,
+        "slo_ms": 20000,
+    },
+    "health_probe": {
+        # Probes the model chat answers with unless told otherwise.
+        "tiers": [[None, os.getenv("LLM_PROBE_MODEL") or LLM_CHAT_MODEL]],
+        "hedge_model": None,
+        "hedge_after_ms": None,
+        "slo_ms": 3000,
+    },
+}
+
+
+def _route_overrides(raw):
+    try:
+        overrides = json.loads(raw or "{}")
+        if not isinstance(overrides, dict) or not all(isinstance(value, dict) for value in overrides.values()):
+            raise ValueError("expected an object of route objects")
+    except ValueError as exc:
+        logger.error("Ignoring invalid LLM_ROUTES (%s); using the built-in routes.", exc)
+        return {}
+    return overrides
+
+
+for _name, _overrides in _route_overrides(os.getenv("LLM_ROUTES")).items():
+    ROUTES[_name] = {**ROUTES.get(_name, ROUTES["chat"]), **_overrides}
+
+
+def estimate_tokens(messages):
+    # About four characters per token; the system prompt is the same for every request of a class.
+    return sum(len(str(m.get("content") or "")) for m in messages if m.get("role") != "system") // 4
+
+
+def route_for(purpose, messages):
+    """(route name, config, model) for a request; unknown purposes use the chat route's large tier."""
+    name = purpose if purpose in ROUTES else "chat"
+    config = ROUTES[name]
+    if purpose not in ROUTES:
+        return name, {**config, "hedge_model": None}, config["tiers"][-1][1]
+    size = estimate_tokens(messages)
+    model = next((model for limit, model in config["tiers"] if limit is None or size <= limit), config["tiers"][-1][1])
+    return name, config, model
+
+
+class Race:
+    """Shared by the attempts of one request; the first successful attempt to claim it wins."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.winner = None
+
+    def claim(self, attempt):
+        with self._lock:
+            if self.winner is None:
+                self.winner = attempt
+                return True
+            return False
+
+
+class Router:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _route_stats(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {
+                "requests": 0,
+                "models": Counter(),
+                "hedged": 0,
+                "fallbacks": 0,
+                "hedge_skipped": 0,
+                "wins": Counter(),
+                "slo_breaches": 0,
+                "latency_ms": deque(maxlen=500),
+            }
+        return stats
+
+    def run(self, name, config, model, attempt):
+        """Run attempt(model, kind, wait=..., race=..., on_admitted=...) and hedge it per the route's config.
+
+        The hedge starts hedge_after_ms after the primary got a scheduler slot, or at once when the
+        primary fails; it never queues for a slot. The loser keeps running in the background and
+        records its own ledger row.
+        """
+        started = time.monotonic()
+        race = Race()
+        hedged = fallback = skipped = False
+        try:
+            if not (LLM_HEDGING_ENABLED and config.get("hedge_model") and config.get("hedge_after_ms") is not None):
+                return attempt(model, "primary", wait=True, race=race, on_admitted=None)
+
+            results = queue.Queue()
+            admitted = threading.Event()
+
+            def run_attempt(kind, attempt_model, wait):
+                try:
+                    on_admitted = admitted.set if kind == "primary" else None
+                    results.put((kind, attempt(attempt_model, kind, wait=wait, race=race, on_admitted=on_admitted), None))
+                except BaseException as exc:
+                    results.put((kind, None, exc))
+                finally:
+                    if kind == "primary":
+                        admitted.set()
+
+            def launch_hedge():
+                threading.Thread(target=run_attempt, args=("hedge", config["hedge_model"], False), daemon=True).start()
+
+            threading.Thread(target=run_attempt, args=("primary", model, True), daemon=True).start()
+            admitted.wait()
+            hedge_at = time.monotonic() + config["hedge_after_ms"] / 1000
+            pending, errors = 1, {}
+            while True:
+                timeout = None if hedged else max(hedge_at - time.monotonic(), 0)
+                try:
+                    kind, result, error = results.get(timeout=timeout)
+                except queue.Empty:
+                    launch_hedge()
+                    hedged, pending = True, pending + 1
+                    continue
+                pending -= 1
+                if error is None and race.winner == kind:
+                    return result
+                if error is not None:
+                    errors[kind] = error
+                    if kind == "hedge" and isinstance(error, LLMOverloaded):
+                        skipped = True
+                    elif kind == "primary" and not hedged and not isinstance(error, LLMOverloaded):
+                        launch_hedge()
+                        hedged = fallback = True
+                        pending += 1
+                        continue
+                if pending == 0:
+                    raise errors.get("primary") or errors["hedge"]
+        finally:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            with self._lock:
+                stats = self._route_stats(name)
+                stats["requests"] += 1
+                stats["models"][model] += 1
+                stats["hedged"] += int(hedged and not skipped)
+                stats["fallbacks"] += int(fallback)
+                stats["hedge_skipped"] += int(skipped)
+                if race.winner:
+                    stats["wins"][race.winner] += 1
+                if config.get("slo_ms") and elapsed_ms > config["slo_ms"]:
+                    stats["slo_breaches"] += 1
+                stats["latency_ms"].append(elapsed_ms)
+
+    def stats(self):
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                latencies = sorted(stats["latency_ms"])
+                config = ROUTES.get(name, {})
+                report[name] = {
+                    "requests": stats["requests"],
+                    "models": dict(stats["models"]),
+                    "hedged": stats["hedged"],
+                    "fallbacks": stats["fallbacks"],
+                    "hedge_skipped": stats["hedge_skipped"],
+                    "primary_wins": stats["wins"]["primary"],
+                    "hedge_wins": stats["wins"]["hedge"],
+                    "slo_ms": config.get("slo_ms"),
+                    "slo_breaches": stats["slo_breaches"],
+                    "latency_ms": {
+                        "p50": latencies[len(latencies) // 2] if latencies else None,
+                        "p95": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] if latencies else None,
+                    },
+                }
+            return report
+
+
+router = Router()
@@ -0,0 +1,176 @@
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+from ..metrics import observe
+
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+# Slots only interactive chat may use, so report batches cannot starve it.
+LLM_INTERACTIVE_RESERVED = int(os.getenv("LLM_INTERACTIVE_RESERVED", "1"))
+# Optional cap shared by every worker through the cache (needs Redis/Memcached/DB cache); 0 disables it.
+LLM_GLOBAL_MAX_IN_FLIGHT = int(os.getenv("LLM_GLOBAL_MAX_IN_FLIGHT", "0"))
+LLM_GLOBAL_SLOT_LEASE_SECONDS = int(os.getenv("LLM_GLOBAL_SLOT_LEASE_SECONDS", "120"))
+
+PRIORITIES = {"interactive": 0, "batch": 1, "probe": 2}
+GLOBAL_SLOT_PREFIX = "chat:llm-slot"
+GLOBAL_POLL_SECONDS = 0.05
+
+
+class LLMOverloaded(Exception):
+    def __init__(self, retry_after, reason="LLM capacity is saturated."):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """Admission control for provider calls: priority queue, in-flight cap and load shedding."""
+
+    def __init__(
+        self,
+        *,
+        max_in_flight=LLM_MAX_IN_FLIGHT,
+        max_queue=LLM_MAX_QUEUE,
+        queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+        interactive_reserved=LLM_INTERACTIVE_RESERVED,
+        global_max_in_flight=LLM_GLOBAL_MAX_IN_FLIGHT,
+    ):
+        self.max_in_flight = max(max_in_flight, 1)
+        self.max_queue = max(max_queue, 0)
+        self.queue_timeout = queue_timeout
+        self.interactive_reserved = min(max(interactive_reserved, 0), self.max_in_flight - 1)
+        self.global_max_in_flight = global_max_in_flight
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._shed = {name: 0 for name in PRIORITIES}
+        self._admitted = {name: 0 for name in PRIORITIES}
+        self._wait_ms = deque(maxlen=500)
+        self._service_ms = deque(maxlen=100)
+
+    def _limit_for(self, priority):
+        return self.max_in_flight if priority == "interactive" else self.max_in_flight - self.interactive_reserved
+
+    def _retry_after(self):
+        service = (sum(self._service_ms) / len(self._service_ms) / 1000) if self._service_ms else 1.0
+        backlog = len(self._waiting) + 1
+        return max(1, math.ceil(service * backlog / self.max_in_flight))
+
+    def _shed_now(self, priority, reason):
+        self._shed[priority] += 1
+        return LLMOverloaded(self._retry_after(), reason)
+
+    def _acquire_local(self, priority, wait=True):
+        rank = PRIORITIES[priority]
+        with self._cond:
+            if not self._waiting and self._in_flight < self._limit_for(priority):
+                self._in_flight += 1
+                return 0.0
+            if not wait:
+                # Opportunistic callers (hedges) never queue and are not counted as shed.
+                raise LLMOverloaded(self._retry_after(), "No free LLM slot.")
+            if len(self._waiting) >= self.max_queue:
+                raise self._shed_now(priority, "LLM queue is full.")
+
+            entry = (rank, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            started = time.monotonic()
+            deadline = started + self.queue_timeout
+            try:
+                while self._waiting[0] != entry or self._in_flight >= self._limit_for(priority):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._shed_now(priority, "Timed out waiting for LLM capacity.")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            self._in_flight += 1
+            return time.monotonic() - started
+
+    def _release_local(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _acquire_global(self, priority, deadline):
+        # Each slot is a cache key with a lease, so a crashed worker's slot frees itself.
+        token = uuid.uuid4().hex
+        while True:
+            for index in range(self.global_max_in_flight):
+                key = f"{GLOBAL_SLOT_PREFIX}:{index}"
+                if cache.add(key, token, LLM_GLOBAL_SLOT_LEASE_SECONDS):
+                    return key, token
+            if time.monotonic() >= deadline:
+                with self._cond:
+                    raise self._shed_now(priority, "Timed out waiting for a shared LLM slot.")
+            time.sleep(GLOBAL_POLL_SECONDS)
+
+    def _release_global(self, key, token):
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    @contextmanager
+    def slot(self, priority="interactive", wait=True):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown LLM priority: {priority}")
+        started = time.monotonic()
+        self._acquire_local(priority, wait)
+        global_slot = None
+        try:
+            if self.global_max_in_flight > 0:
+                global_slot = self._acquire_global(priority, started + (self.queue_timeout if wait else 0))
+        except BaseException:
+            self._release_local()
+            raise
+
+        admitted = time.monotonic()
+        observe("llm_queue_wait_seconds", admitted - started, priority=priority)
+        with self._cond:
+            self._admitted[priority] += 1
+            self._wait_ms.append((admitted - started) * 1000)
+        try:
+            yield
+        finally:
+            if global_slot is not None:
+                self._release_global(*global_slot)
+            with self._cond:
+                self._service_ms.append((time.monotonic() - admitted) * 1000)
+            self._release_local()
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._wait_ms)
+            queued = {name: 0 for name in PRIORITIES}
+            names = {rank: name for name, rank in PRIORITIES.items()}
+            for rank, _ in self._waiting:
+                queued[names[rank]] += 1
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": len(self._waiting),
+                "max_queue": self.max_queue,
+                "queued": queued,
+                "admitted": dict(self._admitted),
+                "shed": dict(self._shed),
+                "wait_ms": {
+                    "p50": waits[len(waits) // 2] if waits else None,
+                    "p95": waits[min(int(len(waits) * 0.95), len(waits) - 1)] if waits else None,
+                    "max": waits[-1] if waits else None,
+                },
+            }
+
+
+scheduler = LLMScheduler()
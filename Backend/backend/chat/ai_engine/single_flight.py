@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+# Also coalesce across workers through a cache lock plus a short-lived shared result.
+LLM_SINGLE_FLIGHT_SHARED = os.getenv("LLM_SINGLE_FLIGHT_SHARED", "False").lower() == "true"
+LLM_SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("LLM_SINGLE_FLIGHT_WAIT_SECONDS", "60"))
+LLM_SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("LLM_SINGLE_FLIGHT_RESULT_TTL", "10"))
+FLIGHT_PREFIX = "chat:llm-flight"
+SHARED_POLL_SECONDS = 0.05
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def flight_key(model, messages, params):
+    payload = json.dumps(_normalize({"model": model, "messages": messages, "params": params}), sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Run one upstream call per key at a time and hand its result to every concurrent caller."""
+
+    def __init__(self, *, shared=LLM_SINGLE_FLIGHT_SHARED, wait_seconds=LLM_SINGLE_FLIGHT_WAIT_SECONDS):
+        self.shared = shared
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "coalesced_local": 0, "coalesced_shared": 0, "shared_fallbacks": 0}
+
+    def _bump(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+                self._stats["coalesced_local"] += 1
+
+        if not leader:
+            if not call.done.wait(self.wait_seconds):
+                raise TimeoutError("Timed out waiting for a coalesced LLM call.")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fn)
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def _lead(self, key, fn):
+        if not self.shared:
+            self._bump("leaders")
+            return fn()
+
+        lock_key, result_key = f"{FLIGHT_PREFIX}:lock:{key}", f"{FLIGHT_PREFIX}:result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_seconds
+        while not cache.add(lock_key, token, int(self.wait_seconds) + 1):
+            # Another worker is running this prompt; take its result once published.
+            cached = cache.get(result_key)
+            if cached is not None:
+                self._bump("coalesced_shared")
+                return cached
+            if time.monotonic() >= deadline:
+                self._bump("shared_fallbacks")
+                self._bump("leaders")
+                return fn()
+            time.sleep(SHARED_POLL_SECONDS)
+
+        try:
+            cached = cache.get(result_key)
+            if cached is not None:
+                self._bump("coalesced_shared")
+                return cached
+            self._bump("leaders")
+            result = fn()
+            cache.set(result_key, result, LLM_SINGLE_FLIGHT_RESULT_TTL)
+            return result
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls), "shared": self.shared}
+
+
+single_flight = SingleFlight()
@@ -1,11 +1,23 @@
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework.exceptions import Throttled
 from rest_framework.response import Response
+from rest_framework.views import exception_handler
+
+
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
 
 
-def api_success(*, data=None, message="OK", status=200):
+def api_success(*, data=None, message="OK", status=200, etag=None):
     payload = {"ok": True, "message": message}
     if data is not None:
         payload["data"] = data
-    return Response(payload, status=status)
+    response = Response(payload, status=status)
+    if etag:
+        response["ETag"] = etag
+        response["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+    return response
 
 
 def api_error(*, message="Request failed", errors=None, status=400, code=None):
@@ -15,3 +27,33 @@ def api_error(*, message="Request failed", errors=None, status=400, code=None):
     if errors:
         payload["errors"] = errors
     return Response(payload, status=status)
+
+
+def build_etag(*parts):
+    raw = "|".join(str(part) for part in parts)
+    return '"%s"' % hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def not_modified(request, etag):
+    """Return a 304 response when the request's If-None-Match already matches etag."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return None
+    candidates = {tag.removeprefix("W/") for tag in parse_etags(header)}
+    if "*" not in candidates and etag not in candidates:
+        return None
+    response = Response(status=304)
+    response["ETag"] = etag
+    response["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+    return response
+
+
+def api_exception_handler(exc, context):
+    response = exception_handler(exc, context)
+    if isinstance(exc, Throttled) and response is not None:
+        # Keep the api_error envelope (the frontend reads "message") and DRF's Retry-After header.
+        throttled = api_error(message="Too many requests. Please slow down.", status=429, code="RATE_LIMITED")
+        if "Retry-After" in response:
+            throttled["Retry-After"] = response["Retry-After"]
+        return throttled
+    return response
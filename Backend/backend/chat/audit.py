@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+
+from django.utils import timezone
+
+from .buffered_writer import BufferedModelWriter
+from .models import AdminAuditLog
+
+
+AUDIT_LOG_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", "50"))
+AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", "2"))
+AUDIT_LOG_MAX_BUFFER = int(os.getenv("AUDIT_LOG_MAX_BUFFER", "5000"))
+AUDIT_LOG_FALLBACK_PATH = Path(
+    os.getenv("AUDIT_LOG_FALLBACK_PATH", Path(__file__).resolve().parent / "data" / "audit_log_fallback.jsonl")
+)
+
+audit_log_writer = BufferedModelWriter(
+    AdminAuditLog,
+    batch_size=AUDIT_LOG_BATCH_SIZE,
+    flush_interval=AUDIT_LOG_FLUSH_INTERVAL,
+    max_buffer=AUDIT_LOG_MAX_BUFFER,
+    fallback_path=AUDIT_LOG_FALLBACK_PATH,
+)
+
+
+def log_admin_action(actor, action, entity_type="", entity_id="", details=None):
+    audit_log_writer.add(
+        actor_id=actor.id if getattr(actor, "is_authenticated", False) else None,
+        action=action,
+        entity_type=entity_type,
+        entity_id=str(entity_id or ""),
+        details=details or {},
+        created_at=timezone.now(),
+    )
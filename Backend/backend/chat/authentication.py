@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+TOKEN_AUTH_CACHE_TIMEOUT = int(os.getenv("TOKEN_AUTH_CACHE_TIMEOUT", "60"))
+# Per-worker copies are not reachable by invalidation from other workers, so keep them short-lived.
+TOKEN_AUTH_LOCAL_TIMEOUT = float(os.getenv("TOKEN_AUTH_LOCAL_TIMEOUT", "5"))
+TOKEN_AUTH_LOCAL_MAX_ENTRIES = int(os.getenv("TOKEN_AUTH_LOCAL_MAX_ENTRIES", "2048"))
+TOKEN_TTL_SECONDS = int(os.getenv("TOKEN_TTL_SECONDS", "0"))
+TOKEN_CACHE_PREFIX = "chat:auth-token:v2"
+# Only what authentication and permission checks read; never the password hash or profile columns.
+CACHED_USER_FIELDS = ("id", "is_active", "is_staff", "is_superuser")
+
+_local_entries = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _cache_key(key):
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f"{TOKEN_CACHE_PREFIX}:{digest}"
+
+
+def _local_get(cache_key):
+    with _local_lock:
+        entry = _local_entries.get(cache_key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.monotonic():
+            del _local_entries[cache_key]
+            return None
+        _local_entries.move_to_end(cache_key)
+        return payload
+
+
+def _local_set(cache_key, payload):
+    if TOKEN_AUTH_LOCAL_TIMEOUT <= 0:
+        return
+    with _local_lock:
+        _local_entries[cache_key] = (time.monotonic() + TOKEN_AUTH_LOCAL_TIMEOUT, payload)
+        _local_entries.move_to_end(cache_key)
+        while len(_local_entries) > TOKEN_AUTH_LOCAL_MAX_ENTRIES:
+            _local_entries.popitem(last=False)
+
+
+def is_token_expired(token):
+    if TOKEN_TTL_SECONDS <= 0 or token.created is None:
+        return False
+    return token.created + timedelta(seconds=TOKEN_TTL_SECONDS) <= timezone.now()
+
+
+def invalidate_token(key):
+    cache_key = _cache_key(key)
+    with _local_lock:
+        _local_entries.pop(cache_key, None)
+    cache.delete(cache_key)
+
+
+def invalidate_user_tokens(user_id):
+    for key in Token.objects.filter(user_id=user_id).values_list("key", flat=True):
+        invalidate_token(key)
+
+
+def issue_token(user):
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and is_token_expired(token):
+        invalidate_token(token.key)
+        token.delete()
+        token = Token.objects.create(user=user)
+    return token
+
+
+def _loaded_instance(model, values):
+    """A saved instance with only these fields loaded; the others are fetched by primary key on first read."""
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(None, names, [values[name] for name in names])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = _cache_key(key)
+        payload = _local_get(cache_key)
+        if payload is None:
+            payload = cache.get(cache_key)
+            if payload is None:
+                try:
+                    token = Token.objects.select_related("user").get(key=key)
+                except Token.DoesNotExist:
+                    raise exceptions.AuthenticationFailed("Invalid token.")
+                payload = (tuple(getattr(token.user, name) for name in CACHED_USER_FIELDS), token.created)
+                cache.set(cache_key, payload, TOKEN_AUTH_CACHE_TIMEOUT)
+            _local_set(cache_key, payload)
+
+        # Built per request from plain values, so requests never share a User instance.
+        user_values, created = payload
+        user = _loaded_instance(get_user_model(), dict(zip(CACHED_USER_FIELDS, user_values)))
+        token = _loaded_instance(Token, {"key": key, "user_id": user.id, "created": created})
+        token.user = user
+        if is_token_expired(token):
+            invalidate_token(key)
+            Token.objects.filter(key=key).delete()
+            raise exceptions.AuthenticationFailed("Token has expired.")
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        return (user, token)
@@ -0,0 +1,136 @@
+import atexit
+import json
+import threading
+import time
+from pathlib import Path
+
+from django.db import close_old_connections, transaction
+
+
+class BufferedModelWriter:
+    """Collects model rows in memory and writes them with bulk_create.
+
+    Rows are flushed when the buffer reaches ``batch_size``, every ``flush_interval`` seconds from a
+    daemon thread, on explicit ``flush()`` and at interpreter shutdown. ``on_flush(batch)`` runs in the
+    same transaction as the insert, so derived rows never drift from it. If either fails, the batch is
+    appended to ``fallback_path`` as JSON lines instead of being lost; ``replay_fallback()`` writes it back.
+    """
+
+    def __init__(self, model, *, batch_size=50, flush_interval=2.0, max_buffer=5000, fallback_path=None, on_flush=None):
+        self.model = model
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.max_buffer = max(max_buffer, self.batch_size)
+        self.fallback_path = Path(fallback_path) if fallback_path else None
+        self.on_flush = on_flush
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {"flushed": 0, "dropped": 0, "fallback": 0, "failed_flushes": 0, "last_flush_at": None}
+        atexit.register(self.flush)
+
+    def add(self, **fields):
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self._stats["dropped"] += 1
+                return False
+            self._buffer.append(fields)
+            full = len(self._buffer) >= self.batch_size
+        if self.flush_interval and self.flush_interval > 0:
+            self._ensure_thread()
+            if full:
+                self._wake.set()
+        elif full:
+            self.flush()
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"{self.model.__name__}-writer",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except Exception:
+                self._stats["failed_flushes"] += 1
+                self._write_fallback(batch)
+                return 0
+            self._stats["flushed"] += len(batch)
+            self._stats["last_flush_at"] = time.time()
+            return len(batch)
+
+    def _write(self, batch):
+        with transaction.atomic():
+            self.model.objects.bulk_create([self.model(**fields) for fields in batch], batch_size=self.batch_size)
+            if self.on_flush is not None:
+                self.on_flush(batch)
+
+    def replay_fallback(self):
+        """Write the rows saved in fallback_path to the database; returns how many were written.
+
+        Raises (and keeps the rows in fallback_path) when the database write still fails.
+        """
+        if self.fallback_path is None:
+            return 0
+        with self._flush_lock:
+            # Move the file aside first so rows appended meanwhile are kept for the next replay.
+            replaying = self.fallback_path.with_name(self.fallback_path.name + ".replay")
+            try:
+                self.fallback_path.replace(replaying)
+            except FileNotFoundError:
+                return 0
+            lines = [line for line in replaying.read_text(encoding="utf-8").splitlines() if line.strip()]
+            try:
+                self._write([self._from_json(json.loads(line)) for line in lines])
+            except Exception:
+                with self.fallback_path.open("a", encoding="utf-8") as f:
+                    f.writelines(line + "\n" for line in lines)
+                raise
+            finally:
+                replaying.unlink()
+            return len(lines)
+
+    def _from_json(self, fields):
+        # Undo json.dumps(default=str): datetimes and the like come back as strings.
+        return {name: self.model._meta.get_field(name).to_python(value) for name, value in fields.items()}
+
+    def _write_fallback(self, batch):
+        if self.fallback_path is None:
+            self._stats["dropped"] += len(batch)
+            return
+        try:
+            self.fallback_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.fallback_path.open("a", encoding="utf-8") as f:
+                for fields in batch:
+                    f.write(json.dumps(fields, default=str) + "\n")
+            self._stats["fallback"] += len(batch)
+        except OSError:
+            self._stats["dropped"] += len(batch)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._buffer)
+        return {**self._stats, "pending": pending}
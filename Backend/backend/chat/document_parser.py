@@ -1,11 +1,14 @@
 import io
 import json
 import os
+import time
 import zipfile
 import xml.etree.ElementTree as ET
 from datetime import datetime
 from pathlib import Path
 
+from .metrics import record_span
+
 
 MAX_ATTACHMENTS = int(os.getenv("MAX_ATTACHMENTS", "4"))
 MAX_ATTACHMENT_SIZE_MB = int(os.getenv("MAX_ATTACHMENT_SIZE_MB", "8"))
@@ -131,6 +134,7 @@ def parse_uploaded_attachments(files):
 
         text = ""
         extractor_used = ""
+        started = time.perf_counter()
         try:
             if ext in {".txt", ".csv"}:
                 text = _extract_text_file(content)
@@ -158,6 +162,7 @@ def parse_uploaded_attachments(files):
             warnings.append(f"Could not process '{name}': {exc.__class__.__name__}.")
             text = ""
             extractor_used = "error"
+        record_span(f"extract_{extractor_used or 'unknown'}", time.perf_counter() - started)
 
         used_files.append(name)
         normalized_text = _truncate(text) if text.strip() else ""
@@ -0,0 +1,152 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .api_utils import build_etag
+
+# "" streams from Django; "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd) hand the
+# file to the web server after the ownership check, so workers do not copy bytes.
+REPORT_DOWNLOAD_SENDFILE = os.getenv("REPORT_DOWNLOAD_SENDFILE", "").strip().lower()
+# nginx `internal` location aliased to MEDIA_ROOT, e.g. location /protected-media/ { internal; alias /app/media/; }
+REPORT_DOWNLOAD_ACCEL_PREFIX = os.getenv("REPORT_DOWNLOAD_ACCEL_PREFIX", "/protected-media/")
+REPORT_DOWNLOAD_CACHE_SECONDS = int(os.getenv("REPORT_DOWNLOAD_CACHE_SECONDS", "3600"))
+STREAM_BLOCK_SIZE = 64 * 1024
+# Anything else (HTML, SVG, ...) is always sent as an attachment so it cannot run in our origin.
+INLINE_CONTENT_TYPES = {"application/pdf", "image/png", "image/jpeg", "image/webp", "image/gif", "text/plain"}
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """(first, last) byte offsets for a single-range header, or None to send the whole file.
+
+    Multi-range and malformed headers are ignored, as RFC 9110 allows; ranges past the end raise
+    RangeNotSatisfiable.
+    """
+    match = RANGE_RE.match((header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise RangeNotSatisfiable
+    if last < first:
+        return None
+    return first, last
+
+
+class RangeFile:
+    """File-like view of [first, last] of an open file, for FileResponse."""
+
+    def __init__(self, file, first, last):
+        self.file = file
+        self.file.seek(first)
+        self.remaining = last - first + 1
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def upload_etag(upload):
+    if upload.blob_id:
+        # Blob-backed files are content-addressed, so the hash is a strong validator.
+        return f'"{upload.blob.sha256}"'
+    return build_etag("upload", upload.id, upload.file.name, upload.size)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_upload(request, upload, as_attachment=False):
+    """Response for one stored upload; raises FileNotFoundError when the file is gone from storage."""
+    content_type = upload.content_type or mimetypes.guess_type(upload.original_name)[0] or "application/octet-stream"
+    return serve_file(
+        request,
+        upload.file.storage,
+        upload.file.name,
+        etag=upload_etag(upload),
+        last_modified=int(upload.uploaded_at.timestamp()),
+        content_type=content_type,
+        filename=upload.original_name,
+        as_attachment=as_attachment,
+    )
+
+
+def serve_file(request, storage, name, *, etag, last_modified, content_type, filename, as_attachment=False):
+    """304/412, 416, 206, 200 or a web-server hand-off for a file in storage."""
+    size = storage.size(name)
+    if content_type not in INLINE_CONTENT_TYPES:
+        as_attachment = True
+
+    def finish(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = f"private, max-age={REPORT_DOWNLOAD_CACHE_SECONDS}"
+        response["Accept-Ranges"] = "bytes"
+        response["X-Content-Type-Options"] = "nosniff"
+        return response
+
+    cached = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if cached is not None:
+        return finish(cached)
+
+    disposition = content_disposition_header(as_attachment, filename)
+    if REPORT_DOWNLOAD_SENDFILE in {"x-accel-redirect", "x-sendfile"}:
+        # The web server applies Range itself; it only needs to know which file.
+        response = HttpResponse(content_type=content_type)
+        if REPORT_DOWNLOAD_SENDFILE == "x-accel-redirect":
+            response["X-Accel-Redirect"] = REPORT_DOWNLOAD_ACCEL_PREFIX.rstrip("/") + "/" + quote(name)
+        else:
+            response["X-Sendfile"] = storage.path(name)
+        response["Content-Disposition"] = disposition
+        return finish(response)
+
+    byte_range = None
+    if request.method in {"GET", "HEAD"} and _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return finish(response)
+
+    file = storage.open(name, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response["Content-Length"] = str(size)
+    else:
+        first, last = byte_range
+        response = FileResponse(RangeFile(file, first, last), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {first}-{last}/{size}"
+        response["Content-Length"] = str(last - first + 1)
+    # Read lazily by the streaming iterator (and by wsgi.file_wrapper), so setting it here is enough.
+    response.block_size = STREAM_BLOCK_SIZE
+    response["Content-Disposition"] = disposition
+    return finish(response)
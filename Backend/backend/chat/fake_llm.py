@@ -0,0 +1,167 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+FILLER_WORDS = ("rest", "fluids", "monitor", "symptoms", "consult", "doctor", "if", "they", "persist", "mild", "care")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/openai/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "local"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found.", "type": "not_found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body.", "type": "invalid_request_error"}})
+            return
+        if self.path.rstrip("/") != COMPLETIONS_PATH:
+            self._send_json(404, {"error": {"message": "Not found.", "type": "not_found"}})
+            return
+        if payload.get("stream"):
+            self._send_json(400, {"error": {"message": "Streaming is not supported.", "type": "invalid_request_error"}})
+            return
+        status, body, headers = self.server.fake.respond(payload)
+        self._send_json(status, body, headers)
+
+
+class FakeLLMServer:
+    """Local OpenAI/Groq-compatible chat completions endpoint with configurable latency and failures.
+
+    Latency is `latency_ms` (+/- `jitter_ms`) to first token plus `completion_tokens / tokens_per_second`.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        *,
+        latency_ms=300,
+        jitter_ms=100,
+        tokens_per_second=250,
+        completion_tokens=150,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        slow_rate=0.0,
+        slow_latency_ms=5000,
+        seed=None,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        # Tail latency: this fraction of successful calls takes slow_latency_ms extra.
+        self.slow_rate = slow_rate
+        self.slow_latency_ms = slow_latency_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "in_flight": 0, "max_in_flight": 0}
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _roll(self):
+        with self._lock:
+            return self._random.random(), self._random.uniform(-1, 1), self._random.random()
+
+    def respond(self, payload):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["in_flight"] += 1
+            self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._stats["in_flight"])
+        try:
+            roll, jitter, slow_roll = self._roll()
+            max_tokens = payload.get("max_completion_tokens") or payload.get("max_tokens") or self.completion_tokens
+            completion_tokens = max(min(self.completion_tokens, int(max_tokens)), 1)
+            delay = max(self.latency_ms + jitter * self.jitter_ms, 0) / 1000
+            if roll < self.rate_limit_rate:
+                time.sleep(delay / 4)
+                self._bump("rate_limited")
+                return 429, {"error": {"message": "Rate limit reached.", "type": "rate_limit_exceeded"}}, {"Retry-After": "1"}
+            if roll < self.rate_limit_rate + self.error_rate:
+                time.sleep(delay)
+                self._bump("errors")
+                return 500, {"error": {"message": "Injected upstream failure.", "type": "server_error"}}, None
+
+            if slow_roll < self.slow_rate:
+                delay += self.slow_latency_ms / 1000
+            time.sleep(delay + completion_tokens / max(self.tokens_per_second, 1))
+            prompt_tokens = sum(len(str(message.get("content") or "").split()) for message in payload.get("messages") or [])
+            words = [FILLER_WORDS[index % len(FILLER_WORDS)] for index in range(completion_tokens)]
+            self._bump("ok")
+            return 200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model") or "fake",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": " ".join(words).capitalize() + "."},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }, None
+        finally:
+            with self._lock:
+                self._stats["in_flight"] -= 1
+
+    def _bump(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
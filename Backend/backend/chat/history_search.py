@@ -0,0 +1,219 @@
+import math
+import os
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import ChatMessage, HistorySearchPosting, MedicalReportAnalysis
+from .text_utils import MAX_TOKEN_LENGTH, TOKEN_RE, index_tokens, normalize_text
+
+# "auto" uses PostgreSQL full-text search (GIN indexes from migration 0021) and the posting table elsewhere.
+HISTORY_SEARCH_BACKEND = os.getenv("HISTORY_SEARCH_BACKEND", "auto").strip().lower()
+HISTORY_SEARCH_MAX_RESULTS = 50
+HISTORY_SEARCH_SNIPPET_CHARS = int(os.getenv("HISTORY_SEARCH_SNIPPET_CHARS", "160"))
+SEARCH_KINDS = ("message", "report")
+# Must stay identical to the indexed expressions in migration 0021, or PostgreSQL will not use them.
+MESSAGE_VECTOR = "to_tsvector('english', \"chat_chatmessage\".\"message\")"
+REPORT_VECTOR = (
+    "to_tsvector('english', \"chat_medicalreportanalysis\".\"extracted_text\" || ' ' || "
+    "\"chat_medicalreportanalysis\".\"analysis\")"
+)
+# plainto_tsquery ANDs every word and has no operators, matching what the posting table does.
+TS_QUERY = "plainto_tsquery('english', %s)"
+BM25_K1 = 1.2
+
+
+def active_backend():
+    if HISTORY_SEARCH_BACKEND in {"postgres", "index"}:
+        return HISTORY_SEARCH_BACKEND
+    return "postgres" if connection.vendor == "postgresql" else "index"
+
+
+def _postings(user_id, text, **target):
+    return [
+        HistorySearchPosting(user_id=user_id, token=token, frequency=count, **target)
+        for token, count in Counter(index_tokens(text)).items()
+    ]
+
+
+def index_messages(messages):
+    """Add postings for new chat messages (messages are never edited, so there is nothing to replace)."""
+    rows = []
+    for message in messages:
+        user_id = message.session.user_id
+        if user_id:
+            rows.extend(_postings(user_id, message.message, message_id=message.id))
+    HistorySearchPosting.objects.bulk_create(rows, batch_size=5000)
+
+
+def index_reports(reports):
+    reports = list(reports)
+    rows = [
+        posting
+        for report in reports
+        for posting in _postings(report.user_id, f"{report.extracted_text}\n{report.analysis}", report_id=report.id)
+    ]
+    with transaction.atomic():
+        HistorySearchPosting.objects.filter(report__in=reports).delete()
+        HistorySearchPosting.objects.bulk_create(rows, batch_size=5000)
+
+
+def rebuild_index(batch_size=2000):
+    """Re-tokenize every message and report; needed after bulk writes that bypass model signals."""
+    HistorySearchPosting.objects.all().delete()
+    indexed = 0
+    for queryset, index in (
+        (ChatMessage.objects.select_related("session").only("id", "message", "session__user_id"), index_messages),
+        (MedicalReportAnalysis.objects.only("id", "user_id", "extracted_text", "analysis"), index_reports),
+    ):
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).order_by("id")[:batch_size])
+            if not batch:
+                break
+            index(batch)
+            indexed += len(batch)
+            last_id = batch[-1].id
+    return indexed
+
+
+def _user_documents(user, kind):
+    if kind == "message":
+        return ChatMessage.objects.filter(session__user=user)
+    return MedicalReportAnalysis.objects.filter(user=user)
+
+
+def _postgres_matches(user, kind, query, limit):
+    vector = MESSAGE_VECTOR if kind == "message" else REPORT_VECTOR
+    return list(
+        _user_documents(user, kind)
+        .filter(RawSQL(f"{vector} @@ {TS_QUERY}", [query], output_field=BooleanField()))
+        .annotate(search_rank=RawSQL(f"ts_rank_cd({vector}, {TS_QUERY})", [query], output_field=FloatField()))
+        .order_by("-search_rank", "-id")
+        .values_list("id", "search_rank")[:limit]
+    )
+
+
+def _index_matches(user, kind, tokens, limit):
+    """BM25 (without length normalization) over the documents that contain every query token."""
+    field = f"{kind}_id"
+    frequencies = defaultdict(dict)
+    postings = HistorySearchPosting.objects.filter(user=user, token__in=tokens, **{f"{field}__isnull": False})
+    for token, document_id, frequency in postings.values_list("token", field, "frequency"):
+        frequencies[document_id][token] = frequency
+    matched = {document_id: terms for document_id, terms in frequencies.items() if len(terms) == len(tokens)}
+    if not matched:
+        return []
+    total = _user_documents(user, kind).count()
+    document_frequency = Counter(token for terms in frequencies.values() for token in terms)
+    scored = []
+    for document_id, terms in matched.items():
+        score = 0.0
+        for token, frequency in terms.items():
+            df = document_frequency[token]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1)
+        scored.append((document_id, score))
+    scored.sort(key=lambda item: (-item[1], -item[0]))
+    return scored[:limit]
+
+
+def highlight(text, terms, width=HISTORY_SEARCH_SNIPPET_CHARS):
+    """(snippet, [[start, end], ...]) around the first matching word, or None when nothing matches.
+
+    Words match a query term exactly or as a prefix, which also covers most PostgreSQL stems.
+    """
+    text = text or ""
+    # Casefolding ASCII keeps offsets, so the common case skips normalizing word by word.
+    folded = text.casefold() if text.isascii() else None
+    spans, start, end = [], 0, len(text)
+    for match in TOKEN_RE.finditer(text):
+        if spans and match.end() > end:
+            break
+        word = folded[match.start():match.end()] if folded is not None else normalize_text(match.group())
+        if not any(word[:MAX_TOKEN_LENGTH].startswith(term) for term in terms):
+            continue
+        if not spans:
+            start = max(match.start() - width // 3, 0)
+            if start:
+                space = text.find(" ", start, match.start())
+                start = space + 1 if space != -1 else start
+            end = min(start + width, len(text))
+            if end < len(text):
+                space = text.rfind(" ", match.end(), end)
+                end = space if space != -1 else end
+        if match.end() <= end:
+            spans.append((match.start(), match.end()))
+    if not spans:
+        return None
+    prefix = "…" if start else ""
+    snippet = prefix + " ".join(text[start:end].split("\n")) + ("…" if end < len(text) else "")
+    offset = len(prefix) - start
+    return snippet, [[s + offset, e + offset] for s, e in spans]
+
+
+def _message_result(message, score, terms):
+    snippet, highlights = highlight(message.message, terms) or (message.message[:HISTORY_SEARCH_SNIPPET_CHARS], [])
+    return {
+        "type": "message",
+        "id": message.id,
+        "session_id": message.session_id,
+        "session_title": message.session.title or f"Session {message.session_id}",
+        "sender": message.sender,
+        "snippet": snippet,
+        "highlights": highlights,
+        "score": round(score, 4),
+        "created_at": message.created_at.isoformat() if message.created_at else None,
+    }
+
+
+def _report_result(report, score, terms):
+    for field in ("analysis", "extracted_text"):
+        found = highlight(getattr(report, field), terms)
+        if found:
+            break
+    else:
+        field, found = "analysis", ((report.analysis or "")[:HISTORY_SEARCH_SNIPPET_CHARS], [])
+    return {
+        "type": "report",
+        "id": report.id,
+        "title": report.title or f"Report {report.id}",
+        "field": field,
+        "snippet": found[0],
+        "highlights": found[1],
+        "score": round(score, 4),
+        "created_at": report.created_at.isoformat() if report.created_at else None,
+    }
+
+
+def search_history(user, query, kinds=SEARCH_KINDS, limit=20):
+    """The user's messages and reports matching every word of query, best first, with highlighted snippets."""
+    tokens = sorted(set(index_tokens(query)))
+    if not tokens:
+        return []
+    limit = min(max(limit, 1), HISTORY_SEARCH_MAX_RESULTS)
+    backend = active_backend()
+    scored = []
+    for kind in kinds:
+        if backend == "postgres":
+            matches = _postgres_matches(user, kind, query, limit)
+        else:
+            matches = _index_matches(user, kind, tokens, limit)
+        scored.extend((score, kind, document_id) for document_id, score in matches)
+    scored.sort(key=lambda item: -item[0])
+    scored = scored[:limit]
+
+    ids = defaultdict(list)
+    for _, kind, document_id in scored:
+        ids[kind].append(document_id)
+    documents = {}
+    if ids["message"]:
+        for message in ChatMessage.objects.filter(id__in=ids["message"]).select_related("session"):
+            documents["message", message.id] = message
+    if ids["report"]:
+        for report in MedicalReportAnalysis.objects.filter(id__in=ids["report"]).defer("warnings"):
+            documents["report", report.id] = report
+    build = {"message": _message_result, "report": _report_result}
+    return [build[kind](documents[kind, document_id], score, tokens) for score, kind, document_id in scored]
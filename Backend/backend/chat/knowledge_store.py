@@ -0,0 +1,300 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from django.db import transaction
+from django.db.models import F
+
+from .medical_history import record_version
+from .models import MedicalDataState
+
+
+MEDICAL_DATA_PATH = Path(
+    os.getenv("MEDICAL_DATA_PATH", Path(__file__).resolve().parent / "data" / "medical_data.json")
+)
+STATE_PK = 1
+PATCH_OPERATIONS = {"add", "update", "delete"}
+
+
+class MedicalDataConflict(Exception):
+    def __init__(self, current_version):
+        super().__init__(f"Medical data changed (current version {current_version}).")
+        self.current_version = current_version
+
+
+class MedicalDataValidationError(Exception):
+    def __init__(self, errors):
+        super().__init__("Invalid medical data operations.")
+        self.errors = errors
+
+
+def _is_entry_id(value):
+    return isinstance(value, (int, str)) and not isinstance(value, bool) and value != ""
+
+
+def _is_string_list(value, allow_empty=True):
+    if not isinstance(value, list) or (not allow_empty and not value):
+        return False
+    return all(isinstance(item, str) and item.strip() for item in value)
+
+
+def validate_entry(entry):
+    if not isinstance(entry, dict):
+        return {"entry": "Entry must be an object."}
+    errors = {}
+    if not _is_entry_id(entry.get("id")):
+        errors["id"] = "id must be a non-empty string or integer."
+    if not _is_string_list(entry.get("symptoms"), allow_empty=False):
+        errors["symptoms"] = "symptoms must be a non-empty list of strings."
+    if not isinstance(entry.get("possible_diagnosis"), str) or not entry["possible_diagnosis"].strip():
+        errors["possible_diagnosis"] = "possible_diagnosis must be a non-empty string."
+    if not isinstance(entry.get("advice"), str):
+        errors["advice"] = "advice must be a string."
+    if not _is_string_list(entry.get("medications", [])):
+        errors["medications"] = "medications must be a list of strings."
+    return errors
+
+
+def apply_operations(data, operations):
+    """Apply add/update/delete operations keyed by entry id; returns (new_data, changed_ids)."""
+    if not isinstance(operations, list) or not operations:
+        raise MedicalDataValidationError({"operations": "operations must be a non-empty array."})
+
+    result = list(data)
+    positions = {entry.get("id"): index for index, entry in enumerate(result) if isinstance(entry, dict)}
+    changed = set()
+    errors = {}
+
+    for index, operation in enumerate(operations):
+        prefix = f"operations[{index}]"
+        if not isinstance(operation, dict) or operation.get("op") not in PATCH_OPERATIONS:
+            errors[prefix] = "op must be one of add, update, delete."
+            continue
+        op = operation["op"]
+        fields = operation.get("entry")
+        entry_id = operation.get("id")
+        if entry_id is None and op == "add" and isinstance(fields, dict):
+            entry_id = fields.get("id")
+        if not _is_entry_id(entry_id):
+            errors[f"{prefix}.id"] = "id is required."
+            continue
+
+        if op == "delete":
+            if entry_id not in positions:
+                errors[f"{prefix}.id"] = f"No entry with id {entry_id}."
+                continue
+            result[positions.pop(entry_id)] = None
+            changed.add(entry_id)
+            continue
+
+        if not isinstance(fields, dict):
+            errors[f"{prefix}.entry"] = "entry must be an object."
+            continue
+        if "id" in fields and fields["id"] != entry_id:
+            errors[f"{prefix}.entry.id"] = "entry id does not match operation id."
+            continue
+        if op == "add":
+            if entry_id in positions:
+                errors[f"{prefix}.id"] = f"Entry with id {entry_id} already exists."
+                continue
+            candidate = {**fields, "id": entry_id}
+        else:
+            if entry_id not in positions:
+                errors[f"{prefix}.id"] = f"No entry with id {entry_id}."
+                continue
+            candidate = {**result[positions[entry_id]], **fields}
+
+        entry_errors = validate_entry(candidate)
+        if entry_errors:
+            errors.update({f"{prefix}.{field}": message for field, message in entry_errors.items()})
+            continue
+        if op == "add":
+            positions[entry_id] = len(result)
+            result.append(candidate)
+        else:
+            result[positions[entry_id]] = candidate
+        changed.add(entry_id)
+
+    if errors:
+        raise MedicalDataValidationError(errors)
+    return [entry for entry in result if entry is not None], changed
+
+
+def _entry_fragment(entry):
+    # Same text json.dumps(data, indent=2) produces for one list item.
+    return "  " + json.dumps(entry, indent=2).replace("\n", "\n  ")
+
+
+class MedicalKnowledgeStore:
+    """Process-local copy of the medical JSON, reloaded when the DB version moves.
+
+    Each write lands in a version-suffixed file next to ``path`` before its version bump commits, and
+    readers load the file of the version they saw, so a worker never caches uncommitted or rolled-back
+    contents under a committed version. ``path`` itself is refreshed after the commit.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+        self._fragments = {}
+        self._prompt_context = None
+
+    def current_version(self):
+        version = MedicalDataState.objects.filter(pk=STATE_PK).values_list("version", flat=True).first()
+        return version or 0
+
+    def _version_path(self, version):
+        return self.path.with_name(f"{self.path.name}.v{version}")
+
+    def _read_file(self, version=None):
+        """The dataset committed as version; the main file when that version has none (yet or any more)."""
+        paths = [self._version_path(version), self.path] if version else [self.path]
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                if path == self.path:
+                    raise
+                continue
+            return data if isinstance(data, list) else []
+
+    def _install(self, version, data, changed_ids=None):
+        # changed_ids is only trustworthy when this worker holds the version right before the patch.
+        if changed_ids is not None and (self._version is None or self._version + 1 != version):
+            changed_ids = None
+        self._version = version
+        self._data = data
+        self._prompt_context = None
+        if data is None:
+            self._fragments = {}
+            return
+
+        # Keep serialized entries that did not change so the prompt context is rebuilt incrementally.
+        previous = self._fragments
+        fragments = {}
+        for entry in data:
+            key = entry.get("id") if isinstance(entry, dict) else None
+            if not _is_entry_id(key) or key in fragments:
+                fragments = {}
+                break
+            cached = previous.get(key)
+            if cached is not None and (key not in changed_ids if changed_ids is not None else cached[0] == entry):
+                fragments[key] = cached
+            else:
+                fragments[key] = (entry, _entry_fragment(entry))
+        self._fragments = fragments
+
+    def snapshot(self):
+        version = self.current_version()
+        if self._data is None or version != self._version:
+            with self._lock:
+                if self._data is None or version != self._version:
+                    self._install(version, self._read_file(version))
+        return self._version, self._data
+
+    def data(self):
+        return self.snapshot()[1]
+
+    def prompt_context(self):
+        version, data = self.snapshot()
+        with self._lock:
+            context = self._prompt_context
+            if context is None or context[0] != version:
+                if not data:
+                    text = "[]"
+                elif self._version == version and len(self._fragments) == len(data):
+                    text = "[\n" + ",\n".join(fragment for _, fragment in self._fragments.values()) + "\n]"
+                else:
+                    text = json.dumps(data, indent=2)
+                context = (version, text)
+                self._prompt_context = context
+        return context[1]
+
+    def _write_file(self, data, path=None):
+        path = Path(path or self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _publish(self, version, data):
+        """After commit: refresh the main file and drop version files older than this one."""
+        self._write_file(data)
+        prefix = f"{self.path.name}.v"
+        for path in self.path.parent.glob(f"{prefix}*"):
+            suffix = path.name[len(prefix):]
+            if suffix.isdigit() and int(suffix) < version:
+                path.unlink(missing_ok=True)
+
+    def _commit(self, build, *, actor, note, expected_version, record_history):
+        version_path = None
+        try:
+            with transaction.atomic():
+                MedicalDataState.objects.get_or_create(pk=STATE_PK)
+                bumped = MedicalDataState.objects.filter(pk=STATE_PK)
+                if expected_version is not None:
+                    bumped = bumped.filter(version=expected_version)
+                # The UPDATE row lock serializes writers until commit.
+                if not bumped.update(version=F("version") + 1):
+                    raise MedicalDataConflict(self.current_version())
+                new_version = self.current_version()
+
+                try:
+                    current = self._read_file(new_version - 1)
+                except (OSError, ValueError):
+                    current = []
+                data, changed_ids = build(current)
+                if record_history:
+                    record_version(current, actor=actor, note=note)
+
+                version_path = self._version_path(new_version)
+                self._write_file(data, version_path)
+                transaction.on_commit(lambda: self._publish(new_version, data))
+                transaction.on_commit(lambda: self._remember(new_version, data, changed_ids))
+        except Exception:
+            if version_path is not None:
+                # The version bump rolled back, so nobody may read this file.
+                version_path.unlink(missing_ok=True)
+            raise
+        return new_version, data, changed_ids
+
+    def replace(self, data, *, actor=None, note="", expected_version=None, record_history=True):
+        """Atomically swap the dataset; raises MedicalDataConflict if expected_version is stale."""
+        version, _, _ = self._commit(
+            lambda current: (data, None),
+            actor=actor,
+            note=note,
+            expected_version=expected_version,
+            record_history=record_history,
+        )
+        return version
+
+    def patch(self, operations, *, actor=None, note="", expected_version=None):
+        """Apply entry-level operations atomically; returns (version, data, changed_ids)."""
+        return self._commit(
+            lambda current: apply_operations(current, operations),
+            actor=actor,
+            note=note,
+            expected_version=expected_version,
+            record_history=True,
+        )
+
+    def _remember(self, version, data, changed_ids=None):
+        with self._lock:
+            self._install(version, data, changed_ids)
+
+
+medical_store = MedicalKnowledgeStore(MEDICAL_DATA_PATH)
@@ -0,0 +1,183 @@
+import os
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .buffered_writer import BufferedModelWriter
+from .models import LLMCallDailyStat, LLMCallLog
+
+
+LLM_CALL_LOG_BATCH_SIZE = int(os.getenv("LLM_CALL_LOG_BATCH_SIZE", "100"))
+LLM_CALL_LOG_FLUSH_INTERVAL = float(os.getenv("LLM_CALL_LOG_FLUSH_INTERVAL", "5"))
+LLM_CALL_LOG_MAX_BUFFER = int(os.getenv("LLM_CALL_LOG_MAX_BUFFER", "20000"))
+LLM_CALL_LOG_FALLBACK_PATH = Path(
+    os.getenv("LLM_CALL_LOG_FALLBACK_PATH", Path(__file__).resolve().parent / "data" / "llm_call_log_fallback.jsonl")
+)
+# Upper bounds of the rollup latency buckets; slower calls land in the last one.
+LATENCY_BUCKETS_MS = (
+    100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 4000, 5000, 7500, 10000, 15000, 20000, 30000, 60000, 120000,
+)
+USAGE_MAX_DAYS = 90
+
+
+def latency_bucket(latency_ms):
+    return LATENCY_BUCKETS_MS[min(bisect_left(LATENCY_BUCKETS_MS, latency_ms), len(LATENCY_BUCKETS_MS) - 1)]
+
+
+def _bump(key, totals):
+    day, purpose, model, status, attempt, bucket = key
+    lookup = {
+        "day": day, "purpose": purpose, "model": model, "status": status, "attempt": attempt, "latency_bucket_ms": bucket,
+    }
+    changes = {field: F(field) + value for field, value in totals.items()}
+    if LLMCallDailyStat.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            LLMCallDailyStat.objects.create(**lookup, **totals)
+    except IntegrityError:
+        # Another worker created the row first.
+        LLMCallDailyStat.objects.filter(**lookup).update(**changes)
+
+
+def roll_up(batch):
+    grouped = defaultdict(
+        lambda: {"calls": 0, "wins": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_latency_ms": 0}
+    )
+    for row in batch:
+        key = (
+            row["created_at"].date(),
+            row["purpose"],
+            row["model"],
+            row["status"],
+            row["attempt"],
+            latency_bucket(row["latency_ms"]),
+        )
+        totals = grouped[key]
+        totals["calls"] += 1
+        totals["wins"] += int(row["won"])
+        totals["prompt_tokens"] += row["prompt_tokens"]
+        totals["completion_tokens"] += row["completion_tokens"]
+        totals["total_latency_ms"] += row["latency_ms"]
+    for key, totals in grouped.items():
+        _bump(key, totals)
+
+
+llm_call_writer = BufferedModelWriter(
+    LLMCallLog,
+    batch_size=LLM_CALL_LOG_BATCH_SIZE,
+    flush_interval=LLM_CALL_LOG_FLUSH_INTERVAL,
+    max_buffer=LLM_CALL_LOG_MAX_BUFFER,
+    fallback_path=LLM_CALL_LOG_FALLBACK_PATH,
+    on_flush=roll_up,
+)
+
+
+def record_llm_call(*, model, purpose, status, latency_ms, user=None, usage=None, attempt="primary", won=None):
+    llm_call_writer.add(
+        user_id=user.id if getattr(user, "is_authenticated", False) else None,
+        model=model,
+        purpose=purpose,
+        status=status,
+        attempt=attempt,
+        won=status == "ok" if won is None else won,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        latency_ms=max(int(latency_ms), 0),
+        created_at=timezone.now(),
+    )
+
+
+def _bucket_percentile(buckets, total, pct):
+    """Upper bound of the bucket holding the pct-th call (an upper estimate of the true value)."""
+    if not total:
+        return None
+    target = pct / 100 * total
+    seen = 0
+    for bound in sorted(buckets):
+        seen += buckets[bound]
+        if seen >= target:
+            return bound
+    return max(buckets)
+
+
+def _summarize(group):
+    calls = sum(group["buckets"].values())
+    return {
+        "calls": calls,
+        "errors": group["errors"],
+        "wins": group["wins"],
+        "win_rate": round(group["wins"] / calls, 3) if calls else None,
+        "prompt_tokens": group["prompt_tokens"],
+        "completion_tokens": group["completion_tokens"],
+        "total_tokens": group["prompt_tokens"] + group["completion_tokens"],
+        "latency_ms": {
+            "avg": round(group["total_latency_ms"] / calls) if calls else None,
+            "p50": _bucket_percentile(group["buckets"], calls, 50),
+            "p95": _bucket_percentile(group["buckets"], calls, 95),
+            "p99": _bucket_percentile(group["buckets"], calls, 99),
+        },
+    }
+
+
+def usage_summary(days=7, purpose=None):
+    days = max(min(days, USAGE_MAX_DAYS), 1)
+    since = timezone.now().date() - timedelta(days=days - 1)
+    rows = LLMCallDailyStat.objects.filter(day__gte=since)
+    if purpose:
+        rows = rows.filter(purpose=purpose)
+
+    def empty():
+        return {
+            "buckets": defaultdict(int), "errors": 0, "wins": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "total_latency_ms": 0,
+        }
+
+    by_day = defaultdict(empty)
+    by_model = defaultdict(empty)
+    by_attempt = defaultdict(empty)
+    overall = empty()
+    for row in rows.values(
+        "day", "purpose", "model", "status", "attempt", "latency_bucket_ms",
+        "calls", "wins", "prompt_tokens", "completion_tokens", "total_latency_ms",
+    ):
+        groups = (
+            by_day[(row["day"], row["purpose"])],
+            by_model[(row["model"], row["purpose"])],
+            by_attempt[(row["purpose"], row["attempt"])],
+            overall,
+        )
+        for group in groups:
+            group["buckets"][row["latency_bucket_ms"]] += row["calls"]
+            group["wins"] += row["wins"]
+            if row["status"] != "ok":
+                group["errors"] += row["calls"]
+            group["prompt_tokens"] += row["prompt_tokens"]
+            group["completion_tokens"] += row["completion_tokens"]
+            group["total_latency_ms"] += row["total_latency_ms"]
+
+    return {
+        "days": days,
+        "since": since.isoformat(),
+        "purpose": purpose,
+        "totals": _summarize(overall),
+        "by_day": [
+            {"day": day.isoformat(), "purpose": row_purpose, **_summarize(group)}
+            for (day, row_purpose), group in sorted(by_day.items())
+        ],
+        "by_model": [
+            {"model": model, "purpose": row_purpose, **_summarize(group)}
+            for (model, row_purpose), group in sorted(by_model.items())
+        ],
+        # Primary vs hedge: a hedge's win rate is how often it answered before the primary.
+        "by_attempt": [
+            {"purpose": row_purpose, "attempt": attempt, **_summarize(group)}
+            for (row_purpose, attempt), group in sorted(by_attempt.items())
+        ],
+        "pending_writes": llm_call_writer.stats()["pending"],
+    }
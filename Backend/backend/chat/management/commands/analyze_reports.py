@@ -0,0 +1,95 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from chat import report_batch
+from chat.document_parser import ALLOWED_EXTENSIONS, MAX_ATTACHMENTS
+
+
+def _load(path):
+    return ContentFile(path.read_bytes(), name=path.name)
+
+
+def collect_groups(directory):
+    """Each subdirectory is one report group (its files, sorted); loose files are a group each."""
+    groups, skipped = [], []
+    for entry in sorted(directory.iterdir()):
+        if entry.name.startswith("."):
+            continue
+        if entry.is_dir():
+            files = sorted(p for p in entry.rglob("*") if p.is_file() and not p.name.startswith("."))
+            usable = [p for p in files if p.suffix.lower() in ALLOWED_EXTENSIONS]
+            skipped.extend(p for p in files if p.suffix.lower() not in ALLOWED_EXTENSIONS)
+            # The parser caps files per analysis; split bigger folders into numbered parts.
+            for start in range(0, len(usable), MAX_ATTACHMENTS):
+                part = usable[start:start + MAX_ATTACHMENTS]
+                title = entry.name if len(usable) <= MAX_ATTACHMENTS else f"{entry.name} ({start // MAX_ATTACHMENTS + 1})"
+                groups.append((title, part))
+        elif entry.suffix.lower() in ALLOWED_EXTENSIONS:
+            groups.append((entry.stem, [entry]))
+        else:
+            skipped.append(entry)
+    return groups, skipped
+
+
+class Command(BaseCommand):
+    help = (
+        "Analyze a folder of medical reports for one account: every subdirectory (e.g. one per patient) "
+        "becomes one report analysis, and every loose file its own."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--user", required=True, help="Username or email that will own the analyses.")
+        parser.add_argument("--extract-workers", type=int, default=report_batch.REPORT_BATCH_EXTRACT_WORKERS)
+        parser.add_argument("--llm-workers", type=int, default=report_batch.REPORT_BATCH_LLM_WORKERS)
+        parser.add_argument("--dry-run", action="store_true", help="List the groups without analyzing them.")
+        parser.add_argument("--output", default="", help="Write the summary and per-group results as JSON.")
+
+    def handle(self, *args, **options):
+        directory = Path(options["directory"]).expanduser()
+        if not directory.is_dir():
+            raise CommandError(f"Not a directory: {directory}")
+        user = User.objects.filter(Q(username=options["user"]) | Q(email__iexact=options["user"])).first()
+        if user is None:
+            raise CommandError(f"No user matches {options['user']!r}.")
+
+        found, skipped = collect_groups(directory)
+        for path in skipped:
+            self.stderr.write(f"skipped unsupported file: {path.relative_to(directory)}")
+        if not found:
+            raise CommandError("No supported report files found.")
+        self.stdout.write(f"{len(found)} report groups, {sum(len(files) for _, files in found)} files")
+        if options["dry_run"]:
+            for title, files in found:
+                self.stdout.write(f"  {title}: {', '.join(path.name for path in files)}")
+            return
+
+        groups = [report_batch.ReportGroup(title, [_load(path) for path in files]) for title, files in found]
+        done = [0]
+
+        def progress(group):
+            done[0] += 1
+            detail = f" ({group.error})" if group.error else ""
+            self.stdout.write(f"[{done[0]}/{len(groups)}] {group.title}: {group.status}{detail}")
+
+        summary = report_batch.analyze_report_groups(
+            groups,
+            user=user,
+            extract_workers=options["extract_workers"],
+            llm_workers=options["llm_workers"],
+            on_progress=progress,
+        )
+        self.stdout.write(
+            f"analyzed {summary['succeeded']}/{summary['groups']} groups ({summary['files']} files) in "
+            f"{summary['elapsed_seconds']} s: {summary['groups_per_minute']} groups/min, "
+            f"{summary['files_per_second']} files/s; extraction {summary['extract_seconds_total']} s and "
+            f"LLM {summary['llm_seconds_total']} s summed over workers, save {summary['save_seconds']} s"
+        )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.models import MedicalReportUpload
+from chat.report_storage import delete_new_blobs_on_error, store_blob
+
+
+class Command(BaseCommand):
+    help = "Move uploads stored before content-addressed storage into shared blobs, deleting duplicate copies."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        moved = missing = freed = 0
+        last_id = 0
+        uploads = MedicalReportUpload.objects.filter(blob__isnull=True).order_by("id")
+        while True:
+            batch = list(uploads.filter(id__gt=last_id)[: max(options["batch_size"], 1)])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for upload in batch:
+                if not upload.file or not upload.file.storage.exists(upload.file.name):
+                    missing += 1
+                    continue
+                storage, old_name = upload.file.storage, upload.file.name
+                with delete_new_blobs_on_error(), transaction.atomic():
+                    with storage.open(old_name, "rb") as content:
+                        content.name = old_name
+                        blob = store_blob(content)
+                    upload.blob, upload.file, upload.size = blob, blob.file.name, blob.size
+                    upload.save(update_fields=["blob", "file", "size"])
+                storage.delete(old_name)
+                moved += 1
+                freed += blob.size if blob.refcount > 1 else 0
+        self.stdout.write(
+            self.style.SUCCESS(f"Moved {moved} uploads into blobs ({freed} bytes deduplicated); {missing} files missing.")
+        )
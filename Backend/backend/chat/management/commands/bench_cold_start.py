@@ -0,0 +1,50 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# What a fresh worker does before its first request: configure Django and import every view.
+SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - started, len(sys.modules), int("groq" in sys.modules))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure worker cold start (Django setup plus URLconf import) in fresh interpreters."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=15)
+
+    def handle(self, *args, **options):
+        project_dir = Path(__file__).resolve().parents[3]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "backend.settings"))
+        setup, wall = [], []
+        for _ in range(options["runs"]):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=project_dir, env=env, capture_output=True, text=True)
+            wall.append(time.perf_counter() - started)
+            if result.returncode:
+                raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "Cold start failed.")
+            seconds, modules, groq_loaded = result.stdout.split()
+            setup.append(float(seconds))
+
+        def ms(values, pct):
+            ordered = sorted(values)
+            return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)] * 1000
+
+        self.stdout.write(
+            f"runs {options['runs']}: setup+urls median {statistics.median(setup) * 1000:.0f} ms "
+            f"(p95 {ms(setup, 95):.0f}), process wall median {statistics.median(wall) * 1000:.0f} ms "
+            f"(p95 {ms(wall, 95):.0f}), {modules} modules, groq imported: {'yes' if int(groq_loaded) else 'no'}"
+        )
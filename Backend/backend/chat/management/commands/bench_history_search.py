@@ -0,0 +1,117 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat import history_search
+from chat.models import ChatMessage, ChatSession
+
+User = get_user_model()
+TERMS = [
+    "hemoglobin", "cholesterol", "glucose", "thyroid", "migraine", "fever", "insulin", "asthma", "platelets",
+    "creatinine", "vitamin", "ferritin", "ibuprofen", "paracetamol", "allergy", "hypertension", "rash", "cough",
+    "dizziness", "nausea", "metformin", "ldl", "hdl", "tsh", "bilirubin", "potassium", "sodium", "calcium",
+]
+FILLER = [
+    "my", "the", "after", "since", "level", "was", "high", "low", "normal", "doctor", "said", "test", "result",
+    "days", "week", "morning", "dose", "taking", "should", "worry", "about", "is", "it", "feel", "tired", "again",
+]
+
+
+def _sentence(rng):
+    words = [rng.choice(FILLER) for _ in range(rng.randint(6, 18))]
+    for _ in range(rng.randint(1, 3)):
+        words.insert(rng.randrange(len(words)), rng.choice(TERMS))
+    return " ".join(words)
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Benchmark chat history search on a synthetic message table (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10000000)
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--sessions-per-user", type=int, default=10)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--skip-legacy", action="store_true", help="Skip the unindexed icontains comparison.")
+
+    def _run(self, queries, search):
+        samples = []
+        for user, query in queries:
+            started = time.perf_counter()
+            search(user, query)
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+
+    def _report(self, label, samples):
+        self.stdout.write(
+            f"{label}: p50 {_percentile(samples, 0.5):.2f} ms, p95 {_percentile(samples, 0.95):.2f} ms, "
+            f"max {max(samples):.2f} ms"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        backend = history_search.active_backend()
+        users_count = max(options["users"], 1)
+        per_user = max(options["messages"] // users_count, 1)
+        with transaction.atomic():
+            started = time.perf_counter()
+            users = User.objects.bulk_create(User(username=f"bench-search-{i}") for i in range(users_count))
+            sessions = ChatSession.objects.bulk_create(
+                ChatSession(user=user, title=f"Session {i}")
+                for user in users
+                for i in range(options["sessions_per_user"])
+            )
+            by_user = {}
+            for session in sessions:
+                by_user.setdefault(session.user_id, []).append(session)
+            batch = []
+            for user in users:
+                for i in range(per_user):
+                    batch.append(
+                        ChatMessage(
+                            session=rng.choice(by_user[user.id]),
+                            sender="user" if i % 2 == 0 else "bot",
+                            message=_sentence(rng),
+                        )
+                    )
+                    if len(batch) >= 5000:
+                        batch = ChatMessage.objects.bulk_create(batch)
+                        if backend == "index":
+                            history_search.index_messages(batch)
+                        batch = []
+            batch = ChatMessage.objects.bulk_create(batch)
+            if backend == "index":
+                history_search.index_messages(batch)
+            self.stdout.write(
+                f"seeded {per_user * users_count} messages for {users_count} users in "
+                f"{time.perf_counter() - started:.1f} s ({backend} backend)"
+            )
+
+            queries = []
+            for _ in range(options["queries"]):
+                terms = rng.sample(TERMS, rng.choice([1, 1, 2]))
+                queries.append((rng.choice(users), " ".join(terms)))
+
+            self._report(
+                f"{backend} search",
+                self._run(queries, lambda user, query: history_search.search_history(user, query, kinds=("message",))),
+            )
+            if not options["skip_legacy"]:
+
+                def legacy(user, query):
+                    matches = ChatMessage.objects.filter(session__user=user)
+                    for word in query.split():
+                        matches = matches.filter(message__icontains=word)
+                    return list(matches.order_by("-id")[:20])
+
+                self._report("icontains scan", self._run(queries, legacy))
+            transaction.set_rollback(True)
@@ -0,0 +1,86 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chat.medical_history import materialize, record_version
+from chat.models import MedicalDataVersion
+
+
+def _synthetic_entry(entry_id, rng):
+    return {
+        "id": entry_id,
+        "symptoms": [f"symptom-{rng.randint(1, 5000)}" for _ in range(rng.randint(2, 6))],
+        "possible_diagnosis": f"Condition {entry_id}",
+        "advice": " ".join(f"advice-{rng.randint(1, 9999)}" for _ in range(12)),
+        "medications": [f"drug-{rng.randint(1, 800)}" for _ in range(rng.randint(0, 3))],
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark medical data version storage, listing and restore on synthetic data (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=3000)
+        parser.add_argument("--versions", type=int, default=300)
+        parser.add_argument("--edits-per-version", type=int, default=3)
+        parser.add_argument("--restores", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        data = [_synthetic_entry(entry_id, rng) for entry_id in range(1, options["entries"] + 1)]
+        next_id = options["entries"] + 1
+        full_snapshot_bytes = 0
+        record_ms = []
+
+        with transaction.atomic():
+            MedicalDataVersion.objects.all().delete()
+            for _ in range(options["versions"]):
+                data = list(data)
+                for _ in range(options["edits_per_version"]):
+                    action = rng.random()
+                    if action < 0.7:
+                        index = rng.randrange(len(data))
+                        data[index] = {**data[index], "advice": f"revised-{rng.randint(1, 10 ** 6)}"}
+                    elif action < 0.85:
+                        data.append(_synthetic_entry(next_id, rng))
+                        next_id += 1
+                    else:
+                        data.pop(rng.randrange(len(data)))
+                full_snapshot_bytes += len(json.dumps(data))
+                started = time.perf_counter()
+                record_version(data, note="benchmark")
+                record_ms.append((time.perf_counter() - started) * 1000)
+
+            rows = MedicalDataVersion.objects.only("id", "payload", "is_checkpoint")
+            stored_bytes = sum(len(row.payload) for row in rows)
+            checkpoints = sum(1 for row in rows if row.is_checkpoint)
+
+            started = time.perf_counter()
+            page = list(
+                MedicalDataVersion.objects.select_related("actor")
+                .only("id", "created_at", "note", "entry_count", "actor__email")
+                .order_by("-created_at")[:20]
+            )
+            listing_ms = (time.perf_counter() - started) * 1000
+
+            restore_ms = []
+            version_ids = list(MedicalDataVersion.objects.values_list("id", flat=True))
+            for version_id in rng.sample(version_ids, min(options["restores"], len(version_ids))):
+                started = time.perf_counter()
+                version = MedicalDataVersion.objects.select_related("checkpoint").get(id=version_id)
+                materialize(version)
+                restore_ms.append((time.perf_counter() - started) * 1000)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"versions: {len(version_ids)} ({checkpoints} checkpoints), entries: {len(data)}")
+        self.stdout.write(f"full JSON snapshots: {full_snapshot_bytes / 1024 / 1024:.2f} MiB")
+        self.stdout.write(f"stored payloads:     {stored_bytes / 1024 / 1024:.2f} MiB")
+        self.stdout.write(f"record version:      median {statistics.median(record_ms):.2f} ms, max {max(record_ms):.2f} ms")
+        self.stdout.write(f"list page of {len(page)}:      {listing_ms:.2f} ms")
+        self.stdout.write(f"restore:             median {statistics.median(restore_ms):.2f} ms, max {max(restore_ms):.2f} ms")
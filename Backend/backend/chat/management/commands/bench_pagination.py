@@ -0,0 +1,68 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from chat.models import AdminAuditLog
+from chat.pagination import _after, _order_expressions, decode_cursor, encode_cursor
+
+
+ORDERING = ["-created_at", "-id"]
+
+
+def _timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = "Compare offset and keyset page latency on a synthetic audit log (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200000)
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--repeats", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        page_size = options["page_size"]
+        queryset = AdminAuditLog.objects.order_by(*_order_expressions(AdminAuditLog, ORDERING))
+
+        with transaction.atomic():
+            AdminAuditLog.objects.all().delete()
+            start = timezone.now() - timedelta(days=365)
+            # Several rows per timestamp so the id tiebreaker is exercised.
+            AdminAuditLog.objects.bulk_create(
+                [
+                    AdminAuditLog(action="benchmark", created_at=start + timedelta(seconds=index // 4))
+                    for index in range(rows)
+                ],
+                batch_size=5000,
+            )
+
+            self.stdout.write(f"rows: {rows}, page size: {page_size}")
+            self.stdout.write(f"count(): {_timed(queryset.count, options['repeats']):.2f} ms")
+            for fraction in (0, 0.25, 0.5, 0.9, 0.99):
+                offset = int((rows - page_size) * fraction)
+                offset_ms = _timed(lambda: list(queryset[offset : offset + page_size + 1]), options["repeats"])
+
+                boundary = queryset.values_list("created_at", "id")[offset - 1] if offset else None
+                token = encode_cursor(ORDERING, boundary) if boundary else ""
+
+                def keyset_page():
+                    window = queryset
+                    if token:
+                        window = queryset.filter(_after(AdminAuditLog, ORDERING, decode_cursor(token, ORDERING)))
+                    return list(window[: page_size + 1])
+
+                keyset_ms = _timed(keyset_page, options["repeats"])
+                self.stdout.write(f"offset {offset:>8}: offset {offset_ms:8.2f} ms, keyset {keyset_ms:8.2f} ms")
+
+            transaction.set_rollback(True)
@@ -0,0 +1,64 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+SCENARIOS = [
+    (
+        "db, save every request (before)",
+        {"SESSION_ENGINE": "django.contrib.sessions.backends.db", "SESSION_SAVE_EVERY_REQUEST": True},
+    ),
+    (
+        "db, sliding expiry",
+        {"SESSION_ENGINE": "django.contrib.sessions.backends.db", "SESSION_SAVE_EVERY_REQUEST": False},
+    ),
+    (
+        "cache, sliding expiry",
+        {"SESSION_ENGINE": "django.contrib.sessions.backends.cache", "SESSION_SAVE_EVERY_REQUEST": False},
+    ),
+    (
+        "signed_cookie, sliding expiry",
+        {"SESSION_ENGINE": "django.contrib.sessions.backends.signed_cookies", "SESSION_SAVE_EVERY_REQUEST": False},
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = "Measure database writes per authenticated web request for each session storage mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--path", default="/api/sessions/")
+
+    def handle(self, *args, **options):
+        total_requests = max(options["requests"], 1)
+        path = options["path"]
+        User = get_user_model()
+
+        self.stdout.write(f"{'mode':<34}{'writes/req':>12}{'session writes/req':>20}{'ms/req':>10}")
+        with transaction.atomic():
+            user = User.objects.create_user(username="bench-session@medassist.local", email="bench-session@medassist.local")
+            for label, overrides in SCENARIOS:
+                with override_settings(ALLOWED_HOSTS=["testserver"], **overrides):
+                    client = Client()
+                    client.force_login(user)
+                    client.get(path)
+
+                    started = time.perf_counter()
+                    with CaptureQueriesContext(connection) as ctx:
+                        for _ in range(total_requests):
+                            client.get(path)
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+
+                writes = [q["sql"] for q in ctx.captured_queries if q["sql"].lstrip().upper().startswith(WRITE_PREFIXES)]
+                session_writes = [sql for sql in writes if "django_session" in sql]
+                self.stdout.write(
+                    f"{label:<34}{len(writes) / total_requests:>12.3f}"
+                    f"{len(session_writes) / total_requests:>20.3f}{elapsed_ms / total_requests:>10.2f}"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,88 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from chat.user_search import active_backend, rebuild_index, search_users
+
+User = get_user_model()
+SYLLABLES = ["ka", "ri", "mo", "lan", "te", "so", "vin", "da", "ne", "ro", "li", "sha", "ber", "to", "mi", "gar"]
+DOMAINS = ["example.com", "clinic.org", "mail.net", "health.io"]
+
+
+def _name(rng, parts):
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts))
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Benchmark admin user search on a synthetic user table (rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=11)
+        parser.add_argument("--skip-legacy", action="store_true", help="Skip the unindexed icontains comparison.")
+
+    def _run(self, queries, search):
+        samples = []
+        for query in queries:
+            started = time.perf_counter()
+            list(search(query)[:20])
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+
+    def _report(self, label, samples):
+        self.stdout.write(
+            f"{label}: p50 {_percentile(samples, 0.5):.2f} ms, p95 {_percentile(samples, 0.95):.2f} ms, "
+            f"max {max(samples):.2f} ms"
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            started = time.perf_counter()
+            batch = []
+            people = []
+            for index in range(options["users"]):
+                first, last = _name(rng, rng.randint(2, 3)), _name(rng, rng.randint(3, 4))
+                people.append((first, last))
+                email = f"{first}.{last}{index % 1000}@{rng.choice(DOMAINS)}"
+                batch.append(
+                    User(username=f"bench-{index}", email=email, first_name=first.title(), last_name=last.title())
+                )
+                if len(batch) >= 5000:
+                    User.objects.bulk_create(batch)
+                    batch = []
+            User.objects.bulk_create(batch)
+            rebuild_index()
+            self.stdout.write(f"seeded {options['users']} users in {time.perf_counter() - started:.1f} s")
+
+            queries = []
+            for _ in range(options["queries"]):
+                # What an admin types while looking someone up: a partial surname, then first + surname.
+                first, last = rng.choice(people)
+                queries.append(
+                    rng.choice([last[: rng.randint(3, len(last))], f"{first} {last[: rng.randint(3, len(last))]}", first])
+                )
+
+            def ranked(query):
+                return search_users(User.objects.all(), query).order_by("-search_rank", "-id")
+
+            self._report(f"{active_backend()} search", self._run(queries, ranked))
+            if not options["skip_legacy"]:
+
+                def legacy(query):
+                    return User.objects.filter(
+                        Q(email__icontains=query) | Q(first_name__icontains=query) | Q(last_name__icontains=query)
+                    ).order_by("-date_joined")
+
+                self._report("icontains scan", self._run(queries[:20], legacy))
+            transaction.set_rollback(True)
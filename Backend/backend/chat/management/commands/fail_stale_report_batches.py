@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from chat.report_batch import REPORT_BATCH_JOB_STALE_SECONDS, fail_stale_jobs, remove_orphaned_spools
+
+
+class Command(BaseCommand):
+    help = (
+        "Fail report batch jobs whose worker stopped (no heartbeat for REPORT_BATCH_JOB_STALE_SECONDS) and "
+        "delete upload spools on this host that no queued or running job owns. Run it periodically on each web host."
+    )
+
+    def handle(self, *args, **options):
+        failed = fail_stale_jobs()
+        removed = remove_orphaned_spools()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Failed {failed} jobs silent for over {REPORT_BATCH_JOB_STALE_SECONDS}s; removed {removed} spool directories."
+            )
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from chat.fake_llm import FakeLLMServer
+
+
+class Command(BaseCommand):
+    help = "Serve a local OpenAI/Groq-compatible stand-in; point the backend at it with GROQ_BASE_URL."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8089)
+        parser.add_argument("--latency-ms", type=float, default=300)
+        parser.add_argument("--jitter-ms", type=float, default=100)
+        parser.add_argument("--tokens-per-second", type=float, default=250)
+        parser.add_argument("--completion-tokens", type=int, default=150)
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with a 500.")
+        parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls answered with a 429.")
+        parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of calls given extra tail latency.")
+        parser.add_argument("--slow-latency-ms", type=float, default=5000)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        server = FakeLLMServer(
+            options["host"],
+            options["port"],
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            tokens_per_second=options["tokens_per_second"],
+            completion_tokens=options["completion_tokens"],
+            error_rate=options["error_rate"],
+            rate_limit_rate=options["rate_limit_rate"],
+            slow_rate=options["slow_rate"],
+            slow_latency_ms=options["slow_latency_ms"],
+            seed=options["seed"],
+        )
+        self.stdout.write(f"Fake LLM listening on {server.url} (export GROQ_BASE_URL={server.url})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+            self.stdout.write(f"stats: {server.stats()}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from chat.models import MedicalReportAnalysis
+from chat.report_retrieval import ensure_indexed, index_reports
+
+
+class Command(BaseCommand):
+    help = "Chunk and index stored report analyses for chat retrieval (backfill, or --all after changing chunk sizes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-index reports that already have chunks.")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        index = index_reports if options["all"] else ensure_indexed
+        reports = MedicalReportAnalysis.objects.only("id", "extracted_text").order_by("id")
+        total, batch, last_id = 0, max(options["batch_size"], 1), 0
+        while True:
+            page = list(reports.filter(id__gt=last_id)[:batch])
+            if not page:
+                break
+            total += index(page)
+            last_id = page[-1].id
+        self.stdout.write(self.style.SUCCESS(f"Wrote {total} report chunks."))
@@ -0,0 +1,322 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from rest_framework.authtoken.models import Token
+
+from chat import throttling
+from chat.ai_engine import providers
+from chat.audit import audit_log_writer
+from chat.fake_llm import FakeLLMServer
+from chat.llm_usage import llm_call_writer
+from chat.models import ChatMessage, ChatSession
+
+
+QUESTIONS = (
+    "I have had a mild headache since this morning, what should I do?",
+    "Is it normal to feel tired after a flu shot?",
+    "What foods help with iron deficiency?",
+    "My throat is sore and I have a low fever.",
+    "How much water should I drink per day?",
+)
+REPORT_TEXT = (
+    "Complete Blood Count\nHemoglobin: {hb} g/dL (13.5-17.5)\nWBC: {wbc} x10^9/L (4.0-11.0)\n"
+    "Platelets: {plt} x10^9/L (150-450)\nFasting glucose: {glucose} mg/dL (70-99)\n"
+)
+DEFAULT_MIX = "chat=4,history=3,sessions=2,report=1"
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in {"chat", "history", "sessions", "report"}:
+            raise CommandError(f"Unknown endpoint in --mix: {name}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise CommandError("--mix needs at least one positive weight.")
+    return mix
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def _multipart(filename, content):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: text/plain\r\n\r\n{content}\r\n--{boundary}--\r\n"
+    ).encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic users, sessions and messages, then drive chat/, history/, sessions/ and "
+        "reports/analyze/ with concurrent virtual users against a local fake LLM provider. "
+        "Without --target the backend runs in-process; with --target, start that backend with "
+        "GROQ_BASE_URL set to the fake provider (see --llm-port) and the same database settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", default="", help="Base URL of a running backend, e.g. http://127.0.0.1:8000.")
+        parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users.")
+        parser.add_argument("--duration", type=float, default=30.0)
+        parser.add_argument("--think-ms", type=float, default=0, help="Pause between a virtual user's requests.")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights.")
+        parser.add_argument("--sessions-per-user", type=int, default=5)
+        parser.add_argument("--messages-per-session", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--llm-port", type=int, default=0, help="Fake provider port (0 picks a free one).")
+        parser.add_argument("--llm-latency-ms", type=float, default=300)
+        parser.add_argument("--llm-jitter-ms", type=float, default=100)
+        parser.add_argument("--llm-tokens-per-second", type=float, default=250)
+        parser.add_argument("--llm-completion-tokens", type=int, default=150)
+        parser.add_argument("--llm-error-rate", type=float, default=0.0)
+        parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0)
+        parser.add_argument("--llm-slow-rate", type=float, default=0.0, help="Fraction of LLM calls with tail latency.")
+        parser.add_argument("--llm-slow-latency-ms", type=float, default=5000)
+        parser.add_argument("--throttle", action="store_true", help="Keep per-user throttling on (in-process only).")
+        parser.add_argument("--keep-data", action="store_true", help="Leave the seeded users in the database.")
+        parser.add_argument("--output", default="", help="Write the results as JSON to this path.")
+        parser.add_argument("--baseline", default="", help="Results JSON from an earlier run to compare against.")
+        parser.add_argument(
+            "--max-regression", type=float, default=0.2,
+            help="Fail when an endpoint's p95 or throughput is this much worse than --baseline.",
+        )
+
+    def handle(self, *args, **options):
+        mix = _parse_mix(options["mix"])
+        prefix = f"loadtest-{uuid.uuid4().hex[:8]}-"
+        fake = FakeLLMServer(
+            port=options["llm_port"],
+            latency_ms=options["llm_latency_ms"],
+            jitter_ms=options["llm_jitter_ms"],
+            tokens_per_second=options["llm_tokens_per_second"],
+            completion_tokens=options["llm_completion_tokens"],
+            error_rate=options["llm_error_rate"],
+            rate_limit_rate=options["llm_rate_limit_rate"],
+            slow_rate=options["llm_slow_rate"],
+            slow_latency_ms=options["llm_slow_latency_ms"],
+            seed=options["seed"],
+        ).start()
+        self.stdout.write(f"fake LLM at {fake.url}")
+
+        with ExitStack() as stack:
+            stack.callback(fake.stop)
+            started = time.monotonic()
+            accounts = self._seed(prefix, options)
+            if not options["keep_data"]:
+                stack.callback(self._cleanup, prefix)
+            self.stdout.write(f"seeded {len(accounts)} users in {time.monotonic() - started:.1f} s")
+
+            target = options["target"].rstrip("/")
+            if not target:
+                target = self._serve_in_process(stack, fake, options)
+            results = self._drive(target, accounts, mix, options)
+
+        results["llm"] = fake.stats()
+        self._report(results)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        if options["baseline"]:
+            self._compare(results, options["baseline"], options["max_regression"])
+
+    def _seed(self, prefix, options):
+        rng = random.Random(options["seed"])
+        password = make_password(None)
+        users = User.objects.bulk_create(
+            [
+                User(username=f"{prefix}{index}", email=f"{prefix}{index}@example.com", password=password)
+                for index in range(options["users"])
+            ]
+        )
+        tokens = Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users])
+        sessions = ChatSession.objects.bulk_create(
+            [
+                ChatSession(user=user, title=f"Load test {index}")
+                for user in users
+                for index in range(options["sessions_per_user"])
+            ]
+        )
+        messages = []
+        for session in sessions:
+            for index in range(options["messages_per_session"]):
+                sender = "user" if index % 2 == 0 else "bot"
+                messages.append(ChatMessage(session=session, sender=sender, message=rng.choice(QUESTIONS)))
+        ChatMessage.objects.bulk_create(messages, batch_size=2000)
+
+        by_user = defaultdict(list)
+        for session in sessions:
+            by_user[session.user_id].append(session.id)
+        return [{"token": token.key, "sessions": by_user[token.user_id]} for token in tokens]
+
+    def _cleanup(self, prefix):
+        # Buffered rows still reference the seeded users.
+        for writer in (llm_call_writer, audit_log_writer):
+            writer.flush()
+        User.objects.filter(username__startswith=prefix).delete()
+
+    def _serve_in_process(self, stack, fake, options):
+        provider = providers.GroqProvider(api_key="local", base_url=fake.url)
+        stack.enter_context(mock.patch.object(providers, "_provider", provider))
+        if not options["throttle"]:
+            stack.enter_context(mock.patch.dict(throttling.THROTTLE_RATES, {scope: (0, 0) for scope in throttling.THROTTLE_RATES}))
+
+        server = ThreadedWSGIServer(("127.0.0.1", 0), _QuietHandler, allow_reuse_address=False)
+        server.set_app(WSGIHandler())
+        thread = threading.Thread(target=server.serve_forever, name="loadtest-backend", daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+        stack.callback(stop)
+        host, port = server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _request(self, target, account, endpoint, rng):
+        headers = {"Authorization": f"Token {account['token']}"}
+        if endpoint == "sessions":
+            return urllib.request.Request(f"{target}/api/sessions/", headers=headers)
+        if endpoint == "history":
+            return urllib.request.Request(f"{target}/api/history/{rng.choice(account['sessions'])}/", headers=headers)
+        if endpoint == "chat":
+            body = json.dumps({"message": rng.choice(QUESTIONS), "session_id": rng.choice(account["sessions"])})
+            headers["Content-Type"] = "application/json"
+            return urllib.request.Request(f"{target}/api/chat/", data=body.encode("utf-8"), headers=headers)
+        report = REPORT_TEXT.format(
+            hb=round(rng.uniform(10, 17), 1),
+            wbc=round(rng.uniform(3, 12), 1),
+            plt=rng.randint(120, 460),
+            glucose=rng.randint(70, 140),
+        )
+        body, content_type = _multipart("cbc.txt", report)
+        headers["Content-Type"] = content_type
+        return urllib.request.Request(f"{target}/api/reports/analyze/", data=body, headers=headers)
+
+    def _drive(self, target, accounts, mix, options):
+        names, weights = list(mix), list(mix.values())
+        latencies = defaultdict(list)
+        statuses = defaultdict(Counter)
+        lock = threading.Lock()
+        think = options["think_ms"] / 1000
+
+        def virtual_user(index):
+            rng = random.Random(options["seed"] * 1000 + index)
+            account = accounts[index % len(accounts)]
+            while time.monotonic() < stop_at:
+                endpoint = rng.choices(names, weights)[0]
+                request = self._request(target, account, endpoint, rng)
+                sent = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=120) as response:
+                        response.read()
+                        status = response.status
+                except urllib.error.HTTPError as exc:
+                    exc.read()
+                    status = exc.code
+                except OSError:
+                    status = "conn_error"
+                elapsed = time.perf_counter() - sent
+                with lock:
+                    latencies[endpoint].append(elapsed * 1000)
+                    statuses[endpoint][str(status)] += 1
+                if think:
+                    time.sleep(think)
+
+        threads = [threading.Thread(target=virtual_user, args=(index,)) for index in range(options["users"])]
+        stop_at = time.monotonic() + options["duration"]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        endpoints = {}
+        for endpoint in names:
+            values = sorted(latencies[endpoint])
+            errors = sum(count for status, count in statuses[endpoint].items() if not status.startswith("2"))
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": errors,
+                "statuses": dict(statuses[endpoint]),
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "latency_ms": {
+                    "p50": _percentile(values, 50),
+                    "p95": _percentile(values, 95),
+                    "p99": _percentile(values, 99),
+                    "max": values[-1] if values else None,
+                },
+            }
+        total = sum(item["requests"] for item in endpoints.values())
+        return {
+            "target": target,
+            "users": options["users"],
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "endpoints": endpoints,
+        }
+
+    def _report(self, results):
+        self.stdout.write(
+            f"target {results['target']}: {results['users']} users, {results['requests']} requests in "
+            f"{results['elapsed_seconds']} s ({results['throughput_rps']} req/s)"
+        )
+
+        def ms(value):
+            return "-" if value is None else f"{value:.0f}"
+
+        self.stdout.write(f"{'endpoint':>9} {'reqs':>6} {'req/s':>7} {'errors':>6} {'p50':>6} {'p95':>6} {'p99':>6} {'max':>6}  statuses")
+        for endpoint, item in results["endpoints"].items():
+            latency = item["latency_ms"]
+            self.stdout.write(
+                f"{endpoint:>9} {item['requests']:>6} {item['throughput_rps']:>7} {item['errors']:>6} "
+                f"{ms(latency['p50']):>6} {ms(latency['p95']):>6} {ms(latency['p99']):>6} {ms(latency['max']):>6}  "
+                f"{item['statuses']}"
+            )
+        self.stdout.write(f"fake LLM: {results['llm']}")
+
+    def _compare(self, results, path, max_regression):
+        with open(path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = []
+        for endpoint, item in results["endpoints"].items():
+            before = baseline.get("endpoints", {}).get(endpoint)
+            if not before or not item["requests"] or not before["requests"]:
+                continue
+            p95, old_p95 = item["latency_ms"]["p95"], before["latency_ms"]["p95"]
+            rps, old_rps = item["throughput_rps"], before["throughput_rps"]
+            self.stdout.write(f"{endpoint:>9} p95 {old_p95:.0f} -> {p95:.0f} ms, throughput {old_rps} -> {rps} req/s")
+            if p95 > old_p95 * (1 + max_regression):
+                regressions.append(f"{endpoint} p95")
+            if rps < old_rps * (1 - max_regression):
+                regressions.append(f"{endpoint} throughput")
+        if regressions:
+            raise CommandError(f"Regressed beyond {max_regression:.0%}: {', '.join(regressions)}")
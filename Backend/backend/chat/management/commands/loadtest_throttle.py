@@ -0,0 +1,86 @@
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.http import HttpRequest
+
+from chat import throttling
+
+
+def _request(user_id):
+    raw = HttpRequest()
+    raw.META["REMOTE_ADDR"] = "127.0.0.1"
+    return SimpleNamespace(_request=raw, user=SimpleNamespace(pk=user_id, is_authenticated=True), META=raw.META)
+
+
+class Command(BaseCommand):
+    help = "Hammer the chat token-bucket throttle from many threads and report per-user fairness."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--greedy-users", type=int, default=2, help="Users sending as fast as they can.")
+        parser.add_argument("--greedy-threads", type=int, default=8, help="Threads per greedy user.")
+        parser.add_argument("--duration", type=float, default=5.0)
+        parser.add_argument("--burst", type=int, default=10)
+        parser.add_argument("--per-minute", type=float, default=120.0)
+        parser.add_argument("--polite-interval", type=float, default=0.25, help="Seconds between polite requests.")
+        # A short pause stands in for the network round trip and keeps greedy threads
+        # from starving everyone else of the GIL.
+        parser.add_argument("--greedy-interval", type=float, default=0.0005)
+        parser.add_argument("--backend", choices=["local", "cache"], default=throttling.THROTTLE_BACKEND)
+
+    def handle(self, *args, **options):
+        users = options["users"]
+        greedy = set(range(1, options["greedy_users"] + 1))
+        allowed = {user_id: 0 for user_id in range(1, users + 1)}
+        denied = dict(allowed)
+        lock = threading.Lock()
+        stop_at = time.monotonic() + options["duration"]
+        throttle = throttling.ChatRateThrottle()
+
+        def worker(user_id, interval):
+            request = _request(user_id)
+            while time.monotonic() < stop_at:
+                ok = throttle.allow_request(request, None)
+                with lock:
+                    (allowed if ok else denied)[user_id] += 1
+                time.sleep(interval)
+
+        threads = []
+        for user_id in allowed:
+            if user_id in greedy:
+                threads.extend(
+                    threading.Thread(target=worker, args=(user_id, options["greedy_interval"]))
+                    for _ in range(options["greedy_threads"])
+                )
+            else:
+                threads.append(threading.Thread(target=worker, args=(user_id, options["polite_interval"])))
+
+        rates = {"chat": (options["burst"], options["per_minute"])}
+        with mock.patch.dict(throttling.THROTTLE_RATES, rates), mock.patch.object(
+            throttling, "THROTTLE_BACKEND", options["backend"]
+        ), mock.patch.object(throttling, "_local_store", throttling.LocalBucketStore()):
+            started = time.monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - started
+
+        budget = options["burst"] + options["per_minute"] / 60 * elapsed
+        self.stdout.write(f"backend: {options['backend']}, elapsed {elapsed:.1f} s, per-user budget ~{budget:.0f}")
+        for label, group in (("greedy", greedy), ("polite", set(allowed) - greedy)):
+            if not group:
+                continue
+            granted = [allowed[user_id] for user_id in group]
+            attempts = sum(allowed[user_id] + denied[user_id] for user_id in group)
+            self.stdout.write(
+                f"{label:>6}: users {len(group)}, attempts {attempts}, allowed min {min(granted)} "
+                f"/ max {max(granted)}, denied {sum(denied[user_id] for user_id in group)}"
+            )
+        # Jain's index over each user's allowed share of what it could use (1.0 = perfectly fair).
+        shares = [min(allowed[user_id] / budget, 1.0) for user_id in allowed]
+        jain = sum(shares) ** 2 / (len(shares) * sum(share * share for share in shares)) if any(shares) else 0
+        self.stdout.write(f"fairness (Jain, capped at budget): {jain:.3f}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.audit import audit_log_writer
+from chat.llm_usage import llm_call_writer
+
+
+class Command(BaseCommand):
+    help = "Write audit and LLM call rows saved to the fallback files (while the database was down) back to it."
+
+    def handle(self, *args, **options):
+        for label, writer in (("audit log", audit_log_writer), ("LLM call", llm_call_writer)):
+            try:
+                replayed = writer.replay_fallback()
+            except Exception as exc:
+                raise CommandError(f"Could not replay {label} rows from {writer.fallback_path}: {exc}") from exc
+            self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} {label} rows."))
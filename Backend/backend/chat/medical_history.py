@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import zlib
+
+from django.db import transaction
+
+from .models import MedicalDataVersion
+
+
+MEDICAL_DATA_CHECKPOINT_INTERVAL = int(os.getenv("MEDICAL_DATA_CHECKPOINT_INTERVAL", "20"))
+
+_latest_lock = threading.Lock()
+_latest_materialized = None  # (version_id, data) of the newest row this worker has seen
+
+
+def _compress(value):
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def _decompress(payload):
+    return json.loads(zlib.decompress(bytes(payload)).decode("utf-8"))
+
+
+def _entry_key(entry):
+    if not isinstance(entry, dict):
+        return None
+    key = entry.get("id")
+    if isinstance(key, bool) or not isinstance(key, (int, str)):
+        return None
+    return key
+
+
+def _keyed(data):
+    keyed = {}
+    for entry in data:
+        key = _entry_key(entry)
+        if key is None or key in keyed:
+            return None
+        keyed[key] = entry
+    return keyed
+
+
+def apply_delta(base, delta):
+    removed = set(delta.get("remove", []))
+    updates = {entry["id"]: entry for entry in delta.get("set", [])}
+    result = []
+    for entry in base:
+        key = entry["id"]
+        if key in removed:
+            continue
+        result.append(updates.pop(key, entry))
+    result.extend(entry for entry in delta.get("set", []) if entry["id"] in updates)
+    if "order" in delta:
+        by_key = {entry["id"]: entry for entry in result}
+        result = [by_key[key] for key in delta["order"]]
+    return result
+
+
+def compute_delta(base, target):
+    """Entry-level diff keyed by ``id``; None when either side cannot be keyed that way."""
+    base_map = _keyed(base)
+    target_map = _keyed(target)
+    if base_map is None or target_map is None:
+        return None
+    delta = {
+        "set": [entry for key, entry in target_map.items() if base_map.get(key) != entry],
+        "remove": [key for key in base_map if key not in target_map],
+    }
+    if [entry["id"] for entry in apply_delta(base, delta)] != list(target_map):
+        delta["order"] = list(target_map)
+    return delta
+
+
+def materialize(version):
+    if version.is_checkpoint:
+        return _decompress(version.payload)
+    data = _decompress(version.checkpoint.payload)
+    chain = MedicalDataVersion.objects.filter(checkpoint_id=version.checkpoint_id, id__lte=version.id).order_by("id")
+    for delta_row in chain.only("id", "payload"):
+        data = apply_delta(data, _decompress(delta_row.payload))
+    return data
+
+
+def _latest_data(latest):
+    with _latest_lock:
+        cached = _latest_materialized
+    if cached is not None and cached[0] == latest.id:
+        return cached[1]
+    return materialize(latest)
+
+
+def _remember_latest(version_id, data):
+    global _latest_materialized
+    with _latest_lock:
+        _latest_materialized = (version_id, data)
+
+
+def record_version(data, *, actor=None, note=""):
+    """Store ``data`` as a new history row, as a delta when a recent checkpoint allows it."""
+    latest = (
+        MedicalDataVersion.objects.select_related("checkpoint")
+        .defer("checkpoint__payload")
+        .order_by("-id")
+        .first()
+    )
+    delta = None
+    if latest is not None and latest.depth + 1 < MEDICAL_DATA_CHECKPOINT_INTERVAL:
+        delta = compute_delta(_latest_data(latest), data)
+        if delta is not None and len(delta["set"]) + len(delta["remove"]) > len(data) // 2:
+            delta = None
+
+    if delta is None:
+        version = MedicalDataVersion.objects.create(
+            actor=actor,
+            note=note,
+            payload=_compress(data),
+            is_checkpoint=True,
+            entry_count=len(data),
+        )
+    else:
+        version = MedicalDataVersion.objects.create(
+            actor=actor,
+            note=note,
+            payload=_compress(delta),
+            is_checkpoint=False,
+            checkpoint_id=latest.id if latest.is_checkpoint else latest.checkpoint_id,
+            depth=latest.depth + 1,
+            entry_count=len(data),
+        )
+    transaction.on_commit(lambda: _remember_latest(version.id, data))
+    return version
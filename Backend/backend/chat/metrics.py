@@ -0,0 +1,195 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+
+# Each worker periodically writes its histograms here; the metrics endpoint merges every file.
+METRICS_DIR = Path(os.getenv("METRICS_DIR", Path(tempfile.gettempdir()) / "medassist-metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "10"))
+# Snapshots from workers that stopped writing this long ago are ignored and removed.
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", "3600"))
+# Server-Timing exposes backend phase timings, so by default only staff responses carry it.
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "False").lower() == "true"
+METRIC_PREFIX = "medassist"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+HELP = {
+    "http_request_duration_seconds": "Request latency by route, method and status.",
+    "phase_duration_seconds": "Time spent in instrumented request phases.",
+    "llm_queue_wait_seconds": "Time LLM calls waited for a scheduler slot.",
+    "llm_attempt_seconds": "Provider call latency by route, attempt (primary or hedge) and outcome.",
+}
+
+_request_spans = ContextVar("request_spans", default=None)
+
+
+class HistogramRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._last_flush = 0.0
+
+    def observe(self, name, labels, seconds):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0}
+            series["buckets"][index] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "buckets": list(series["buckets"]),
+                    "sum": series["sum"],
+                    "count": series["count"],
+                }
+                for (name, labels), series in self._series.items()
+            ]
+
+    def flush(self, force=False):
+        now = time.time()
+        if not force and now - self._last_flush < METRICS_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        try:
+            METRICS_DIR.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=METRICS_DIR, prefix=".metrics-", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, METRICS_DIR / f"metrics-{os.getpid()}.json")
+        except OSError:
+            pass
+
+
+registry = HistogramRegistry()
+atexit.register(registry.flush, force=True)
+
+
+def observe(name, seconds, **labels):
+    registry.observe(name, labels, seconds)
+
+
+def record_span(name, seconds):
+    """Add seconds to the current request's span (for Server-Timing) and to the phase histogram."""
+    spans = _request_spans.get()
+    if spans is not None:
+        total, count = spans.get(name, (0.0, 0))
+        spans[name] = (total + seconds, count + 1)
+    observe("phase_duration_seconds", seconds, phase=name)
+
+
+@contextmanager
+def span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def begin_request():
+    return _request_spans.set({})
+
+
+def end_request(token):
+    spans = _request_spans.get() or {}
+    _request_spans.reset(token)
+    return spans
+
+
+def db_timer(execute, sql, params, many, context):
+    # Per-query timing feeds the request's "db" span only; the histogram gets the per-request total.
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        spans = _request_spans.get()
+        if spans is not None:
+            total, count = spans.get("db", (0.0, 0))
+            spans["db"] = (total + time.perf_counter() - started, count + 1)
+
+
+def server_timing_header(spans, total_seconds):
+    parts = [f'{name};dur={seconds * 1000:.1f};desc="{count}x"' for name, (seconds, count) in spans.items()]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def _load_snapshots():
+    """Current process live, plus every other worker's last flushed snapshot."""
+    snapshots = [registry.snapshot()]
+    own = f"metrics-{os.getpid()}.json"
+    now = time.time()
+    if METRICS_DIR.is_dir():
+        for path in METRICS_DIR.glob("metrics-*.json"):
+            if path.name == own:
+                continue
+            try:
+                if now - path.stat().st_mtime > METRICS_STALE_SECONDS:
+                    path.unlink()
+                    continue
+                snapshots.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+    return snapshots
+
+
+def _format_labels(labels, extra=None):
+    items = sorted(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(gauges=None):
+    merged = {}
+    for snapshot in _load_snapshots():
+        for series in snapshot:
+            key = (series["name"], tuple(sorted(series["labels"].items())))
+            target = merged.setdefault(key, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0})
+            for index, value in enumerate(series["buckets"][: len(BUCKETS) + 1]):
+                target["buckets"][index] += value
+            target["sum"] += series["sum"]
+            target["count"] += series["count"]
+
+    lines = []
+    for name in sorted({name for name, _ in merged}):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {full_name} histogram")
+        for (series_name, labels), series in sorted(merged.items()):
+            if series_name != name:
+                continue
+            labels = dict(labels)
+            cumulative = 0
+            for bound, value in zip(BUCKETS + ("+Inf",), series["buckets"]):
+                cumulative += value
+                lines.append(f"{full_name}_bucket{_format_labels(labels, {'le': str(bound)})} {cumulative}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_number(series['sum'])}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {series['count']}")
+
+    for name, (help_text, samples) in sorted((gauges or {}).items()):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} gauge")
+        for labels, value in samples:
+            lines.append(f"{full_name}{_format_labels(labels)} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,99 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .metrics import (
+    SERVER_TIMING_ENABLED,
+    begin_request,
+    db_timer,
+    end_request,
+    observe,
+    registry,
+    server_timing_header,
+)
+from .throttling import THROTTLE_STATE_ATTR
+
+
+SESSION_REFRESHED_AT_KEY = "_refreshed_at"
+
+
+class SlidingSessionMiddleware:
+    """Extend session expiry only when its remaining lifetime drops below a threshold."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        session = getattr(request, "session", None)
+        if session is None or settings.SESSION_SAVE_EVERY_REQUEST:
+            return response
+        # Only look at sessions the request already loaded, so token-authenticated calls stay untouched.
+        if not session.accessed or session.is_empty():
+            return response
+
+        now = time.time()
+        if session.modified:
+            session[SESSION_REFRESHED_AT_KEY] = now
+            return response
+
+        refreshed_at = session.get(SESSION_REFRESHED_AT_KEY)
+        remaining = (refreshed_at or 0) + session.get_expiry_age() - now
+        if remaining < settings.SESSION_REFRESH_THRESHOLD:
+            session[SESSION_REFRESHED_AT_KEY] = now
+        return response
+
+
+class ServerTimingMiddleware:
+    """Collect per-request spans, feed the latency histograms and emit Server-Timing.
+
+    The header goes to staff users only, unless SERVER_TIMING_ENABLED turns it on for every response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = begin_request()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(db_timer):
+                response = self.get_response(request)
+        finally:
+            spans = end_request(token)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        observe(
+            "http_request_duration_seconds",
+            elapsed,
+            route=match.route if match else "unmatched",
+            method=request.method,
+            status=str(response.status_code),
+        )
+        if "db" in spans:
+            observe("phase_duration_seconds", spans["db"][0], phase="db")
+        # DRF copies the user it authenticated (token or session) back onto the Django request.
+        user = getattr(request, "user", None)
+        if SERVER_TIMING_ENABLED or getattr(user, "is_staff", False):
+            response["Server-Timing"] = server_timing_header(spans, elapsed)
+        registry.flush()
+        return response
+
+
+class RateLimitHeadersMiddleware:
+    """Expose the token-bucket budget computed by the DRF throttles as X-RateLimit-* headers."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        state = getattr(request, THROTTLE_STATE_ATTR, None)
+        if state is not None:
+            limit, remaining, reset = state
+            response["X-RateLimit-Limit"] = str(limit)
+            response["X-RateLimit-Remaining"] = str(remaining)
+            response["X-RateLimit-Reset"] = str(reset)
+        return response
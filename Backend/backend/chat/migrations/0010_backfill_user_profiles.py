@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def create_missing_profiles(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    UserProfile = apps.get_model("chat", "UserProfile")
+    missing_ids = User.objects.filter(profile__isnull=True).values_list("id", flat=True)
+    UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in missing_ids], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0009_medicalreportupload"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_profiles, migrations.RunPython.noop),
+    ]
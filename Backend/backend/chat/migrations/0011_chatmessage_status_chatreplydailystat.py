@@ -0,0 +1,72 @@
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+STATUS_CHOICES = [
+    ("ok", "OK"),
+    ("fallback", "Fallback"),
+    ("provider_error", "Provider error"),
+    ("timeout", "Timeout"),
+]
+
+
+def backfill_reply_outcomes(apps, schema_editor):
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    ChatReplyDailyStat = apps.get_model("chat", "ChatReplyDailyStat")
+
+    # One-time scan so historic fallback replies keep showing up in the health view.
+    ChatMessage.objects.filter(sender="bot", message__icontains="something went wrong").update(status="fallback")
+    rows = (
+        ChatMessage.objects.filter(sender="bot")
+        .annotate(day=TruncDate("created_at"))
+        .values("day", "status")
+        .annotate(total=Count("id"))
+    )
+    ChatReplyDailyStat.objects.bulk_create(
+        [ChatReplyDailyStat(day=row["day"], status=row["status"], count=row["total"]) for row in rows if row["day"]],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0010_backfill_user_profiles"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatReplyDailyStat",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("status", models.CharField(choices=STATUS_CHOICES, max_length=20)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("total_latency_ms", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="chatmessage",
+            name="latency_ms",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="chatmessage",
+            name="status",
+            field=models.CharField(choices=STATUS_CHOICES, default="ok", max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(fields=["sender", "created_at"], name="chat_msg_sender_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(fields=["sender", "status"], name="chat_msg_sender_status_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="chatreplydailystat",
+            constraint=models.UniqueConstraint(fields=("day", "status"), name="chat_reply_stat_day_status_uniq"),
+        ),
+        migrations.RunPython(backfill_reply_outcomes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+def create_state_row(apps, schema_editor):
+    MedicalDataState = apps.get_model("chat", "MedicalDataState")
+    MedicalDataState.objects.get_or_create(pk=1, defaults={"version": 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0011_chatmessage_status_chatreplydailystat"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MedicalDataState",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("version", models.PositiveBigIntegerField(default=1)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_state_row, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+import json
+import zlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def compress_snapshots(apps, schema_editor):
+    MedicalDataVersion = apps.get_model("chat", "MedicalDataVersion")
+    for version in MedicalDataVersion.objects.all().iterator():
+        snapshot = version.snapshot if isinstance(version.snapshot, list) else []
+        version.payload = zlib.compress(json.dumps(snapshot, separators=(",", ":")).encode("utf-8"))
+        version.entry_count = len(snapshot)
+        version.is_checkpoint = True
+        version.save(update_fields=["payload", "entry_count", "is_checkpoint"])
+
+
+def expand_snapshots(apps, schema_editor):
+    MedicalDataVersion = apps.get_model("chat", "MedicalDataVersion")
+    for version in MedicalDataVersion.objects.filter(is_checkpoint=True).iterator():
+        version.snapshot = json.loads(zlib.decompress(bytes(version.payload)).decode("utf-8"))
+        version.save(update_fields=["snapshot"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0012_medicaldatastate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="medicaldataversion",
+            name="payload",
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.AddField(
+            model_name="medicaldataversion",
+            name="is_checkpoint",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="medicaldataversion",
+            name="checkpoint",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="deltas",
+                to="chat.medicaldataversion",
+            ),
+        ),
+        migrations.AddField(
+            model_name="medicaldataversion",
+            name="depth",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="medicaldataversion",
+            name="entry_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(compress_snapshots, expand_snapshots),
+        migrations.RemoveField(
+            model_name="medicaldataversion",
+            name="snapshot",
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0013_medicaldataversion_deltas"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="chatsession",
+            index=models.Index(fields=["user", "updated_at"], name="chat_session_user_updated_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0014_chatsession_updated_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="adminauditlog",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0015_alter_adminauditlog_created_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="adminauditlog",
+            index=models.Index(fields=["created_at", "id"], name="chat_audit_created_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="medicaldataversion",
+            index=models.Index(fields=["created_at", "id"], name="chat_version_created_id_idx"),
+        ),
+    ]
@@ -0,0 +1,87 @@
+import re
+import unicodedata
+
+from django.db import migrations, models, transaction
+import django.db.models.deletion
+
+
+TRIGRAM_INDEXES = {
+    "chat_user_email_trgm_idx": "email",
+    "chat_user_first_name_trgm_idx": "first_name",
+    "chat_user_last_name_trgm_idx": "last_name",
+}
+# Frozen copy of chat.text_utils.tokenize as of this migration, so later tokenizer changes do not alter it.
+TOKEN_RE = re.compile(r"[^\W_]+")
+MAX_TOKEN_LENGTH = 64
+
+
+def tokenize(value):
+    decomposed = unicodedata.normalize("NFKD", str(value or ""))
+    normalized = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(normalized)]
+
+
+def backfill_tokens(apps, schema_editor):
+    User = apps.get_model("auth", "User")
+    UserSearchToken = apps.get_model("chat", "UserSearchToken")
+    rows = []
+    for user in User.objects.only("id", "email", "first_name", "last_name").iterator(chunk_size=2000):
+        tokens = set(tokenize(user.email)) | set(tokenize(user.first_name)) | set(tokenize(user.last_name))
+        rows.extend(UserSearchToken(user_id=user.id, token=token) for token in tokens)
+        if len(rows) >= 5000:
+            UserSearchToken.objects.bulk_create(rows)
+            rows = []
+    UserSearchToken.objects.bulk_create(rows)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except Exception:
+        # Without the extension (or the privilege to create it) searches still work, unindexed.
+        return
+    for name, column in TRIGRAM_INDEXES.items():
+        # Matches the UPPER(col::text) LIKE expression Django emits for icontains.
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON auth_user USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0016_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserSearchToken",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("token", models.CharField(max_length=64)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_tokens",
+                        to="auth.user",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["token", "user"], name="chat_user_search_token_idx")],
+            },
+        ),
+        migrations.RunPython(backfill_tokens, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
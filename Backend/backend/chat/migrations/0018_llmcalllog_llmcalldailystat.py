@@ -0,0 +1,73 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+STATUS_CHOICES = [
+    ("ok", "OK"),
+    ("error", "Error"),
+    ("timeout", "Timeout"),
+    ("shed", "Shed"),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0017_usersearchtoken"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LLMCallLog",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("model", models.CharField(max_length=120)),
+                ("purpose", models.CharField(max_length=30)),
+                ("status", models.CharField(choices=STATUS_CHOICES, default="ok", max_length=20)),
+                ("prompt_tokens", models.PositiveIntegerField(default=0)),
+                ("completion_tokens", models.PositiveIntegerField(default=0)),
+                ("latency_ms", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="llm_calls",
+                        to="auth.user",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["created_at"], name="chat_llm_call_created_idx"),
+                    models.Index(fields=["user", "created_at"], name="chat_llm_call_user_idx"),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="LLMCallDailyStat",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("purpose", models.CharField(max_length=30)),
+                ("model", models.CharField(max_length=120)),
+                ("status", models.CharField(choices=STATUS_CHOICES, max_length=20)),
+                ("latency_bucket_ms", models.PositiveIntegerField()),
+                ("calls", models.PositiveIntegerField(default=0)),
+                ("prompt_tokens", models.PositiveBigIntegerField(default=0)),
+                ("completion_tokens", models.PositiveBigIntegerField(default=0)),
+                ("total_latency_ms", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "purpose", "model", "status", "latency_bucket_ms"),
+                        name="chat_llm_stat_bucket_uniq",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+
+
+ATTEMPT_CHOICES = [
+    ("primary", "Primary"),
+    ("hedge", "Hedge"),
+]
+
+
+def backfill_wins(apps, schema_editor):
+    LLMCallLog = apps.get_model("chat", "LLMCallLog")
+    LLMCallDailyStat = apps.get_model("chat", "LLMCallDailyStat")
+    LLMCallLog.objects.exclude(status="ok").update(won=False)
+    LLMCallDailyStat.objects.filter(status="ok").update(wins=models.F("calls"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0018_llmcalllog_llmcalldailystat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="llmcalllog",
+            name="attempt",
+            field=models.CharField(choices=ATTEMPT_CHOICES, default="primary", max_length=10),
+        ),
+        migrations.AddField(
+            model_name="llmcalllog",
+            name="won",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="llmcalldailystat",
+            name="attempt",
+            field=models.CharField(choices=ATTEMPT_CHOICES, default="primary", max_length=10),
+        ),
+        migrations.AddField(
+            model_name="llmcalldailystat",
+            name="wins",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_wins, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name="llmcalldailystat",
+            name="chat_llm_stat_bucket_uniq",
+        ),
+        migrations.AddConstraint(
+            model_name="llmcalldailystat",
+            constraint=models.UniqueConstraint(
+                fields=("day", "purpose", "model", "status", "attempt", "latency_bucket_ms"),
+                name="chat_llm_stat_attempt_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0019_llm_call_attempts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatsession",
+            name="reports",
+            field=models.ManyToManyField(blank=True, related_name="chat_sessions", to="chat.medicalreportanalysis"),
+        ),
+        migrations.CreateModel(
+            name="ReportChunk",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("position", models.PositiveIntegerField()),
+                ("source", models.CharField(blank=True, default="", max_length=255)),
+                ("text", models.TextField()),
+                ("terms", models.JSONField(default=dict)),
+                ("length", models.PositiveIntegerField(default=0)),
+                (
+                    "report",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="chat.medicalreportanalysis",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("report", "position"), name="chat_report_chunk_position_uniq"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,122 @@
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FULL_TEXT_INDEXES = {
+    "chat_msg_fts_idx": ("chat_chatmessage", "message"),
+    "chat_report_fts_idx": ("chat_medicalreportanalysis", "extracted_text || ' ' || analysis"),
+}
+# Frozen copy of chat.text_utils.index_tokens as of this migration, so later tokenizer changes do not alter it.
+TOKEN_RE = re.compile(r"[^\W_]+")
+MAX_TOKEN_LENGTH = 64
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from had has have how i if in is it its me my of on or "
+    "should so than that the their them there these they this to was we were what when which who why will "
+    "with you your".split()
+)
+
+
+def index_tokens(value):
+    decomposed = unicodedata.normalize("NFKD", str(value or ""))
+    normalized = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    tokens = (token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(normalized))
+    return [token for token in tokens if token not in STOPWORDS]
+
+
+def _postings(Posting, user_id, text, **target):
+    return [
+        Posting(user_id=user_id, token=token, frequency=count, **target)
+        for token, count in Counter(index_tokens(text)).items()
+    ]
+
+
+def backfill_postings(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        return
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    MedicalReportAnalysis = apps.get_model("chat", "MedicalReportAnalysis")
+    Posting = apps.get_model("chat", "HistorySearchPosting")
+    rows = []
+    messages = ChatMessage.objects.filter(session__user__isnull=False).values_list("id", "session__user_id", "message")
+    for message_id, user_id, text in messages.iterator(chunk_size=2000):
+        rows.extend(_postings(Posting, user_id, text, message_id=message_id))
+        if len(rows) >= 5000:
+            Posting.objects.bulk_create(rows)
+            rows = []
+    reports = MedicalReportAnalysis.objects.values_list("id", "user_id", "extracted_text", "analysis")
+    for report_id, user_id, extracted_text, analysis in reports.iterator(chunk_size=500):
+        rows.extend(_postings(Posting, user_id, f"{extracted_text}\n{analysis}", report_id=report_id))
+        if len(rows) >= 5000:
+            Posting.objects.bulk_create(rows)
+            rows = []
+    Posting.objects.bulk_create(rows)
+
+
+def create_full_text_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, (table, expression) in FULL_TEXT_INDEXES.items():
+        # Matches MESSAGE_VECTOR / REPORT_VECTOR in chat.history_search.
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (to_tsvector('english', {expression}))")
+
+
+def drop_full_text_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in FULL_TEXT_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0020_report_chunks"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HistorySearchPosting",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("token", models.CharField(max_length=64)),
+                ("frequency", models.PositiveIntegerField(default=1)),
+                (
+                    "message",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="chat.chatmessage",
+                    ),
+                ),
+                (
+                    "report",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="chat.medicalreportanalysis",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="history_search_postings",
+                        to="auth.user",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["user", "token"], name="chat_history_posting_idx")],
+            },
+        ),
+        migrations.RunPython(backfill_postings, migrations.RunPython.noop),
+        migrations.RunPython(create_full_text_indexes, drop_full_text_indexes),
+    ]
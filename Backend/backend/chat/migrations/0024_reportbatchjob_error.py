@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0023_reportbatchjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reportbatchjob",
+            name="error",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 # Create your models here.
@@ -6,15 +7,50 @@ from django.contrib.auth.models import User
 class ChatSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_sessions", null=True, blank=True)
     title = models.CharField(max_length=120, blank=True, default="")
+    # Stored report analyses this conversation can draw on.
+    reports = models.ManyToManyField("MedicalReportAnalysis", related_name="chat_sessions", blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "updated_at"], name="chat_session_user_updated_idx"),
+        ]
 
 
 class ChatMessage(models.Model):
+    STATUS_CHOICES = [
+        ("ok", "OK"),
+        ("fallback", "Fallback"),
+        ("provider_error", "Provider error"),
+        ("timeout", "Timeout"),
+    ]
+
     session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name="messages")
     sender = models.CharField(max_length=10)  # "user" or "bot"
     message = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="ok")
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["sender", "created_at"], name="chat_msg_sender_created_idx"),
+            models.Index(fields=["sender", "status"], name="chat_msg_sender_status_idx"),
+        ]
+
+
+class ChatReplyDailyStat(models.Model):
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=ChatMessage.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+    total_latency_ms = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "status"], name="chat_reply_stat_day_status_uniq"),
+        ]
+
 
 class UserProfile(models.Model):
     GENDER_CHOICES = [
@@ -35,21 +71,53 @@ class UserProfile(models.Model):
     preferred_theme = models.CharField(max_length=20, choices=THEME_CHOICES, default="light")
 
 
+class UserSearchToken(models.Model):
+    # One normalized word of a user's email or name, for index-backed prefix search.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="search_tokens")
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["token", "user"], name="chat_user_search_token_idx"),
+        ]
+
+
 class AdminAuditLog(models.Model):
     actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="admin_audit_logs")
     action = models.CharField(max_length=120)
     entity_type = models.CharField(max_length=60, blank=True, default="")
     entity_id = models.CharField(max_length=60, blank=True, default="")
     details = models.JSONField(default=dict, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the action happens; rows are written later in batches.
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="chat_audit_created_id_idx"),
+        ]
 
 
 class MedicalDataVersion(models.Model):
     actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="medical_data_versions")
     note = models.CharField(max_length=255, blank=True, default="")
-    snapshot = models.JSONField(default=list, blank=True)
+    # zlib-compressed JSON: the full dataset for checkpoints, otherwise a delta against the previous version.
+    payload = models.BinaryField(default=bytes)
+    is_checkpoint = models.BooleanField(default=True)
+    checkpoint = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="deltas")
+    depth = models.PositiveIntegerField(default=0)
+    entry_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="chat_version_created_id_idx"),
+        ]
+
+
+class MedicalDataState(models.Model):
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
 
 class MedicalReportAnalysis(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="medical_report_analyses")
@@ -61,11 +129,127 @@ class MedicalReportAnalysis(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+class ReportBatchJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="report_batch_jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    groups = models.PositiveIntegerField(default=0)
+    # Per-group results in the order groups finish; the summary is set when the whole batch is done.
+    results = models.JSONField(default=list, blank=True)
+    summary = models.JSONField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Also the heartbeat of the worker running the job; see report_batch.fail_stale_jobs.
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ReportBlob(models.Model):
+    # One stored copy per distinct file content; uploads share it and it is reclaimed at refcount 0.
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="medical_reports/blobs/")
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 class MedicalReportUpload(models.Model):
     report = models.ForeignKey(MedicalReportAnalysis, on_delete=models.CASCADE, related_name="uploads")
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="medical_report_uploads")
+    # For blob-backed uploads this names the blob's file; older uploads own their file.
     file = models.FileField(upload_to="medical_reports/%Y/%m/%d/")
+    blob = models.ForeignKey(ReportBlob, on_delete=models.PROTECT, null=True, blank=True, related_name="uploads")
     original_name = models.CharField(max_length=255)
     content_type = models.CharField(max_length=120, blank=True, default="")
     size = models.BigIntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+
+
+class ReportChunk(models.Model):
+    # Written once when a report is analyzed; chat turns rank these instead of re-reading extracted_text.
+    report = models.ForeignKey(MedicalReportAnalysis, on_delete=models.CASCADE, related_name="chunks")
+    position = models.PositiveIntegerField()
+    source = models.CharField(max_length=255, blank=True, default="")
+    text = models.TextField()
+    terms = models.JSONField(default=dict)
+    length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["report", "position"], name="chat_report_chunk_position_uniq"),
+        ]
+
+
+class HistorySearchPosting(models.Model):
+    # One normalized word of a chat message or report, for history search off PostgreSQL. user is
+    # denormalized so a lookup never joins through sessions.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="history_search_postings")
+    token = models.CharField(max_length=64)
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    report = models.ForeignKey(MedicalReportAnalysis, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    frequency = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "token"], name="chat_history_posting_idx"),
+        ]
+
+
+class LLMCallLog(models.Model):
+    STATUS_CHOICES = [
+        ("ok", "OK"),
+        ("error", "Error"),
+        ("timeout", "Timeout"),
+        ("shed", "Shed"),
+    ]
+    ATTEMPT_CHOICES = [
+        ("primary", "Primary"),
+        ("hedge", "Hedge"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="llm_calls")
+    model = models.CharField(max_length=120)
+    purpose = models.CharField(max_length=30)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="ok")
+    attempt = models.CharField(max_length=10, choices=ATTEMPT_CHOICES, default="primary")
+    # False for a reply that was discarded because the other attempt answered first.
+    won = models.BooleanField(default=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    # Set when the call finishes; rows are written later in batches.
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="chat_llm_call_created_idx"),
+            models.Index(fields=["user", "created_at"], name="chat_llm_call_user_idx"),
+        ]
+
+
+class LLMCallDailyStat(models.Model):
+    # One row per latency bucket, so percentiles come from the rollup without touching LLMCallLog.
+    day = models.DateField()
+    purpose = models.CharField(max_length=30)
+    model = models.CharField(max_length=120)
+    status = models.CharField(max_length=20, choices=LLMCallLog.STATUS_CHOICES)
+    attempt = models.CharField(max_length=10, choices=LLMCallLog.ATTEMPT_CHOICES, default="primary")
+    latency_bucket_ms = models.PositiveIntegerField()
+    calls = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    total_latency_ms = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "purpose", "model", "status", "attempt", "latency_bucket_ms"],
+                name="chat_llm_stat_attempt_uniq",
+            ),
+        ]
@@ -0,0 +1,133 @@
+import hashlib
+import os
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+
+
+PAGINATION_COUNT_CACHE_TIMEOUT = int(os.getenv("PAGINATION_COUNT_CACHE_TIMEOUT", "30"))
+CURSOR_SALT = "chat.pagination.cursor"
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(ordering, values):
+    # Full isoformat keeps microseconds, which the keyset comparison needs to stay exact.
+    values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+    return signing.dumps({"o": list(ordering), "v": values}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, ordering):
+    try:
+        payload = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature as exc:
+        raise InvalidCursor("Invalid cursor.") from exc
+    # A cursor only makes sense for the ordering it was issued with.
+    if payload.get("o") != list(ordering) or len(payload.get("v") or []) != len(ordering):
+        raise InvalidCursor("Cursor does not match the requested ordering.")
+    return payload["v"]
+
+
+def _is_nullable(model, name):
+    try:
+        return model._meta.get_field(name).null
+    except FieldDoesNotExist:
+        return False
+
+
+def _order_expressions(model, ordering):
+    expressions = []
+    for key in ordering:
+        name = key.lstrip("-")
+        if not _is_nullable(model, name):
+            # A plain ORDER BY lets the database walk an index.
+            expressions.append(key)
+        elif key.startswith("-"):
+            expressions.append(F(name).desc(nulls_last=True))
+        else:
+            expressions.append(F(name).asc(nulls_last=True))
+    return expressions
+
+
+def _after(model, ordering, values):
+    """Rows strictly after values in ordering, with NULLs sorted last."""
+    condition = Q(pk__in=[])
+    equal = Q()
+    for key, value in zip(ordering, values):
+        name = key.lstrip("-")
+        nullable = _is_nullable(model, name)
+        if value is None:
+            step = Q(pk__in=[])
+            same = Q(**{f"{name}__isnull": True})
+        else:
+            lookup = "lt" if key.startswith("-") else "gt"
+            step = Q(**{f"{name}__{lookup}": value})
+            if nullable:
+                step |= Q(**{f"{name}__isnull": True})
+            same = Q(**{name: value})
+        condition |= equal & step
+        equal &= same
+
+    # Bound the leading key as a plain range too so an index on it can seek instead of scan.
+    first, value = ordering[0], values[0]
+    if value is not None and not _is_nullable(model, first.lstrip("-")):
+        lookup = "lte" if first.startswith("-") else "gte"
+        condition &= Q(**{f"{first.lstrip('-')}__{lookup}": value})
+    return condition
+
+
+def cached_count(queryset):
+    """Count rows, reusing a recent result for the same query across requests and workers."""
+    key = "chat:page-count:" + hashlib.sha256(str(queryset.query).encode("utf-8")).hexdigest()
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, PAGINATION_COUNT_CACHE_TIMEOUT)
+    return total
+
+
+def _include_total(request):
+    return (request.query_params.get("include_total") or "").strip().lower() in {"1", "true", "yes"}
+
+
+def paginate(request, queryset, ordering, *, page, page_size, offset):
+    """Page a queryset by ordering (which must end in a unique key).
+
+    Requests carrying a ``cursor`` parameter (empty for the first page) use keyset pagination and only
+    return a total when ``include_total`` is set, reusing a count up to PAGINATION_COUNT_CACHE_TIMEOUT
+    old; other requests keep page/offset pagination with an exact total.
+    Returns (rows, pagination) and raises InvalidCursor for a tampered or mismatched cursor.
+    """
+    queryset = queryset.order_by(*_order_expressions(queryset.model, ordering))
+    keyset = "cursor" in request.query_params
+    total = None
+    if keyset:
+        token = (request.query_params.get("cursor") or "").strip()
+        window = queryset
+        if token:
+            window = queryset.filter(_after(queryset.model, ordering, decode_cursor(token, ordering)))
+        rows = list(window[: page_size + 1])
+        if _include_total(request):
+            total = cached_count(queryset)
+    else:
+        rows = list(queryset[offset : offset + page_size + 1])
+        total = queryset.count()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(ordering, [getattr(last, key.lstrip("-")) for key in ordering])
+
+    pagination = {"page_size": page_size, "has_more": has_more, "next_cursor": next_cursor}
+    if not keyset:
+        pagination["page"] = page
+    if total is not None:
+        pagination["total"] = total
+        pagination["total_pages"] = (total + page_size - 1) // page_size
+    return rows, pagination
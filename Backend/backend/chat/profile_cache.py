@@ -0,0 +1,79 @@
+import json
+import os
+
+from django.core.cache import cache
+
+from .api_utils import build_etag
+from .models import UserProfile
+
+
+PROFILE_CACHE_TIMEOUT = int(os.getenv("PROFILE_CACHE_TIMEOUT", "300"))
+PROFILE_CACHE_PREFIX = "chat:profile-view:v2"
+ALLOWED_THEMES = {"light", "dark"}
+
+
+def _cache_key(user_id):
+    return f"{PROFILE_CACHE_PREFIX}:{user_id}"
+
+
+def normalize_theme(value):
+    return value if value in ALLOWED_THEMES else "light"
+
+
+def _build_view(user, profile):
+    full_name = f"{user.first_name} {user.last_name}".strip()
+    view = {
+        "id": user.id,
+        "name": full_name or user.username,
+        "email": user.email,
+        "is_active": user.is_active,
+        "is_staff": user.is_staff,
+        "is_superuser": user.is_superuser,
+        "date_joined": user.date_joined.isoformat() if user.date_joined else None,
+        "birth_date": profile.birth_date.isoformat() if profile.birth_date else None,
+        "gender": profile.gender,
+        "preferred_theme": normalize_theme(profile.preferred_theme),
+    }
+    # Hashed once per cache fill so conditional GETs never re-serialize the view.
+    view["etag"] = build_etag("profile-view", json.dumps(view, sort_keys=True))
+    return view
+
+
+def _load_profile(user):
+    profile = UserProfile.objects.filter(user_id=user.id).first()
+    if profile is None:
+        # Accounts created before the signup signal existed may still lack a row.
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+    return profile
+
+
+def get_profile_view(user):
+    key = _cache_key(user.id)
+    view = cache.get(key)
+    if view is None:
+        view = _build_view(user, _load_profile(user))
+        cache.set(key, view, PROFILE_CACHE_TIMEOUT)
+    return view
+
+
+def get_profile_views(users):
+    users = list(users)
+    keys = {_cache_key(user.id): user for user in users}
+    cached = cache.get_many(list(keys.keys()))
+    views = {keys[key].id: view for key, view in cached.items()}
+
+    missing = [user for user in users if user.id not in views]
+    if missing:
+        profiles = {profile.user_id: profile for profile in UserProfile.objects.filter(user__in=missing)}
+        fresh = {}
+        for user in missing:
+            profile = profiles.get(user.id) or _load_profile(user)
+            view = _build_view(user, profile)
+            views[user.id] = view
+            fresh[_cache_key(user.id)] = view
+        cache.set_many(fresh, PROFILE_CACHE_TIMEOUT)
+    return views
+
+
+def invalidate_profile_view(user_id):
+    cache.delete(_cache_key(user_id))
@@ -0,0 +1,90 @@
+import math
+import os
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import ChatMessage, ChatReplyDailyStat
+
+
+REPLY_HEALTH_WINDOW_MINUTES = int(os.getenv("REPLY_HEALTH_WINDOW_MINUTES", "60"))
+REPLY_HEALTH_SAMPLE_LIMIT = int(os.getenv("REPLY_HEALTH_SAMPLE_LIMIT", "5000"))
+REPLY_STATUSES = [status for status, _ in ChatMessage.STATUS_CHOICES]
+FALLBACK_STATUSES = {"fallback", "provider_error", "timeout"}
+ERROR_STATUSES = {"provider_error", "timeout"}
+
+
+def _bump_daily_stat(day, status, latency_ms):
+    changes = {"count": F("count") + 1, "total_latency_ms": F("total_latency_ms") + latency_ms}
+    if ChatReplyDailyStat.objects.filter(day=day, status=status).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            ChatReplyDailyStat.objects.create(day=day, status=status, count=1, total_latency_ms=latency_ms)
+    except IntegrityError:
+        # Another worker created today's row first.
+        ChatReplyDailyStat.objects.filter(day=day, status=status).update(**changes)
+
+
+def record_bot_reply(session, message, status="ok", latency_ms=None):
+    reply = ChatMessage.objects.create(
+        session=session,
+        sender="bot",
+        message=message,
+        status=status,
+        latency_ms=latency_ms,
+    )
+    _bump_daily_stat(reply.created_at.date(), status, latency_ms or 0)
+    return reply
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def reply_health_summary():
+    totals = {status: 0 for status in REPLY_STATUSES}
+    for row in ChatReplyDailyStat.objects.values("status").annotate(total=Sum("count")):
+        totals[row["status"]] = row["total"] or 0
+
+    since = timezone.now() - timedelta(minutes=REPLY_HEALTH_WINDOW_MINUTES)
+    recent = list(
+        ChatMessage.objects.filter(sender="bot", created_at__gte=since)
+        .order_by("-created_at")
+        .values_list("status", "latency_ms")[:REPLY_HEALTH_SAMPLE_LIMIT]
+    )
+    recent_counts = {status: 0 for status in REPLY_STATUSES}
+    for status, _ in recent:
+        recent_counts[status] = recent_counts.get(status, 0) + 1
+    latencies = sorted(latency for _, latency in recent if latency is not None)
+    sample_size = len(recent)
+
+    last_bot_at = (
+        ChatMessage.objects.filter(sender="bot").order_by("-created_at").values_list("created_at", flat=True).first()
+    )
+    return {
+        "fallback_reply_count": sum(totals[status] for status in FALLBACK_STATUSES),
+        "last_bot_message_at": last_bot_at.isoformat() if last_bot_at else None,
+        "totals_by_status": totals,
+        "recent": {
+            "window_minutes": REPLY_HEALTH_WINDOW_MINUTES,
+            "replies": sample_size,
+            "by_status": recent_counts,
+            "error_rate": (
+                round(sum(recent_counts[s] for s in ERROR_STATUSES) / sample_size, 4) if sample_size else 0.0
+            ),
+            "fallback_rate": (
+                round(sum(recent_counts[s] for s in FALLBACK_STATUSES) / sample_size, 4) if sample_size else 0.0
+            ),
+            "latency_ms": {
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "p99": _percentile(latencies, 99),
+            },
+        },
+    }
@@ -0,0 +1,375 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.files.uploadedfile import UploadedFile
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .ai_engine import llm_engine
+from .document_parser import parse_uploaded_attachments, persist_ocr_debug_output
+from .models import MedicalReportAnalysis, MedicalReportUpload, ReportBatchJob
+from .report_previews import schedule_previews
+from .report_retrieval import index_reports
+from .report_storage import build_upload, delete_new_blobs_on_error
+
+
+# OCR shells out to tesseract and PDF parsing releases the GIL often enough, so threads scale here.
+REPORT_BATCH_EXTRACT_WORKERS = int(os.getenv("REPORT_BATCH_EXTRACT_WORKERS", "4"))
+# Report calls also go through the LLM scheduler at batch priority; this bounds one batch's share.
+REPORT_BATCH_LLM_WORKERS = int(os.getenv("REPORT_BATCH_LLM_WORKERS", "2"))
+REPORT_BATCH_LLM_RETRIES = int(os.getenv("REPORT_BATCH_LLM_RETRIES", "3"))
+REPORT_BATCH_MAX_GROUPS = int(os.getenv("REPORT_BATCH_MAX_GROUPS", "20"))
+# Batches submitted over the API run one after another in a background thread of the web worker.
+REPORT_BATCH_JOB_WORKERS = int(os.getenv("REPORT_BATCH_JOB_WORKERS", "1"))
+# That worker touches updated_at of its queued and running jobs this often; a job whose worker died
+# stops beating and is failed once it has been silent for REPORT_BATCH_JOB_STALE_SECONDS.
+REPORT_BATCH_JOB_HEARTBEAT_SECONDS = float(os.getenv("REPORT_BATCH_JOB_HEARTBEAT_SECONDS", "30"))
+REPORT_BATCH_JOB_STALE_SECONDS = int(os.getenv("REPORT_BATCH_JOB_STALE_SECONDS", "300"))
+REPORT_BATCH_SPOOL_PREFIX = "report-batch-"
+STALE_JOB_ERROR = "The server stopped while processing this batch. Please submit it again."
+ANALYSIS_FALLBACK = "Could not generate report analysis at the moment. Please try again."
+ANALYSIS_PROMPT = """
+You are a medical report analysis assistant.
+Provide concise, structured output with sections:
+1) Key Findings
+2) Potential Concerns
+3) Suggested Follow-up Questions for Doctor
+4) Lifestyle/Monitoring Suggestions
+5) Safety Note
+
+Rules:
+- Do not give final diagnosis.
+- If data is unclear, say what is missing.
+- Keep output patient-friendly.
+"""
+
+
+def analyze_report_text(extracted_text, user=None, priority="batch"):
+    analysis = llm_engine.complete(
+        [
+            {"role": "system", "content": ANALYSIS_PROMPT},
+            {"role": "user", "content": f"Analyze this medical report text:\n\n{extracted_text}"},
+        ],
+        priority=priority,
+        purpose="report_analysis",
+        user=user,
+        temperature=0.2,
+        max_completion_tokens=600,
+        top_p=1,
+    )
+    return analysis.strip()
+
+
+def combine_extracted_docs(extracted_docs):
+    return "\n\n".join(f"FILE: {doc.get('name', 'report')}\n{doc.get('text', '')}" for doc in extracted_docs).strip()
+
+
+def default_title(title, used_files):
+    title = (title or "").strip()
+    if not title:
+        title = f"Analysis - {used_files[0] if used_files else 'Medical Report'}"
+    return title[:180]
+
+
+class ReportGroup:
+    """Files analyzed together as one MedicalReportAnalysis (one patient's visit, one folder)."""
+
+    def __init__(self, title, files):
+        self.title = title
+        self.files = files
+        self.status = "pending"
+        self.error = ""
+        self.parsed = None
+        self.combined_text = ""
+        self.analysis = ""
+        self.report = None
+        self.extract_seconds = 0.0
+        self.llm_seconds = 0.0
+
+    def result(self):
+        return {
+            "title": self.title,
+            "files": [getattr(f, "name", "") for f in self.files],
+            "status": self.status,
+            "error": self.error,
+            "report_id": self.report.id if self.report else None,
+            "warnings": (self.parsed or {}).get("warnings", []),
+        }
+
+
+def _in_worker(fn, group):
+    try:
+        fn(group)
+    finally:
+        connections.close_all()
+    return group
+
+
+def _extract(group):
+    started = time.perf_counter()
+    try:
+        parsed = parse_uploaded_attachments(group.files)
+        if not parsed.get("ok"):
+            group.status, group.error = "invalid", parsed.get("error", "Could not parse uploaded files.")
+            return
+        group.parsed = parsed
+        group.combined_text = combine_extracted_docs(parsed.get("extracted_docs", []))
+        if not group.combined_text:
+            group.status, group.error = "extraction_failed", "Could not extract readable text from uploaded report(s)."
+    except Exception as exc:
+        group.status, group.error = "error", f"Extraction failed: {exc.__class__.__name__}."
+    finally:
+        group.extract_seconds = time.perf_counter() - started
+
+
+def _analyze(group, user):
+    started = time.perf_counter()
+    try:
+        for attempt in range(REPORT_BATCH_LLM_RETRIES + 1):
+            try:
+                group.analysis = analyze_report_text(group.combined_text, user=user)
+                break
+            except llm_engine.LLMOverloaded as exc:
+                # Batch work can wait; back off as the scheduler suggests instead of failing the group.
+                if attempt == REPORT_BATCH_LLM_RETRIES:
+                    group.status, group.error = "llm_busy", "The assistant stayed busy; retry this group later."
+                    return
+                time.sleep(exc.retry_after)
+        group.status = "analyzed"
+    except Exception as exc:
+        group.status, group.error = "error", f"Analysis failed: {exc.__class__.__name__}."
+    finally:
+        group.llm_seconds = time.perf_counter() - started
+
+
+def _save(group, user):
+    """Store one analyzed group with its uploads; a failure here only fails this group."""
+    started = time.perf_counter()
+    try:
+        with delete_new_blobs_on_error(), transaction.atomic():
+            used_files = group.parsed.get("used_files", [])
+            report = MedicalReportAnalysis.objects.create(
+                user=user,
+                title=default_title(group.title, used_files),
+                file_names=used_files,
+                extracted_text=group.combined_text,
+                analysis=group.analysis or ANALYSIS_FALLBACK,
+                warnings=group.parsed.get("warnings", []),
+            )
+            uploads = MedicalReportUpload.objects.bulk_create(
+                [build_upload(uploaded, report=report, uploaded_by=user) for uploaded in group.files]
+            )
+            schedule_previews(uploads)
+            index_reports([report])
+        group.report, group.status = report, "ok"
+    except Exception as exc:
+        group.status, group.error = "error", f"Saving failed: {exc.__class__.__name__}."
+        return time.perf_counter() - started
+
+    try:
+        persist_ocr_debug_output(
+            session_id=f"report_{report.id}",
+            user_id=user.id,
+            extracted_details=group.parsed.get("extracted_details", []),
+            warnings=group.parsed.get("warnings", []),
+        )
+    except Exception:
+        pass
+    return time.perf_counter() - started
+
+
+def analyze_report_groups(
+    groups, *, user, extract_workers=REPORT_BATCH_EXTRACT_WORKERS, llm_workers=REPORT_BATCH_LLM_WORKERS, on_progress=None
+):
+    """Extract, analyze and store many report groups; returns a summary with per-group results.
+
+    Extraction and LLM calls run in separate bounded pools, so a group is analyzed as soon as its own
+    text is ready, and it is saved as soon as its analysis is done.
+    """
+    started = time.perf_counter()
+    save_seconds = 0.0
+    with ThreadPoolExecutor(max(extract_workers, 1), thread_name_prefix="report-extract") as extract_pool, \
+            ThreadPoolExecutor(max(llm_workers, 1), thread_name_prefix="report-llm") as llm_pool:
+        extracting = [extract_pool.submit(_in_worker, _extract, group) for group in groups]
+        analyzing = []
+        for future in as_completed(extracting):
+            group = future.result()
+            if group.status == "pending":
+                analyzing.append(llm_pool.submit(_in_worker, lambda g: _analyze(g, user), group))
+            elif on_progress:
+                on_progress(group)
+        # Saves run here, on the calling thread, so they use its database connection.
+        for future in as_completed(analyzing):
+            group = future.result()
+            if group.status == "analyzed":
+                save_seconds += _save(group, user)
+            if on_progress:
+                on_progress(group)
+
+    elapsed = time.perf_counter() - started
+    succeeded = sum(1 for group in groups if group.status == "ok")
+    files = sum(len(group.files) for group in groups)
+    return {
+        "groups": len(groups),
+        "files": files,
+        "succeeded": succeeded,
+        "failed": len(groups) - succeeded,
+        "elapsed_seconds": round(elapsed, 2),
+        "save_seconds": round(save_seconds, 2),
+        "extract_seconds_total": round(sum(group.extract_seconds for group in groups), 2),
+        "llm_seconds_total": round(sum(group.llm_seconds for group in groups), 2),
+        "groups_per_minute": round(len(groups) / elapsed * 60, 1) if elapsed else None,
+        "files_per_second": round(files / elapsed, 2) if elapsed else None,
+        "extract_workers": extract_workers,
+        "llm_workers": llm_workers,
+        "results": [group.result() for group in groups],
+    }
+
+
+_job_executor = ThreadPoolExecutor(max(REPORT_BATCH_JOB_WORKERS, 1), thread_name_prefix="report-batch-job")
+
+
+def _spool(uploaded, directory):
+    """Copy a request upload to a file the background job owns; Django deletes its temp file with the request."""
+    handle, path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(handle, "wb") as f:
+        for chunk in uploaded.chunks():
+            f.write(chunk)
+    return UploadedFile(
+        open(path, "rb"), name=uploaded.name, content_type=getattr(uploaded, "content_type", None), size=uploaded.size
+    )
+
+
+_live_jobs = set()
+_live_lock = threading.Lock()
+_heartbeat_thread = None
+
+
+def _heartbeat():
+    while True:
+        time.sleep(REPORT_BATCH_JOB_HEARTBEAT_SECONDS)
+        with _live_lock:
+            job_ids = list(_live_jobs)
+        if not job_ids:
+            continue
+        close_old_connections()
+        try:
+            ReportBatchJob.objects.filter(id__in=job_ids, status__in=["queued", "running"]).update(
+                updated_at=timezone.now()
+            )
+        except Exception:
+            pass
+        close_old_connections()
+
+
+def _enqueue(job_id, groups, spool_dir):
+    global _heartbeat_thread
+    with _live_lock:
+        _live_jobs.add(job_id)
+        if _heartbeat_thread is None or not _heartbeat_thread.is_alive():
+            _heartbeat_thread = threading.Thread(target=_heartbeat, name="report-batch-heartbeat", daemon=True)
+            _heartbeat_thread.start()
+    _job_executor.submit(_run_in_job_thread, job_id, groups, spool_dir)
+
+
+def _spool_dir_job_id(path):
+    job_id = path.name[len(REPORT_BATCH_SPOOL_PREFIX):].split("-", 1)[0]
+    return int(job_id) if job_id.isdigit() else None
+
+
+def submit_batch_job(groups, *, user):
+    """Record a ReportBatchJob and analyze its groups in the background once the request commits."""
+    job = ReportBatchJob.objects.create(user=user, groups=len(groups))
+    spool_dir = tempfile.mkdtemp(prefix=f"{REPORT_BATCH_SPOOL_PREFIX}{job.id}-")
+    try:
+        spooled = [ReportGroup(group.title, [_spool(f, spool_dir) for f in group.files]) for group in groups]
+    except Exception:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        raise
+    transaction.on_commit(lambda: _enqueue(job.id, spooled, spool_dir))
+    return job
+
+
+def fail_stale_jobs(jobs=None):
+    """Fail queued or running jobs whose worker stopped beating and drop their spooled uploads.
+
+    Without ``jobs`` every job is checked. Returns the number of jobs failed.
+    """
+    jobs = ReportBatchJob.objects.all() if jobs is None else jobs
+    cutoff = timezone.now() - timedelta(seconds=REPORT_BATCH_JOB_STALE_SECONDS)
+    job_ids = list(jobs.filter(status__in=["queued", "running"], updated_at__lt=cutoff).values_list("id", flat=True))
+    if not job_ids:
+        return 0
+    # Re-checking the heartbeat in the UPDATE keeps a job that beat in the meantime alive.
+    failed = ReportBatchJob.objects.filter(
+        id__in=job_ids, status__in=["queued", "running"], updated_at__lt=cutoff
+    ).update(status="failed", error=STALE_JOB_ERROR, updated_at=timezone.now())
+    failed_ids = set(ReportBatchJob.objects.filter(id__in=job_ids, status="failed").values_list("id", flat=True))
+    # Spools live on the worker's host, so only the ones on this host can go; the sweep command gets the rest.
+    for path in Path(tempfile.gettempdir()).glob(f"{REPORT_BATCH_SPOOL_PREFIX}*"):
+        if _spool_dir_job_id(path) in failed_ids:
+            shutil.rmtree(path, ignore_errors=True)
+    return failed
+
+
+def remove_orphaned_spools():
+    """Delete spool directories on this host whose job is no longer queued or running.
+
+    Directories younger than REPORT_BATCH_JOB_STALE_SECONDS are kept: their job may not have committed yet.
+    """
+    paths = list(Path(tempfile.gettempdir()).glob(f"{REPORT_BATCH_SPOOL_PREFIX}*"))
+    live = set(
+        ReportBatchJob.objects.filter(
+            id__in=[_spool_dir_job_id(path) for path in paths], status__in=["queued", "running"]
+        ).values_list("id", flat=True)
+    )
+    removed = 0
+    for path in paths:
+        old = time.time() - path.stat().st_mtime > REPORT_BATCH_JOB_STALE_SECONDS
+        if path.is_dir() and old and _spool_dir_job_id(path) not in live:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _run_in_job_thread(job_id, groups, spool_dir):
+    try:
+        run_batch_job(job_id, groups, spool_dir)
+    finally:
+        with _live_lock:
+            _live_jobs.discard(job_id)
+        connections.close_all()
+
+
+def run_batch_job(job_id, groups, spool_dir):
+    # A job already failed as stale (or picked up elsewhere) is not run again.
+    if not ReportBatchJob.objects.filter(id=job_id, status="queued").update(status="running", updated_at=timezone.now()):
+        for group in groups:
+            for uploaded in group.files:
+                uploaded.close()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+        return None
+    job = ReportBatchJob.objects.select_related("user").get(id=job_id)
+
+    def progress(group):
+        job.results.append(group.result())
+        job.save(update_fields=["results", "updated_at"])
+
+    try:
+        job.summary = analyze_report_groups(groups, user=job.user, on_progress=progress)
+        job.status = "done"
+    except Exception as exc:
+        job.status, job.error = "failed", f"Batch failed: {exc.__class__.__name__}."
+    finally:
+        for group in groups:
+            for uploaded in group.files:
+                uploaded.close()
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    job.save(update_fields=["status", "error", "summary", "updated_at"])
+    return job
@@ -0,0 +1,169 @@
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .ai_engine.single_flight import SingleFlight
+from .models import ReportBlob
+
+REPORT_PREVIEW_SIZE = int(os.getenv("REPORT_PREVIEW_SIZE", "320"))
+REPORT_PREVIEW_QUALITY = int(os.getenv("REPORT_PREVIEW_QUALITY", "75"))
+# Render previews right after upload; otherwise the first preview request renders it.
+REPORT_PREVIEW_IN_BACKGROUND = os.getenv("REPORT_PREVIEW_IN_BACKGROUND", "True").lower() == "true"
+PREVIEW_DIR = "medical_reports/previews"
+PREVIEW_CONTENT_TYPE = "image/webp"
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+
+_flight = SingleFlight(shared=False)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-preview")
+
+
+def _storage():
+    return ReportBlob._meta.get_field("file").storage
+
+
+def preview_kind(upload):
+    extension = os.path.splitext(upload.original_name or upload.file.name or "")[1].lower()
+    content_type = (upload.content_type or "").lower()
+    if extension == ".pdf" or content_type == "application/pdf":
+        return "pdf"
+    if extension in IMAGE_EXTENSIONS or content_type.startswith("image/"):
+        return "image"
+    return None
+
+
+def has_preview(upload):
+    """Whether a preview may exist; only blob-backed uploads have the content hash previews are keyed by."""
+    return upload.blob_id is not None and preview_kind(upload) is not None
+
+
+def preview_name(sha256, size=REPORT_PREVIEW_SIZE):
+    return f"{PREVIEW_DIR}/{sha256[:2]}/{sha256}-{size}.webp"
+
+
+def _missing_marker(name):
+    # Written when nothing can be rendered (e.g. a text-only PDF), so later requests skip re-parsing.
+    return name[: -len(".webp")] + ".none"
+
+
+def _pdf_first_image(file):
+    from pypdf import PdfReader
+
+    reader = PdfReader(file)
+    if not reader.pages:
+        return None
+    images = list(reader.pages[0].images)
+    if not images:
+        return None
+    # The page scan or the largest figure, not a logo.
+    largest = max(images, key=lambda item: item.image.width * item.image.height)
+    return largest.image
+
+
+def render_preview(file, kind, size=REPORT_PREVIEW_SIZE):
+    """WebP bytes no larger than size x size, or None when the file has nothing to show."""
+    from PIL import Image, ImageOps
+
+    if kind == "pdf":
+        image = _pdf_first_image(file)
+        if image is None:
+            return None
+    else:
+        image = Image.open(file)
+        # Decode JPEGs at the smallest 1/2-1/8 scale still covering the preview; thumbnail() alone stops at 2x.
+        image.draft("RGB", (size, size))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    if image.mode not in {"RGB", "RGBA"}:
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    output = io.BytesIO()
+    image.save(output, "WEBP", quality=REPORT_PREVIEW_QUALITY, method=4)
+    return output.getvalue()
+
+
+def _unrenderable_errors():
+    """Errors that mean the file itself cannot be previewed, as opposed to a failure worth retrying."""
+    from PIL import Image, UnidentifiedImageError
+    from pypdf.errors import PdfReadError
+
+    return (UnidentifiedImageError, Image.DecompressionBombError, PdfReadError)
+
+
+def _put(storage, name, data):
+    """Store data under exactly name; a copy another process rendered meanwhile is simply replaced."""
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Remote storage without local paths: keep whichever copy landed first.
+        saved = storage.save(name, ContentFile(data))
+        if saved != name:
+            storage.delete(saved)
+        return name
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=directory, prefix=".preview-", suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return name
+
+
+def _generate(sha256, source_name, kind, size):
+    storage = _storage()
+    name = preview_name(sha256, size)
+    if storage.exists(name):
+        return name
+    if storage.exists(_missing_marker(name)):
+        return None
+    try:
+        with storage.open(source_name, "rb") as source:
+            data = render_preview(source, kind, size)
+    except FileNotFoundError:
+        return None
+    except _unrenderable_errors():
+        # Corrupt or unsupported files are remembered like files without an image; anything else
+        # (I/O, memory) propagates and is retried on the next request.
+        data = None
+    if data is None:
+        _put(storage, _missing_marker(name), b"")
+        return None
+    return _put(storage, name, data)
+
+
+def _render_once(sha256, source_name, kind, size):
+    return _flight.do(f"{sha256}:{size}", lambda: _generate(sha256, source_name, kind, size))
+
+
+def ensure_preview(upload, size=REPORT_PREVIEW_SIZE):
+    """Storage name of the upload's preview, rendering it on first use; None when there is none."""
+    if not has_preview(upload):
+        return None
+    return _render_once(upload.blob.sha256, upload.blob.file.name, preview_kind(upload), size)
+
+
+def schedule_previews(uploads):
+    """Render previews off the request path once the uploads are committed."""
+    if not REPORT_PREVIEW_IN_BACKGROUND:
+        return
+    jobs = {upload.blob.sha256: (upload.blob.file.name, preview_kind(upload)) for upload in uploads if has_preview(upload)}
+
+    def submit():
+        for sha256, (source_name, kind) in jobs.items():
+            _executor.submit(_render_once, sha256, source_name, kind, REPORT_PREVIEW_SIZE)
+
+    if jobs:
+        transaction.on_commit(submit)
+
+
+def delete_previews(sha256, size=REPORT_PREVIEW_SIZE):
+    name = preview_name(sha256, size)
+    for stored in (name, _missing_marker(name)):
+        _storage().delete(stored)
@@ -0,0 +1,156 @@
+import math
+import os
+from collections import Counter
+
+from django.db import transaction
+
+from .models import ReportChunk
+from .text_utils import index_tokens
+
+
+REPORT_CHUNK_CHARS = int(os.getenv("REPORT_CHUNK_CHARS", "800"))
+REPORT_CHUNK_OVERLAP_CHARS = int(os.getenv("REPORT_CHUNK_OVERLAP_CHARS", "150"))
+REPORT_RETRIEVAL_TOP_K = int(os.getenv("REPORT_RETRIEVAL_TOP_K", "4"))
+# Hard cap on the document block, however many reports are attached.
+REPORT_CONTEXT_MAX_CHARS = int(os.getenv("REPORT_CONTEXT_MAX_CHARS", "3500"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+FILE_HEADER = "FILE: "
+
+
+def index_terms(text):
+    return Counter(index_tokens(text))
+
+
+def _split_long(line, size):
+    while len(line) > size:
+        cut = line.rfind(" ", 0, size)
+        cut = cut if cut > size // 2 else size
+        yield line[:cut]
+        line = line[cut:].lstrip()
+    if line:
+        yield line
+
+
+def chunk_text(text, size=REPORT_CHUNK_CHARS, overlap=REPORT_CHUNK_OVERLAP_CHARS):
+    """Split extracted report text into (source file, chunk) pairs along line boundaries.
+
+    Chunks never cross a `FILE:` header, and each one repeats up to `overlap` trailing characters of
+    the previous chunk so a value is not separated from its label.
+    """
+    chunks = []
+    source, lines, length = "", [], 0
+
+    def flush(keep_overlap):
+        nonlocal lines, length
+        body = "\n".join(lines).strip()
+        if body:
+            chunks.append((source, body))
+        carried = []
+        if keep_overlap:
+            for line in reversed(lines):
+                if sum(len(item) + 1 for item in carried) + len(line) > overlap:
+                    break
+                carried.insert(0, line)
+        lines, length = carried, sum(len(item) + 1 for item in carried)
+
+    for raw in (text or "").splitlines():
+        line = raw.strip()
+        if line.startswith(FILE_HEADER):
+            flush(False)
+            source = line[len(FILE_HEADER):].strip()[:255]
+            continue
+        if not line:
+            continue
+        for piece in _split_long(line, size):
+            if lines and length + len(piece) + 1 > size:
+                flush(True)
+            lines.append(piece)
+            length += len(piece) + 1
+    flush(False)
+    return chunks
+
+
+def build_chunks(report):
+    chunks = []
+    for position, (source, body) in enumerate(chunk_text(report.extracted_text)):
+        terms = index_terms(body)
+        chunks.append(
+            ReportChunk(
+                report=report, position=position, source=source, text=body,
+                terms=dict(terms), length=sum(terms.values()),
+            )
+        )
+    return chunks
+
+
+def index_reports(reports):
+    """(Re)build the chunks of each report in one transaction."""
+    reports = list(reports)
+    if not reports:
+        return 0
+    chunks = [chunk for report in reports for chunk in build_chunks(report)]
+    with transaction.atomic():
+        ReportChunk.objects.filter(report__in=reports).delete()
+        ReportChunk.objects.bulk_create(chunks, batch_size=500)
+    return len(chunks)
+
+
+def ensure_indexed(reports):
+    """Index reports created before chunking existed; already-indexed reports are left alone."""
+    reports = list(reports)
+    indexed = set(ReportChunk.objects.filter(report__in=reports).values_list("report_id", flat=True).distinct())
+    return index_reports(report for report in reports if report.id not in indexed)
+
+
+def rank_chunks(chunks, query, top_k=REPORT_RETRIEVAL_TOP_K):
+    """BM25 over the given chunks; returns the best `top_k` (score, chunk) pairs with a positive score."""
+    query_terms = set(index_terms(query))
+    if not chunks or not query_terms:
+        return []
+    total = len(chunks)
+    average_length = sum(chunk.length for chunk in chunks) / total or 1
+    document_frequency = Counter(term for chunk in chunks for term in query_terms if term in chunk.terms)
+    scored = []
+    for chunk in chunks:
+        score = 0.0
+        for term in query_terms:
+            frequency = chunk.terms.get(term)
+            if not frequency:
+                continue
+            df = document_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / average_length)
+            score += idf * frequency * (BM25_K1 + 1) / norm
+        if score > 0:
+            scored.append((score, chunk))
+    scored.sort(key=lambda item: (-item[0], item[1].report_id, item[1].position))
+    return scored[:top_k]
+
+
+def session_document_context(session, query, top_k=REPORT_RETRIEVAL_TOP_K, max_chars=REPORT_CONTEXT_MAX_CHARS):
+    """The document block for one chat turn: the attached-report chunks that match the question.
+
+    Questions that match nothing ("explain my report", "summarize the results") get the opening chunks
+    of every attached report instead, so the model still sees them.
+    """
+    chunks = list(
+        ReportChunk.objects.filter(report__chat_sessions=session)
+        .select_related("report")
+        .only("id", "report_id", "report__title", "report__created_at", "position", "source", "text", "terms", "length")
+    )
+    selected = [chunk for _, chunk in rank_chunks(chunks, query, top_k)]
+    if not selected:
+        # Round-robin over reports so one long report does not crowd out the others.
+        selected = sorted(chunks, key=lambda chunk: (chunk.position, chunk.report_id))
+    parts, used = [], 0
+    for chunk in selected:
+        label = chunk.report.title or f"Report {chunk.report_id}"
+        if chunk.source:
+            label = f"{label} / {chunk.source}"
+        part = f"[{label}, {chunk.report.created_at:%Y-%m-%d}]\n{chunk.text}"
+        if used + len(part) > max_chars:
+            break
+        parts.append(part)
+        used += len(part)
+    return "\n\n".join(parts)
@@ -0,0 +1,136 @@
+import hashlib
+import mimetypes
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.deletion import ProtectedError
+
+from .models import MedicalReportUpload, ReportBlob
+from .report_previews import delete_previews
+
+BLOB_DIR = "medical_reports/blobs"
+
+_new_blob_files = ContextVar("new_blob_files", default=None)
+
+
+def _storage():
+    return ReportBlob._meta.get_field("file").storage
+
+
+def content_digest(uploaded):
+    digest, size = hashlib.sha256(), 0
+    uploaded.seek(0)
+    for chunk in uploaded.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    uploaded.seek(0)
+    return digest.hexdigest(), size
+
+
+def blob_name(sha256, original_name=""):
+    extension = os.path.splitext(original_name or "")[1].lower()[:10]
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+@contextmanager
+def delete_new_blobs_on_error():
+    """Wrap a transaction that stores blobs so files written for new blobs are deleted if it rolls back.
+
+    Storage writes are not transactional: without this a failed upload leaves a file no row points at.
+    """
+    names = []
+    token = _new_blob_files.set(names)
+    try:
+        yield
+    except BaseException:
+        storage = _storage()
+        for name in names:
+            storage.delete(name)
+        raise
+    finally:
+        _new_blob_files.reset(token)
+
+
+def _add_reference(sha256):
+    if ReportBlob.objects.filter(sha256=sha256).update(refcount=F("refcount") + 1):
+        return ReportBlob.objects.get(sha256=sha256)
+    return None
+
+
+def store_blob(uploaded):
+    """The blob for this file's content with one more reference; only new content is written to storage."""
+    sha256, size = content_digest(uploaded)
+    blob = _add_reference(sha256)
+    if blob is not None:
+        return blob
+
+    storage = _storage()
+    # Always a fresh file: a path that already exists may belong to a blob being reclaimed right now,
+    # whose file is about to be deleted. Storage appends a suffix when the name is taken.
+    name = storage.save(blob_name(sha256, uploaded.name), uploaded)
+    try:
+        with transaction.atomic():
+            blob = ReportBlob.objects.create(sha256=sha256, file=name, size=size, refcount=1)
+    except IntegrityError:
+        # A concurrent upload of the same content created the row first.
+        blob = _add_reference(sha256)
+        if blob.file.name != name:
+            storage.delete(name)
+        return blob
+    except Exception:
+        storage.delete(name)
+        raise
+    names = _new_blob_files.get()
+    if names is not None:
+        names.append(name)
+    return blob
+
+
+def build_upload(uploaded, *, report, uploaded_by):
+    """An unsaved MedicalReportUpload backed by a (possibly shared) blob.
+
+    Call inside the saving transaction, wrapped in delete_new_blobs_on_error().
+    """
+    blob = store_blob(uploaded)
+    name = (uploaded.name or "").strip() or "report_file"
+    return MedicalReportUpload(
+        report=report,
+        uploaded_by=uploaded_by,
+        blob=blob,
+        file=blob.file.name,
+        original_name=name,
+        content_type=(getattr(uploaded, "content_type", "") or mimetypes.guess_type(name)[0] or "").strip(),
+        size=blob.size,
+    )
+
+
+def reclaim_blob(blob_id):
+    """Delete the blob row and its file if nothing references it any more."""
+    with transaction.atomic():
+        # The row lock re-checks refcount, so a concurrent store_blob that revived the blob wins.
+        blob = ReportBlob.objects.select_for_update().filter(id=blob_id, refcount=0).first()
+        if blob is None:
+            return False
+        name, sha256 = blob.file.name, blob.sha256
+        try:
+            blob.delete()
+        except ProtectedError:
+            return False
+    _storage().delete(name)
+    delete_previews(sha256)
+    return True
+
+
+def release_upload(upload):
+    """Drop a deleted upload's reference; its blob goes once the last reference's transaction commits."""
+    if upload.blob_id is None:
+        # Uploads from before blob storage own their file outright.
+        if upload.file:
+            storage, name = upload.file.storage, upload.file.name
+            transaction.on_commit(lambda: storage.delete(name))
+        return
+    ReportBlob.objects.filter(id=upload.blob_id, refcount__gt=0).update(refcount=F("refcount") - 1)
+    transaction.on_commit(lambda: reclaim_blob(upload.blob_id))
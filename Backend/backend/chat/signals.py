@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import history_search
+from .models import ChatMessage, MedicalReportAnalysis, MedicalReportUpload, UserProfile
+from .profile_cache import invalidate_profile_view
+from .report_storage import release_upload
+from .user_search import SEARCH_FIELDS, index_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def create_profile_on_signup(sender, instance, created, **kwargs):
+    if created:
+        UserProfile.objects.get_or_create(user=instance)
+    invalidate_profile_view(instance.id)
+
+
+@receiver(post_save, sender=User)
+def update_user_search_tokens(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save only last_login; skip re-tokenizing unless a searchable field may have changed.
+    if created or update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+        index_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def drop_cached_profile_for_user(sender, instance, **kwargs):
+    invalidate_profile_view(instance.id)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def drop_cached_profile(sender, instance, **kwargs):
+    invalidate_profile_view(instance.user_id)
+
+
+@receiver(post_save, sender=ChatMessage)
+def index_message_for_search(sender, instance, created, **kwargs):
+    if created and history_search.active_backend() == "index":
+        history_search.index_messages([instance])
+
+
+@receiver(post_save, sender=MedicalReportAnalysis)
+def index_report_for_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & {"extracted_text", "analysis"}:
+        return
+    if history_search.active_backend() == "index":
+        history_search.index_reports([instance])
+
+
+@receiver(post_delete, sender=MedicalReportUpload)
+def release_upload_blob(sender, instance, **kwargs):
+    # Also runs for cascades (report or account deletion), so no path leaks a reference.
+    release_upload(instance)
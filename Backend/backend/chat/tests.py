@@ -1,3 +1,1355 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from groq import InternalServerError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import authentication, history_search, metrics, report_batch, report_previews, report_retrieval, report_storage, throttling
+from .ai_engine import llm_engine, providers, routing
+from .ai_engine.scheduler import LLMOverloaded, LLMScheduler
+from .ai_engine.single_flight import SingleFlight, flight_key
+from .audit import audit_log_writer, log_admin_action
+from .fake_llm import FakeLLMServer
+from .knowledge_store import MedicalDataConflict, MedicalDataValidationError, MedicalKnowledgeStore, medical_store
+from .llm_usage import llm_call_writer, usage_summary
+from .medical_history import materialize, record_version
+from .middleware import SESSION_REFRESHED_AT_KEY
+from .models import (
+    AdminAuditLog,
+    ChatMessage,
+    ChatReplyDailyStat,
+    ChatSession,
+    HistorySearchPosting,
+    LLMCallDailyStat,
+    LLMCallLog,
+    MedicalDataVersion,
+    MedicalReportAnalysis,
+    MedicalReportUpload,
+    ReportBatchJob,
+    ReportBlob,
+    ReportChunk,
+    UserProfile,
+)
+
+User = get_user_model()
+
+
+def setUpModule():
+    # Write audit rows synchronously so they land inside each test's transaction.
+    for writer in (audit_log_writer, llm_call_writer):
+        writer.flush_interval = 0
+        writer.batch_size = 1
+    # Deterministic offline replies; tests that need a provider swap it in explicitly.
+    providers._provider = providers.EchoProvider()
+    # Hedged calls run in threads; only the routing tests turn it on.
+    routing.LLM_HEDGING_ENABLED = False
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="ada@example.com",
+            email="ada@example.com",
+            password="s3cure-Passw0rd",
+            first_name="Ada",
+            last_name="Lovelace",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_profile_created_at_signup(self):
+        self.assertTrue(UserProfile.objects.filter(user=self.user).exists())
+
+    def test_identity_reads_are_query_free_on_warm_cache(self):
+        self.client.get("/api/auth/me/")
+        for url in ("/api/auth/me/", "/api/auth/profile/", "/api/auth/settings/"):
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_settings_update_invalidates_cached_view(self):
+        self.client.get("/api/auth/settings/")
+        response = self.client.patch("/api/auth/settings/", {"preferred_theme": "dark"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/api/auth/me/")
+        self.assertEqual(response.data["data"]["user"]["preferred_theme"], "dark")
+
+    def test_profile_update_invalidates_cached_view(self):
+        self.client.get("/api/auth/profile/")
+        self.client.patch("/api/auth/profile/", {"name": "Ada King", "gender": "female"}, format="json")
+        profile = self.client.get("/api/auth/profile/").data["data"]["profile"]
+        self.assertEqual(profile["name"], "Ada King")
+        self.assertEqual(profile["gender"], "female")
+
+    def test_admin_update_invalidates_cached_view(self):
+        admin = User.objects.create_user(username="root@example.com", email="root@example.com", is_staff=True)
+        self.client.get("/api/auth/me/")
+        admin_client = APIClient()
+        admin_client.force_authenticate(user=admin)
+        admin_client.patch(f"/api/admin/users/{self.user.id}/", {"is_staff": True}, format="json")
+        # A real request loads the user afresh; force_authenticate would keep the stale instance.
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+        self.assertTrue(self.client.get("/api/auth/me/").data["data"]["user"]["is_staff"])
+
+
+    def test_authorization_flags_are_never_served_from_the_cached_view(self):
+        self.client.get("/api/auth/me/")
+        # Another worker's admin change: this process's cached view is not invalidated.
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.client.force_authenticate(user=User.objects.get(pk=self.user.pk))
+        user = self.client.get("/api/auth/me/").data["data"]["user"]
+        self.assertEqual((user["is_staff"], user["is_admin"]), (True, True))
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication._local_entries.clear()
+        self.user = User.objects.create_user(username="grace@example.com", email="grace@example.com", password="x")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_token_resolution_is_cached(self):
+        self.client.get("/api/auth/me/")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/auth/me/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_holds_no_password_hash_and_other_fields_load_on_demand(self):
+        self.client.get("/api/auth/me/")
+        payload = cache.get(authentication._cache_key(self.token.key))
+        self.assertNotIn(self.user.password, repr(payload))
+        user, _ = authentication.CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "grace@example.com")
+        self.assertTrue(user.check_password("x"))
+
+    def test_logout_invalidates_cached_token(self):
+        self.client.get("/api/auth/me/")
+        self.client.post("/api/auth/token-logout/")
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 401)
+
+    def test_admin_deactivation_invalidates_cached_token(self):
+        admin = User.objects.create_user(username="root@example.com", email="root@example.com", is_staff=True)
+        self.client.get("/api/auth/me/")
+        admin_client = APIClient()
+        admin_client.force_authenticate(user=admin)
+        admin_client.patch(f"/api/admin/users/{self.user.id}/", {"is_active": False}, format="json")
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 401)
+
+    def test_expired_token_is_rejected_and_rotated_on_login(self):
+        with self._token_ttl(60):
+            Token.objects.filter(pk=self.token.pk).update(created=self.token.created - timedelta(minutes=5))
+            self.assertEqual(self.client.get("/api/auth/me/").status_code, 401)
+            self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+            new_token = authentication.issue_token(self.user)
+            self.assertNotEqual(new_token.key, self.token.key)
+
+    def _token_ttl(self, seconds):
+        return mock.patch.object(authentication, "TOKEN_TTL_SECONDS", seconds)
+
+
+class SessionWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="linus@example.com", email="linus@example.com")
+
+    def _session_writes_per_request(self, requests=20):
+        client = Client()
+        client.force_login(self.user)
+        client.get("/api/sessions/")
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(requests):
+                client.get("/api/sessions/")
+        writes = [
+            q["sql"] for q in ctx.captured_queries
+            if "django_session" in q["sql"] and q["sql"].lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        return len(writes) / requests
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_save_every_request_writes_each_time(self):
+        self.assertEqual(self._session_writes_per_request(), 1)
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=False)
+    def test_sliding_expiry_skips_writes_while_session_is_fresh(self):
+        self.assertEqual(self._session_writes_per_request(), 0)
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=False, SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_signed_cookie_mode_never_touches_session_table(self):
+        self.assertEqual(self._session_writes_per_request(), 0)
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=False, SESSION_COOKIE_AGE=100, SESSION_REFRESH_THRESHOLD=50)
+    def test_session_refreshed_when_remaining_lifetime_is_low(self):
+        client = Client()
+        client.force_login(self.user)
+        client.get("/api/sessions/")
+        session = client.session
+        session[SESSION_REFRESHED_AT_KEY] = session[SESSION_REFRESHED_AT_KEY] - 60
+        session.save()
+        stale = session[SESSION_REFRESHED_AT_KEY]
+        client.get("/api/sessions/")
+        self.assertGreater(client.session[SESSION_REFRESHED_AT_KEY], stale)
+
+
+class ReplyOutcomeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="alan@example.com", email="alan@example.com", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _chat(self, **patch_kwargs):
+        with mock.patch("chat.views.generate_ai_response", **patch_kwargs):
+            return self.client.post("/api/chat/", {"message": "I have a headache"}, format="json")
+
+    def test_outcome_status_recorded_at_write_time(self):
+        self.assertEqual(self._chat(return_value="Rest and hydrate.").data["data"]["reply_status"], "ok")
+        self.assertEqual(self._chat(return_value="").data["data"]["reply_status"], "fallback")
+        self.assertEqual(self._chat(side_effect=RuntimeError("boom")).data["data"]["reply_status"], "provider_error")
+
+        statuses = list(ChatMessage.objects.filter(sender="bot").order_by("id").values_list("status", flat=True))
+        self.assertEqual(statuses, ["ok", "fallback", "provider_error"])
+        self.assertEqual(ChatReplyDailyStat.objects.get(status="ok").count, 1)
+
+    def test_health_reports_outcomes_from_rollups(self):
+        self._chat(return_value="")
+        self._chat(side_effect=RuntimeError("boom"))
+        quality = self.client.get("/api/admin/health/").data["data"]["response_quality"]
+        self.assertEqual(quality["fallback_reply_count"], 2)
+        self.assertEqual(quality["recent"]["replies"], 2)
+        self.assertEqual(quality["recent"]["error_rate"], 0.5)
+
+
+class MedicalKnowledgeStoreTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = Path(self.tmp_dir) / "medical_data.json"
+        self.path.write_text(json.dumps([{"id": 1, "symptoms": ["fever"]}]), encoding="utf-8")
+        patcher = mock.patch.object(medical_store, "path", self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        medical_store._install(None, None)
+
+    def test_other_workers_reload_after_version_bump(self):
+        other_worker = MedicalKnowledgeStore(self.path)
+        self.assertEqual(len(other_worker.data()), 1)
+        medical_store.replace([{"id": 1}, {"id": 2}])
+        self.assertEqual(len(other_worker.data()), 2)
+        self.assertEqual(other_worker.snapshot()[0], medical_store.current_version())
+
+    def test_stale_expected_version_is_rejected(self):
+        version = medical_store.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            medical_store.replace([{"id": 3}], expected_version=version)
+        with self.assertRaises(MedicalDataConflict):
+            medical_store.replace([{"id": 4}], expected_version=version)
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8")), [{"id": 3}])
+        self.assertEqual(
+            sorted(p.name for p in self.path.parent.iterdir()), ["medical_data.json", f"medical_data.json.v{version + 1}"]
+        )
+
+    def test_uncommitted_writes_are_never_read_under_the_committed_version(self):
+        other_worker = MedicalKnowledgeStore(self.path)
+        version = medical_store.current_version()
+        # Fails after the new contents were written, so the transaction rolls back over them.
+        with mock.patch("chat.knowledge_store.transaction.on_commit", side_effect=RuntimeError("commit failed")):
+            with self.assertRaises(RuntimeError):
+                medical_store.replace([{"id": 5}])
+        self.assertEqual(other_worker.snapshot(), (version, [{"id": 1, "symptoms": ["fever"]}]))
+        self.assertEqual(sorted(p.name for p in self.path.parent.iterdir()), ["medical_data.json"])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            new_version = medical_store.replace([{"id": 6}])
+            # Committed in the database but not yet published to the main file.
+            self.assertEqual(other_worker.snapshot(), (new_version, [{"id": 6}]))
+            self.assertEqual(json.loads(self.path.read_text(encoding="utf-8")), [{"id": 1, "symptoms": ["fever"]}])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8")), [{"id": 6}])
+
+    def test_admin_put_returns_conflict_for_stale_version(self):
+        admin = User.objects.create_user(username="root@example.com", email="root@example.com", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        version = client.get("/api/admin/medical-data/").data["data"]["version"]
+        response = client.put("/api/admin/medical-data/", {"medical_data": [], "version": version}, format="json")
+        self.assertEqual(response.status_code, 200)
+        response = client.put("/api/admin/medical-data/", {"medical_data": [], "version": version}, format="json")
+        self.assertEqual(response.status_code, 409)
+
+    def test_patch_applies_entry_operations_and_keeps_prompt_context_in_sync(self):
+        medical_store.prompt_context()
+        version, data, changed = medical_store.patch(
+            [
+                {"op": "update", "id": 1, "entry": {"possible_diagnosis": "Flu", "advice": "Rest", "symptoms": ["fever"]}},
+                {"op": "add", "entry": {"id": 2, "symptoms": ["cough"], "possible_diagnosis": "Cold", "advice": "Fluids"}},
+            ]
+        )
+        self.assertEqual(changed, {1, 2})
+        medical_store._remember(version, data, changed)
+        self.assertEqual(medical_store.prompt_context(), json.dumps(data, indent=2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            version, data, _ = medical_store.patch([{"op": "delete", "id": 1}])
+        self.assertEqual([entry["id"] for entry in data], [2])
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8")), data)
+
+    def test_patch_rejects_invalid_entries_without_writing(self):
+        version = medical_store.current_version()
+        with self.assertRaises(MedicalDataValidationError) as ctx:
+            medical_store.patch([{"op": "add", "entry": {"id": 9, "symptoms": [], "possible_diagnosis": ""}}])
+        self.assertIn("operations[0].symptoms", ctx.exception.errors)
+        self.assertEqual(medical_store.current_version(), version)
+        self.assertEqual(len(json.loads(self.path.read_text(encoding="utf-8"))), 1)
+
+
+class MedicalHistoryTests(TestCase):
+    def test_versions_replay_from_nearest_checkpoint(self):
+        data = [{"id": i, "symptoms": [f"s{i}"], "advice": "rest"} for i in range(1, 41)]
+        expected = []
+        with mock.patch("chat.medical_history.MEDICAL_DATA_CHECKPOINT_INTERVAL", 5):
+            for step in range(12):
+                data = [dict(entry) for entry in data]
+                data[step]["advice"] = f"updated {step}"
+                if step % 3 == 0:
+                    data.pop()
+                if step % 4 == 0:
+                    data.append({"id": 100 + step, "symptoms": [], "advice": "new"})
+                if step == 7:
+                    data.reverse()
+                expected.append((record_version(data).id, data))
+
+        checkpoints = MedicalDataVersion.objects.filter(is_checkpoint=True).count()
+        self.assertGreater(checkpoints, 1)
+        self.assertLess(checkpoints, len(expected))
+        for version_id, snapshot in expected:
+            version = MedicalDataVersion.objects.select_related("checkpoint").get(id=version_id)
+            self.assertEqual(materialize(version), snapshot)
+            self.assertEqual(version.entry_count, len(snapshot))
+
+    def test_unkeyed_data_is_stored_as_checkpoint(self):
+        record_version([{"id": 1}])
+        version = record_version([{"name": "no id"}])
+        self.assertTrue(version.is_checkpoint)
+        self.assertEqual(materialize(version), [{"name": "no id"}])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="tim@example.com", email="tim@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _revalidate(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.data["ok"])
+        return first["ETag"], self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+    def test_unchanged_resources_return_304(self):
+        session = ChatSession.objects.create(user=self.user, title="Headache")
+        for url in ("/api/auth/me/", "/api/sessions/", f"/api/history/{session.id}/", "/api/reports/"):
+            _, second = self._revalidate(url)
+            self.assertEqual(second.status_code, 304, url)
+
+    def test_new_message_changes_session_etags(self):
+        etag, _ = self._revalidate("/api/sessions/")
+        with mock.patch("chat.views.generate_ai_response", return_value="Hydrate."):
+            self.client.post("/api/chat/", {"message": "I feel dizzy"}, format="json")
+        self.assertEqual(self.client.get("/api/sessions/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_theme_change_changes_me_etag(self):
+        etag, _ = self._revalidate("/api/auth/me/")
+        self.client.patch("/api/auth/settings/", {"preferred_theme": "dark"}, format="json")
+        self.assertEqual(self.client.get("/api/auth/me/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AuditLogWriterTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username="root@example.com", email="root@example.com", is_staff=True)
+
+    def test_entries_are_buffered_and_flushed_in_batches(self):
+        flushed = audit_log_writer.stats()["flushed"]
+        with mock.patch.object(audit_log_writer, "batch_size", 3):
+            log_admin_action(self.admin, "first")
+            log_admin_action(self.admin, "second")
+            self.assertEqual(AdminAuditLog.objects.count(), 0)
+            log_admin_action(self.admin, "third")
+        self.assertEqual(AdminAuditLog.objects.count(), 3)
+        self.assertEqual(audit_log_writer.stats()["flushed"], flushed + 3)
+
+    def test_failed_flush_falls_back_to_local_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        fallback_path = Path(tmp_dir) / "audit.jsonl"
+        with mock.patch.object(audit_log_writer, "fallback_path", fallback_path), mock.patch.object(
+            AdminAuditLog.objects, "bulk_create", side_effect=RuntimeError("db down")
+        ):
+            log_admin_action(self.admin, "db_down")
+        lines = fallback_path.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(json.loads(lines[0])["action"], "db_down")
+        self.assertGreaterEqual(audit_log_writer.stats()["fallback"], 1)
+
+    def test_audit_log_listing_sees_buffered_entries(self):
+        with mock.patch.object(audit_log_writer, "batch_size", 10):
+            log_admin_action(self.admin, "medical_data_updated")
+        self.assertEqual(AdminAuditLog.objects.count(), 0)
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        logs = client.get("/api/admin/audit-logs/").data["data"]["logs"]
+        self.assertEqual([log["action"] for log in logs], ["medical_data_updated"])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username="root@example.com", email="root@example.com", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _walk(self, url, key, **params):
+        seen, cursor = [], ""
+        while True:
+            payload = self.client.get(url, {**params, "cursor": cursor, "page_size": 2}).data["data"]
+            seen.extend(item["id"] for item in payload[key])
+            cursor = payload["pagination"]["next_cursor"]
+            if not cursor:
+                return seen, payload["pagination"]
+
+    def test_cursor_walk_covers_rows_sharing_a_timestamp(self):
+        moment = timezone.now()
+        AdminAuditLog.objects.bulk_create(
+            [AdminAuditLog(actor=self.admin, action=f"action-{i}", created_at=moment) for i in range(5)]
+        )
+        ids, pagination = self._walk("/api/admin/audit-logs/", "logs")
+        self.assertEqual(ids, sorted(AdminAuditLog.objects.values_list("id", flat=True), reverse=True))
+        self.assertNotIn("total", pagination)
+
+    def test_cursor_walk_orders_null_sort_keys_last(self):
+        for index in range(3):
+            User.objects.create_user(username=f"u{index}@example.com", email=f"u{index}@example.com")
+        User.objects.filter(email="u1@example.com").update(last_login=timezone.now())
+        ids, _ = self._walk("/api/admin/users/", "users", sort="last_login", dir="desc")
+        expected = [User.objects.get(email="u1@example.com").id] + sorted(
+            User.objects.filter(last_login__isnull=True).values_list("id", flat=True), reverse=True
+        )
+        self.assertEqual(ids, expected)
+
+    def test_offset_pages_keep_totals_and_bad_cursors_are_rejected(self):
+        pagination = self.client.get("/api/admin/users/", {"page": 1}).data["data"]["pagination"]
+        self.assertEqual((pagination["page"], pagination["total"], pagination["total_pages"]), (1, 1, 1))
+        User.objects.create_user(username="new@example.com", email="new@example.com")
+        pagination = self.client.get("/api/admin/users/", {"page": 1}).data["data"]["pagination"]
+        self.assertEqual(pagination["total"], 2)
+        response = self.client.get("/api/admin/audit-logs/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["code"], "INVALID_CURSOR")
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username="root@example.com", email="root@example.com", is_staff=True)
+        self.ada = User.objects.create_user(
+            username="ada@example.com", email="ada@example.com", first_name="Ada", last_name="Lovelace"
+        )
+        self.zoe = User.objects.create_user(
+            username="zoe@clinic.org", email="zoe@clinic.org", first_name="Zoë", last_name="Adams"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def _search(self, query, **params):
+        response = self.client.get("/api/admin/users/", {"q": query, "sort": "relevance", **params})
+        return [user["email"] for user in response.data["data"]["users"]]
+
+    def test_prefix_words_match_in_any_order_and_rank_email_matches_first(self):
+        self.assertEqual(self._search("love ad"), ["ada@example.com"])
+        self.assertEqual(self._search("zoe"), ["zoe@clinic.org"])
+        self.assertEqual(self._search("ada"), ["ada@example.com", "zoe@clinic.org"])
+
+    def test_common_words_do_not_drop_matches(self):
+        User.objects.bulk_create(
+            User(username=f"patient{i}@example.com", email=f"patient{i}@example.com", last_name="Lovelace")
+            for i in range(30)
+        )
+        for user in User.objects.filter(username__startswith="patient"):
+            user.save()
+        response = self.client.get("/api/admin/users/", {"q": "example lovelace", "sort": "relevance"})
+        self.assertEqual(response.data["data"]["pagination"]["total"], 31)
+
+    def test_tokens_follow_profile_changes_but_not_logins(self):
+        self.ada.last_name = "Byron"
+        self.ada.save()
+        self.assertEqual(self._search("byron"), ["ada@example.com"])
+        self.assertEqual(self._search("lovelace"), [])
+        with CaptureQueriesContext(connection) as queries:
+            self.ada.save(update_fields=["last_login"])
+        self.assertFalse(any("chat_usersearchtoken" in query["sql"] for query in queries.captured_queries))
+
+
+class LLMSchedulerTests(TestCase):
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 2
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_waiting_interactive_calls_run_before_batch(self):
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=4, queue_timeout=2, interactive_reserved=0)
+        order = []
+
+        def call(priority):
+            with scheduler.slot(priority):
+                order.append(priority)
+
+        with scheduler.slot("batch"):
+            threads = [threading.Thread(target=call, args=("batch",))]
+            threads[0].start()
+            self._wait_for(lambda: scheduler.stats()["queue_depth"] == 1)
+            threads.append(threading.Thread(target=call, args=("interactive",)))
+            threads[1].start()
+            self._wait_for(lambda: scheduler.stats()["queue_depth"] == 2)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["interactive", "batch"])
+
+    def test_reserved_slots_and_full_queue_shed_immediately(self):
+        scheduler = LLMScheduler(max_in_flight=2, max_queue=0, queue_timeout=2, interactive_reserved=1)
+        with scheduler.slot("batch"):
+            with self.assertRaises(LLMOverloaded) as raised:
+                with scheduler.slot("batch"):
+                    pass
+            with scheduler.slot("interactive"):
+                pass
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(scheduler.stats()["shed"]["batch"], 1)
+
+    def test_shed_chat_turn_returns_503_and_leaves_no_trace(self):
+        user = User.objects.create_user(username="ada@example.com", email="ada@example.com")
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with mock.patch("chat.views.generate_ai_response", side_effect=LLMOverloaded(retry_after=3)):
+            response = client.post("/api/chat/", {"message": "I have a headache"}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "3")
+        self.assertFalse(ChatSession.objects.filter(user=user).exists())
+
+
+@mock.patch.dict(throttling.THROTTLE_RATES, {"chat": (2, 1)})
+class TokenBucketThrottleTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(throttling, "_local_store", throttling.LocalBucketStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _client(self, email):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username=email, email=email))
+        return client
+
+    def _chat(self, client):
+        with mock.patch("chat.views.generate_ai_response", return_value="Rest well."):
+            return client.post("/api/chat/", {"message": "I have a cold"}, format="json")
+
+    def test_burst_is_spent_then_requests_are_rejected_with_retry_after(self):
+        client = self._client("ada@example.com")
+        remaining = [self._chat(client)["X-RateLimit-Remaining"] for _ in range(2)]
+        self.assertEqual(remaining, ["1", "0"])
+        response = self._chat(client)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.data["code"], "RATE_LIMITED")
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+    def test_buckets_are_per_user_and_refill_over_time(self):
+        ada, grace = self._client("ada@example.com"), self._client("grace@example.com")
+        for _ in range(2):
+            self._chat(ada)
+        self.assertEqual(self._chat(grace).status_code, 200)
+        now = time.time()
+        with mock.patch("chat.throttling.time.time", return_value=now + 61):
+            self.assertEqual(self._chat(ada).status_code, 200)
+
+    def test_shared_cache_backend_enforces_the_same_budget(self):
+        cache.clear()
+        with mock.patch.object(throttling, "THROTTLE_BACKEND", "cache"):
+            client = self._client("ada@example.com")
+            statuses = [self._chat(client).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+
+class SingleFlightTests(TestCase):
+    def test_concurrent_identical_prompts_share_one_upstream_call(self):
+        flight = SingleFlight(shared=False, wait_seconds=2)
+        release = threading.Event()
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            release.wait(2)
+            return "Drink water."
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", upstream))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 2
+        while flight.stats()["coalesced_local"] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ["Drink water."] * 3))
+        self.assertEqual(flight.stats()["leaders"], 1)
+
+    def test_prompt_key_ignores_whitespace_noise(self):
+        first = flight_key("m", [{"role": "user", "content": "I have  a fever\n"}], {"temperature": 0.2})
+        second = flight_key("m", [{"role": "user", "content": "I have a fever"}], {"temperature": 0.2})
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, flight_key("m", [{"role": "user", "content": "I have a cough"}], {}))
+
+    def test_worker_reuses_result_published_by_another_worker(self):
+        cache.clear()
+        flight = SingleFlight(shared=True, wait_seconds=2)
+        cache.add("chat:llm-flight:lock:k", "other-worker", 5)
+        cache.set("chat:llm-flight:result:k", "Rest and fluids.", 5)
+        upstream = mock.Mock()
+        self.assertEqual(flight.do("k", upstream), "Rest and fluids.")
+        upstream.assert_not_called()
+        self.assertEqual(flight.stats()["coalesced_shared"], 1)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.metrics_dir = Path(tmp_dir)
+        patcher = mock.patch.object(metrics, "METRICS_DIR", self.metrics_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = User.objects.create_user(username="root@example.com", email="root@example.com", is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_responses_carry_server_timing_with_db_span(self):
+        header = self.client.get("/api/sessions/")["Server-Timing"]
+        self.assertIn("db;dur=", header)
+        self.assertIn("total;dur=", header)
+
+    def test_server_timing_is_staff_only_unless_enabled(self):
+        user = User.objects.create_user(username="pat@example.com", email="pat@example.com")
+        client = APIClient()
+        client.force_authenticate(user=user)
+        self.assertNotIn("Server-Timing", client.get("/api/sessions/"))
+        self.assertNotIn("Server-Timing", APIClient().get("/api/sessions/"))
+        with mock.patch("chat.middleware.SERVER_TIMING_ENABLED", True):
+            self.assertIn("total;dur=", client.get("/api/sessions/")["Server-Timing"])
+
+    def test_metrics_merge_snapshots_from_other_workers(self):
+        self.client.get("/api/sessions/")
+        series = {
+            "name": "http_request_duration_seconds",
+            "labels": {"method": "GET", "route": "api/sessions/", "status": "200"},
+            "buckets": [1000] + [0] * len(metrics.BUCKETS),
+            "sum": 1.0,
+            "count": 1000,
+        }
+        (self.metrics_dir / "metrics-999999.json").write_text(json.dumps([series]), encoding="utf-8")
+        response = self.client.get("/api/admin/metrics/")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn("# TYPE medassist_http_request_duration_seconds histogram", body)
+        count_line = next(
+            line
+            for line in body.splitlines()
+            if line.startswith('medassist_http_request_duration_seconds_count{method="GET",route="api/sessions/"')
+        )
+        self.assertGreater(int(count_line.rsplit(" ", 1)[1]), 1000)
+        self.assertIn('medassist_llm_queue_depth{priority="interactive"} 0', body)
+
+    def test_metrics_are_admin_only(self):
+        user = User.objects.create_user(username="ada@example.com", email="ada@example.com")
+        client = APIClient()
+        client.force_authenticate(user=user)
+        self.assertEqual(client.get("/api/admin/metrics/").status_code, 403)
+
+
+class LLMCallLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="ada@example.com", email="ada@example.com", is_staff=True)
+
+    def _complete(self, content, prompt_tokens, completion_tokens):
+        completion = providers.Completion(content, providers.Usage(prompt_tokens, completion_tokens))
+        with mock.patch.object(providers.EchoProvider, "complete", return_value=completion):
+            return llm_engine.complete(
+                [{"role": "user", "content": content}], purpose="chat", user=self.user, max_completion_tokens=20
+            )
+
+    def test_calls_are_logged_with_usage_and_rolled_up(self):
+        self._complete("first", 100, 20)
+        self._complete("second", 50, 10)
+        log = LLMCallLog.objects.order_by("id").first()
+        self.assertEqual((log.user_id, log.purpose, log.status, log.prompt_tokens), (self.user.id, "chat", "ok", 100))
+        self.assertEqual(sum(LLMCallDailyStat.objects.values_list("calls", flat=True)), 2)
+
+        totals = usage_summary(days=1)["totals"]
+        self.assertEqual((totals["calls"], totals["prompt_tokens"], totals["completion_tokens"]), (2, 150, 30))
+        self.assertEqual(totals["latency_ms"]["p99"], 100)
+
+    def test_shed_and_failed_calls_are_counted_as_errors(self):
+        with mock.patch.object(llm_engine.scheduler, "slot", side_effect=LLMOverloaded(retry_after=1)):
+            with self.assertRaises(LLMOverloaded):
+                self._complete("busy", 0, 0)
+        with mock.patch.object(providers.EchoProvider, "complete", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                llm_engine.complete([{"role": "user", "content": "x"}], purpose="report_analysis")
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        by_day = client.get("/api/admin/llm-usage/", {"days": 1}).data["data"]["by_day"]
+        self.assertEqual(
+            sorted((row["purpose"], row["calls"], row["errors"]) for row in by_day),
+            [("chat", 1, 1), ("report_analysis", 1, 1)],
+        )
+
+
+    def test_failed_rollup_keeps_log_and_stats_together_until_replayed(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        fallback_path = Path(tmp_dir) / "llm.jsonl"
+        with mock.patch.object(llm_call_writer, "fallback_path", fallback_path):
+            with mock.patch.object(llm_call_writer, "on_flush", side_effect=RuntimeError("rollup failed")):
+                self._complete("first", 100, 20)
+            self.assertEqual((LLMCallLog.objects.count(), LLMCallDailyStat.objects.count()), (0, 0))
+            self.assertEqual(llm_call_writer.replay_fallback(), 1)
+        self.assertFalse(fallback_path.exists())
+        self.assertEqual(LLMCallLog.objects.get().prompt_tokens, 100)
+        self.assertEqual(usage_summary(days=1)["totals"]["prompt_tokens"], 100)
+
+
+class FakeLLMServerTests(TestCase):
+    def setUp(self):
+        self.server = FakeLLMServer(latency_ms=0, jitter_ms=0, tokens_per_second=100000, completion_tokens=12).start()
+        self.addCleanup(self.server.stop)
+
+    def _provider(self, name="groq"):
+        base_url = self.server.url if name == "groq" else f"{self.server.url}/openai/v1"
+        return providers.build_provider(name, api_key="local", base_url=base_url, max_retries=0)
+
+    def test_engine_completes_against_the_stand_in(self):
+        for name in ("groq", "openai"):
+            with mock.patch.object(providers, "_provider", self._provider(name)):
+                reply = llm_engine.complete(
+                    [{"role": "user", "content": f"four words via {name}"}], purpose="chat", max_completion_tokens=5
+                )
+            self.assertEqual(len(reply.rstrip(".").split()), 5)
+        logs = LLMCallLog.objects.values_list("status", "prompt_tokens", "completion_tokens")
+        self.assertEqual(list(logs), [("ok", 4, 5)] * 2)
+
+    def test_injected_errors_surface_as_provider_failures(self):
+        self.server.error_rate = 1.0
+        with mock.patch.object(providers, "_provider", self._provider()):
+            with self.assertRaises(InternalServerError):
+                llm_engine.complete([{"role": "user", "content": "hello"}], purpose="chat")
+        self.assertEqual(LLMCallLog.objects.get().status, "error")
+        self.assertEqual(self.server.stats()["errors"], 1)
+
+
+class LLMProviderTests(TestCase):
+    def test_echo_provider_and_per_purpose_models(self):
+        route = {**routing.ROUTES["report_analysis"], "tiers": [[None, "report-model"]]}
+        with mock.patch.dict(routing.ROUTES, {"report_analysis": route}):
+            reply = llm_engine.complete([{"role": "user", "content": "  swollen   ankle "}], purpose="report_analysis")
+        self.assertEqual(reply, "MedAssist is running offline. You asked: swollen ankle")
+        log = LLMCallLog.objects.get()
+        self.assertEqual((log.model, log.prompt_tokens, log.completion_tokens), ("report-model", 2, 8))
+
+    def test_provider_is_built_on_first_use(self):
+        with self.assertRaises(providers.LLMConfigurationError):
+            providers.build_provider("groq", api_key=None, base_url=None)
+        env = {key: value for key, value in os.environ.items() if key not in {"GROQ_API", "GROQ_API_KEY", "LLM_API_KEY"}}
+        script = "import django, sys; django.setup(); import chat.urls; print('groq' in sys.modules)"
+        result = subprocess.run(
+            [sys.executable, "-c", script], env=env, cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.stdout.strip(), "False", result.stderr)
+
+
+class ModelRoutingTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(routing, "LLM_HEDGING_ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tiers_follow_request_class_and_input_size(self):
+        greeting = [{"role": "system", "content": "x" * 5000}, {"role": "user", "content": "hi"}]
+        question = [{"role": "user", "content": "Why does my knee hurt after running? " * 10}]
+        route = {**routing.ROUTES["chat"], "tiers": [[32, "fast-model"], [None, "chat-model"]], "hedge_model": "fast-model"}
+        with mock.patch.dict(routing.ROUTES, {"chat": route}):
+            self.assertEqual(routing.route_for("chat", greeting)[2], "fast-model")
+            self.assertEqual(routing.route_for("chat", question)[2], "chat-model")
+            name, config, _ = routing.route_for("batch", question)
+        self.assertEqual((name, config["hedge_model"]), ("chat", None))
+
+    def test_default_routes_use_one_model_and_bad_overrides_are_ignored(self):
+        if routing.LLM_FAST_MODEL is None:
+            self.assertEqual(routing.ROUTES["chat"]["tiers"], [[None, routing.LLM_CHAT_MODEL]])
+            self.assertIsNone(routing.ROUTES["chat"]["hedge_model"])
+        self.assertEqual(routing.ROUTES["health_probe"]["tiers"][-1][1], os.getenv("LLM_PROBE_MODEL") or routing.LLM_CHAT_MODEL)
+        with self.assertLogs("chat.ai_engine.routing", "ERROR"):
+            self.assertEqual(routing._route_overrides("{not json"), {})
+        with self.assertLogs("chat.ai_engine.routing", "ERROR"):
+            self.assertEqual(routing._route_overrides('{"chat": 5}'), {})
+        self.assertEqual(routing._route_overrides('{"chat": {"slo_ms": 1}}'), {"chat": {"slo_ms": 1}})
+
+    def test_slow_primary_is_hedged_and_both_attempts_are_recorded(self):
+        loser_done = threading.Event()
+
+        class SlowPrimary:
+            def complete(self, model, messages, **params):
+                if model == "primary-model":
+                    time.sleep(0.3)
+                    loser_done.set()
+                return providers.Completion(f"from {model}", providers.Usage(3, 2))
+
+        route = {"tiers": [[None, "primary-model"]], "hedge_model": "hedge-model", "hedge_after_ms": 20, "slo_ms": 100}
+        with mock.patch.dict(routing.ROUTES, {"chat": route}), mock.patch.object(
+            providers, "_provider", SlowPrimary()
+        ), mock.patch.object(llm_call_writer, "batch_size", 1000), mock.patch.object(llm_engine, "router", routing.Router()):
+            # Rows stay buffered until flushed here, so the attempt threads never touch the test database.
+            reply = llm_engine.complete([{"role": "user", "content": "Is this slow?"}], purpose="chat")
+            self.assertTrue(loser_done.wait(2))
+            time.sleep(0.05)
+            llm_call_writer.flush()
+            stats = llm_engine.router.stats()["chat"]
+
+        self.assertEqual(reply, "from hedge-model")
+        rows = LLMCallLog.objects.order_by("attempt").values_list("attempt", "model", "status", "won")
+        self.assertEqual(list(rows), [("hedge", "hedge-model", "ok", True), ("primary", "primary-model", "ok", False)])
+        self.assertEqual((stats["hedged"], stats["hedge_wins"], stats["slo_breaches"]), (1, 1, 0))
+        by_attempt = {row["attempt"]: row for row in usage_summary(days=1)["by_attempt"]}
+        self.assertEqual((by_attempt["hedge"]["win_rate"], by_attempt["primary"]["win_rate"]), (1.0, 0.0))
+
+    def test_failed_primary_falls_back_to_the_hedge_model(self):
+        class BrokenPrimary:
+            def complete(self, model, messages, **params):
+                if model == "primary-model":
+                    raise RuntimeError("upstream down")
+                return providers.Completion("fallback reply", providers.Usage(1, 2))
+
+        route = {"tiers": [[None, "primary-model"]], "hedge_model": "hedge-model", "hedge_after_ms": 5000, "slo_ms": 0}
+        with mock.patch.dict(routing.ROUTES, {"chat": route}), mock.patch.object(
+            providers, "_provider", BrokenPrimary()
+        ), mock.patch.object(llm_call_writer, "batch_size", 1000), mock.patch.object(llm_engine, "router", routing.Router()):
+            started = time.monotonic()
+            reply = llm_engine.complete([{"role": "user", "content": "Anyone there?"}], purpose="chat")
+            elapsed = time.monotonic() - started
+            llm_call_writer.flush()
+            stats = llm_engine.router.stats()["chat"]
+
+        self.assertEqual(reply, "fallback reply")
+        self.assertLess(elapsed, 1)
+        self.assertEqual(stats["fallbacks"], 1)
+        self.assertEqual(sorted(LLMCallLog.objects.values_list("attempt", "status")), [("hedge", "ok"), ("primary", "error")])
+
+
+class MediaTestCase(TestCase):
+    """Files land in a throwaway MEDIA_ROOT, and self.client is signed in as self.user."""
+
+    username = "patient@example.com"
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_patch = override_settings(MEDIA_ROOT=self.media_root)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        self.user = User.objects.create_user(username=self.username, email=self.username)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+
+class ReportBatchTests(MediaTestCase):
+    username = "grace@example.com"
+
+    def setUp(self):
+        super().setUp()
+        # LLM calls run in worker threads; keep their ledger rows buffered until the test flushes them.
+        writer_patch = mock.patch.object(llm_call_writer, "batch_size", 1000)
+        writer_patch.start()
+        self.addCleanup(writer_patch.stop)
+        debug_patch = mock.patch.object(report_batch, "persist_ocr_debug_output")
+        debug_patch.start()
+        self.addCleanup(debug_patch.stop)
+
+    def _file(self, name, text="Hemoglobin: 11.2 g/dL"):
+        return SimpleUploadedFile(name, text.encode("utf-8"), content_type="text/plain")
+
+    def _run_submitted_job(self, executor):
+        # The job thread would close connections; run its body on the test connection instead.
+        _, job_id, groups, spool_dir = executor.submit.call_args.args
+        self.addCleanup(report_batch._live_jobs.discard, job_id)
+        report_batch.run_batch_job(job_id, groups, spool_dir)
+        self.assertFalse(Path(spool_dir).exists())
+
+    def test_batch_endpoint_queues_a_job_that_saves_each_group(self):
+        with mock.patch.object(report_batch, "_job_executor") as executor, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/reports/analyze-batch/",
+                {
+                    "patient-001": [self._file("cbc.txt"), self._file("lipids.txt", "LDL: 160 mg/dL")],
+                    "patient-002": [self._file("glucose.txt", "Fasting glucose: 131 mg/dL")],
+                    "patient-003": [self._file("scan.exe")],
+                    "patient-004": [self._file("empty.txt", "   ")],
+                },
+                format="multipart",
+            )
+        self.assertEqual(response.status_code, 202)
+        job_url = f"/api/reports/analyze-batch/{response.data['data']['job']['id']}/"
+        self.assertEqual(self.client.get(job_url).data["data"]["job"]["status"], "queued")
+        self._run_submitted_job(executor)
+        llm_call_writer.flush()
+
+        job = self.client.get(job_url).data["data"]["job"]
+        summary = job["summary"]
+        self.assertEqual((job["status"], job["completed"]), ("done", 4))
+        statuses = {item["title"]: item["status"] for item in summary["results"]}
+        self.assertEqual(
+            statuses,
+            {"patient-001": "ok", "patient-002": "ok", "patient-003": "invalid", "patient-004": "extraction_failed"},
+        )
+        self.assertEqual((summary["groups"], summary["succeeded"], summary["files"]), (4, 2, 5))
+        self.assertEqual(len(job["reports"]), 2)
+        report = MedicalReportAnalysis.objects.get(title="patient-001")
+        self.assertEqual(report.file_names, ["cbc.txt", "lipids.txt"])
+        self.assertIn("FILE: lipids.txt", report.extracted_text)
+        self.assertEqual(MedicalReportUpload.objects.filter(report=report).count(), 2)
+        self.assertEqual(LLMCallLog.objects.filter(purpose="report_analysis").count(), 2)
+
+        other = User.objects.create_user(username="ivan@example.com", email="ivan@example.com")
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(job_url).status_code, 404)
+
+    def test_jobs_whose_worker_died_are_failed_and_their_spools_removed(self):
+        stale = ReportBatchJob.objects.create(user=self.user, groups=2, status="running")
+        live = ReportBatchJob.objects.create(user=self.user, groups=1)
+        stale_spool = Path(tempfile.mkdtemp(prefix=f"{report_batch.REPORT_BATCH_SPOOL_PREFIX}{stale.id}-"))
+        orphan_spool = Path(tempfile.mkdtemp(prefix=f"{report_batch.REPORT_BATCH_SPOOL_PREFIX}999999-"))
+        self.addCleanup(shutil.rmtree, orphan_spool, True)
+        silent_since = timezone.now() - timedelta(seconds=report_batch.REPORT_BATCH_JOB_STALE_SECONDS + 1)
+        os.utime(orphan_spool, (silent_since.timestamp(), silent_since.timestamp()))
+        fresh_spool = Path(tempfile.mkdtemp(prefix=f"{report_batch.REPORT_BATCH_SPOOL_PREFIX}999998-"))
+        self.addCleanup(shutil.rmtree, fresh_spool, True)
+        ReportBatchJob.objects.filter(id=stale.id).update(updated_at=silent_since)
+
+        job = self.client.get(f"/api/reports/analyze-batch/{stale.id}/").data["data"]["job"]
+        self.assertEqual((job["status"], job["error"]), ("failed", report_batch.STALE_JOB_ERROR))
+        self.assertFalse(stale_spool.exists())
+        self.assertEqual(self.client.get(f"/api/reports/analyze-batch/{live.id}/").data["data"]["job"]["status"], "queued")
+
+        # A worker that comes back after its job was failed does not run it.
+        self.assertIsNone(report_batch.run_batch_job(stale.id, [], str(stale_spool)))
+        call_command("fail_stale_report_batches", stdout=io.StringIO())
+        self.assertFalse(orphan_spool.exists())
+        self.assertTrue(fresh_spool.exists())
+
+    def test_a_failed_save_keeps_the_other_groups(self):
+        groups = [report_batch.ReportGroup(f"p{i}", [self._file(f"r{i}.txt", f"LDL: {i}")]) for i in range(3)]
+        real_build = report_batch.build_upload
+
+        def build(uploaded, **kwargs):
+            if uploaded.name == "r1.txt":
+                raise OSError("disk full")
+            return real_build(uploaded, **kwargs)
+
+        with mock.patch.object(report_batch, "build_upload", side_effect=build):
+            summary = report_batch.analyze_report_groups(groups, user=self.user, llm_workers=1)
+        llm_call_writer.flush()
+        self.assertEqual(summary["succeeded"], 2)
+        self.assertEqual(groups[1].status, "error")
+        self.assertEqual(sorted(MedicalReportAnalysis.objects.values_list("title", flat=True)), ["p0", "p2"])
+
+    def test_shed_groups_are_retried_before_giving_up(self):
+        calls = []
+
+        def flaky(text, user=None, priority="batch"):
+            calls.append(text)
+            if len(calls) == 1:
+                raise LLMOverloaded(retry_after=0)
+            return "Looks fine."
+
+        group = report_batch.ReportGroup("retry", [self._file("cbc.txt")])
+        with mock.patch.object(report_batch, "analyze_report_text", side_effect=flaky):
+            summary = report_batch.analyze_report_groups([group], user=self.user, llm_workers=1)
+        self.assertEqual((summary["succeeded"], len(calls)), (1, 2))
+        self.assertEqual(group.report.analysis, "Looks fine.")
+
+
+class ReportRetrievalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="hana@example.com", email="hana@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        filler = "\n".join(f"Reference note {i}: sample handled per laboratory protocol." for i in range(40))
+        self.cbc = MedicalReportAnalysis.objects.create(
+            user=self.user,
+            title="Blood work",
+            extracted_text=f"FILE: cbc.txt\nHemoglobin: 9.1 g/dL (low)\nPlatelets: 250\n{filler}\n"
+            f"FILE: lipids.txt\nLDL cholesterol: 190 mg/dL (high)\n{filler}",
+        )
+        self.thyroid = MedicalReportAnalysis.objects.create(
+            user=self.user, title="Thyroid panel", extracted_text=f"TSH: 7.8 mIU/L (high)\n{filler}"
+        )
+
+    def test_chunks_respect_size_and_file_headers(self):
+        chunks = report_retrieval.chunk_text(self.cbc.extracted_text, size=300, overlap=80)
+        self.assertGreater(len(chunks), 4)
+        self.assertTrue(all(len(body) <= 300 for _, body in chunks))
+        self.assertEqual(chunks[0][0], "cbc.txt")
+        self.assertTrue(any(source == "lipids.txt" and "LDL" in body for source, body in chunks))
+        self.assertFalse(any("FILE:" in body for _, body in chunks))
+
+    def test_chat_sends_only_the_matching_chunks_of_attached_reports(self):
+        response = self.client.post(
+            "/api/chat/", {"message": "Is my LDL cholesterol too high?", "report_ids": [self.cbc.id, self.thyroid.id]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        session = ChatSession.objects.get(id=response.data["data"]["session_id"])
+        self.assertEqual(set(session.reports.values_list("id", flat=True)), {self.cbc.id, self.thyroid.id})
+        self.assertGreater(ReportChunk.objects.filter(report=self.cbc).count(), report_retrieval.REPORT_RETRIEVAL_TOP_K)
+
+        with mock.patch("chat.views.generate_ai_response", return_value="ok") as generate:
+            self.client.post("/api/chat/", {"message": "What about my TSH?", "session_id": session.id}, format="json")
+        context = generate.call_args.kwargs["document_context"]
+        self.assertTrue(context.startswith("[Thyroid panel, "))
+        self.assertIn("TSH: 7.8", context)
+        self.assertNotIn("LDL", context)
+        self.assertLessEqual(len(context), report_retrieval.REPORT_CONTEXT_MAX_CHARS)
+
+    def test_questions_matching_no_chunk_get_the_start_of_each_report(self):
+        session = ChatSession.objects.create(user=self.user)
+        report_retrieval.ensure_indexed([self.cbc, self.thyroid])
+        session.reports.add(self.cbc, self.thyroid)
+        context = report_retrieval.session_document_context(session, "Can you explain my report?")
+        self.assertIn("Hemoglobin: 9.1", context)
+        self.assertIn("TSH: 7.8", context)
+        self.assertLessEqual(len(context), report_retrieval.REPORT_CONTEXT_MAX_CHARS)
+
+    def test_retrieval_errors_are_not_reported_as_provider_errors(self):
+        with mock.patch("chat.views.session_document_context", side_effect=DatabaseError("db down")), mock.patch(
+            "chat.views.generate_ai_response"
+        ) as generate:
+            response = self.client.post("/api/chat/", {"message": "Hello"}, format="json")
+        self.assertEqual((response.status_code, response.data["code"]), (500, "SERVER_ERROR"))
+        generate.assert_not_called()
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_session_reports_are_owner_scoped(self):
+        session = ChatSession.objects.create(user=self.user)
+        other = User.objects.create_user(username="ivan@example.com", email="ivan@example.com")
+        foreign = MedicalReportAnalysis.objects.create(user=other, title="Not yours", extracted_text="TSH: 1.0")
+        url = f"/api/sessions/{session.id}/reports/"
+
+        self.assertEqual(self.client.post(url, {"report_ids": [foreign.id]}, format="json").status_code, 404)
+        response = self.client.post(url, {"report_ids": [self.thyroid.id]}, format="json")
+        self.assertEqual([r["id"] for r in response.data["data"]["reports"]], [self.thyroid.id])
+        self.assertEqual(self.client.delete(f"{url}{self.thyroid.id}/").status_code, 200)
+        self.assertFalse(session.reports.exists())
+
+
+class HistorySearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="june@example.com", email="june@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.session = ChatSession.objects.create(user=self.user, title="Lipids")
+        self.hit = ChatMessage.objects.create(
+            session=self.session, sender="user", message="Last month my LDL cholesterol was 190, and cholesterol runs in my family."
+        )
+        ChatMessage.objects.create(session=self.session, sender="bot", message="Cholesterol can be lowered with diet.")
+        ChatMessage.objects.create(session=self.session, sender="user", message="My glucose is fine.")
+        self.report = MedicalReportAnalysis.objects.create(
+            user=self.user, title="Lipid panel", extracted_text="LDL: 190 mg/dL", analysis="LDL cholesterol is high."
+        )
+        other = User.objects.create_user(username="kai@example.com", email="kai@example.com")
+        ChatMessage.objects.create(
+            session=ChatSession.objects.create(user=other), sender="user", message="My LDL cholesterol is 250."
+        )
+
+    def test_results_are_ranked_scoped_and_highlighted(self):
+        results = history_search.search_history(self.user, "ldl cholesterol")
+        self.assertEqual([(r["type"], r["id"]) for r in results[:2]], [("message", self.hit.id), ("report", self.report.id)])
+        self.assertEqual(len(results), 2)
+        snippet, highlights = results[0]["snippet"], results[0]["highlights"]
+        self.assertEqual([snippet[start:end] for start, end in highlights], ["LDL", "cholesterol", "cholesterol"])
+        self.assertEqual(results[1]["field"], "analysis")
+
+    def test_postings_follow_message_lifecycle(self):
+        self.assertTrue(HistorySearchPosting.objects.filter(message=self.hit, token="cholesterol", frequency=2).exists())
+        self.session.delete()
+        self.assertFalse(HistorySearchPosting.objects.filter(message__isnull=False, user=self.user).exists())
+        self.assertEqual([r["type"] for r in history_search.search_history(self.user, "cholesterol")], ["report"])
+
+    def test_search_endpoint(self):
+        response = self.client.get("/api/search/", {"q": "glucose", "type": "message"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["data"]["backend"], "index")
+        self.assertEqual([r["snippet"] for r in response.data["data"]["results"]], ["My glucose is fine."])
+        self.assertEqual(self.client.get("/api/search/", {"q": " "}).status_code, 400)
+        self.assertEqual(self.client.get("/api/search/", {"q": "ldl", "type": "files"}).status_code, 400)
+
+
+class ReportBlobTests(MediaTestCase):
+    username = "lena@example.com"
+
+    def setUp(self):
+        super().setUp()
+        debug_patch = mock.patch("chat.views.persist_ocr_debug_output")
+        debug_patch.start()
+        self.addCleanup(debug_patch.stop)
+
+    def _analyze(self, name="cbc.txt", text="Hemoglobin: 11.2 g/dL"):
+        upload = SimpleUploadedFile(name, text.encode("utf-8"), content_type="text/plain")
+        response = self.client.post("/api/reports/analyze/", {"files": [upload]}, format="multipart")
+        self.assertEqual(response.status_code, 200)
+        return response.data["data"]["report"]
+
+    def _stored_files(self):
+        return sorted(p.name for p in Path(self.media_root).rglob("*") if p.is_file())
+
+    def test_duplicate_uploads_share_one_blob_until_the_last_reference_goes(self):
+        first = self._analyze()
+        with mock.patch.object(report_storage.ReportBlob._meta.get_field("file").storage, "save") as save:
+            second = self._analyze(name="cbc-again.txt")
+        save.assert_not_called()
+        blob = ReportBlob.objects.get()
+        self.assertEqual((blob.refcount, blob.size), (2, 21))
+        self.assertEqual(
+            set(MedicalReportUpload.objects.values_list("file", flat=True)), {blob.file.name}
+        )
+        self.assertEqual(self._stored_files(), [f"{blob.sha256}.txt"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/reports/{first['id']}/")
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        self.assertEqual(len(self._stored_files()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/reports/{second['id']}/")
+        self.assertFalse(ReportBlob.objects.exists())
+        self.assertEqual(self._stored_files(), [])
+
+    def test_a_failed_upload_leaves_no_blob_files(self):
+        storage = report_storage._storage()
+        real_save = storage.save
+
+        def save(name, content, *args, **kwargs):
+            if content.name == "lipids.txt":
+                raise OSError("disk full")
+            return real_save(name, content, *args, **kwargs)
+
+        files = [
+            SimpleUploadedFile("cbc.txt", b"Hemoglobin: 11.2 g/dL", content_type="text/plain"),
+            SimpleUploadedFile("lipids.txt", b"LDL: 160 mg/dL", content_type="text/plain"),
+        ]
+        with mock.patch.object(storage, "save", side_effect=save):
+            response = self.client.post("/api/reports/analyze/", {"files": files}, format="multipart")
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(ReportBlob.objects.exists())
+        self.assertEqual(self._stored_files(), [])
+
+    def test_upload_racing_a_reclaim_keeps_its_file(self):
+        content = b"LDL: 160"
+        blob = report_storage.store_blob(SimpleUploadedFile("lipids.txt", content))
+        ReportBlob.objects.filter(id=blob.id).update(refcount=0)
+        storage = report_storage._storage()
+        real_delete = storage.delete
+        racing = []
+
+        def delete_after_concurrent_upload(name):
+            # The reclaim's row delete is visible; an upload of the same bytes lands before its file goes.
+            if not racing:
+                racing.append(report_storage.store_blob(SimpleUploadedFile("again.txt", content)))
+            real_delete(name)
+
+        with mock.patch.object(storage, "delete", side_effect=delete_after_concurrent_upload):
+            self.assertTrue(report_storage.reclaim_blob(blob.id))
+        self.assertNotEqual(racing[0].file.name, blob.file.name)
+        self.assertEqual(ReportBlob.objects.get().refcount, 1)
+        self.assertTrue(storage.exists(racing[0].file.name))
+        self.assertFalse(storage.exists(blob.file.name))
+
+    def test_batch_uploads_and_account_deletion_keep_counts_right(self):
+        groups = [report_batch.ReportGroup(f"p{i}", [SimpleUploadedFile("lipids.txt", b"LDL: 160")]) for i in range(3)]
+        with mock.patch.object(report_batch, "persist_ocr_debug_output"), mock.patch.object(llm_call_writer, "batch_size", 1000):
+            report_batch.analyze_report_groups(groups, user=self.user)
+            llm_call_writer.flush()
+        self.assertEqual(list(ReportBlob.objects.values_list("refcount", flat=True)), [3])
+        self.assertEqual(MedicalReportUpload.objects.filter(blob__isnull=False).count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(ReportBlob.objects.exists())
+        self.assertEqual(self._stored_files(), [])
+
+
+class ReportDownloadTests(MediaTestCase):
+    username = "mira@example.com"
+
+    def setUp(self):
+        super().setUp()
+        self.body = b"%PDF-1.4 " + bytes(range(256)) * 40
+        report = MedicalReportAnalysis.objects.create(user=self.user, title="Scan")
+        upload = SimpleUploadedFile("scan.pdf", self.body, content_type="application/pdf")
+        self.upload = report_storage.build_upload(upload, report=report, uploaded_by=self.user)
+        self.upload.save()
+        self.url = f"/api/reports/{report.id}/files/{self.upload.id}/"
+
+    def _body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_full_range_and_conditional_responses(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._body(response), self.body)
+        self.assertEqual(response["Content-Length"], str(len(self.body)))
+        self.assertEqual(response["ETag"], f'"{self.upload.blob.sha256}"')
+        self.assertEqual(response["Content-Disposition"], 'inline; filename="scan.pdf"')
+
+        partial = self.client.get(self.url, HTTP_RANGE="bytes=9-18")
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial["Content-Range"], f"bytes 9-18/{len(self.body)}")
+        self.assertEqual(self._body(partial), self.body[9:19])
+        self.assertEqual(self._body(self.client.get(self.url, HTTP_RANGE="bytes=-4")), self.body[-4:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.body)}-").status_code, 416)
+        stale = self.client.get(self.url, HTTP_RANGE="bytes=0-3", HTTP_IF_RANGE='"stale"')
+        self.assertEqual((stale.status_code, len(self._body(stale))), (200, len(self.body)))
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+    def test_only_the_owner_can_download(self):
+        intruder = APIClient()
+        intruder.force_authenticate(User.objects.create_user(username="nils@example.com", email="nils@example.com"))
+        self.assertEqual(intruder.get(self.url).status_code, 404)
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    def test_web_server_hand_off(self):
+        with mock.patch("chat.downloads.REPORT_DOWNLOAD_SENDFILE", "x-accel-redirect"):
+            response = self.client.get(self.url, {"download": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.upload.file.name}")
+        self.assertEqual(response.content, b"")
+        self.assertTrue(response["Content-Disposition"].startswith("attachment;"))
+
+
+class ReportPreviewTests(MediaTestCase):
+    username = "olga@example.com"
+
+    def setUp(self):
+        super().setUp()
+        self.report = MedicalReportAnalysis.objects.create(user=self.user, title="Scans")
+
+    def _image_bytes(self, fmt, size=(1200, 800)):
+        from PIL import Image
+
+        output = io.BytesIO()
+        Image.new("RGB", size, (200, 40, 40)).save(output, fmt)
+        return output.getvalue()
+
+    def _upload(self, name, content, content_type):
+        upload = report_storage.build_upload(
+            SimpleUploadedFile(name, content, content_type=content_type), report=self.report, uploaded_by=self.user
+        )
+        upload.save()
+        return upload
+
+    def _preview_url(self, upload):
+        return f"/api/reports/{self.report.id}/files/{upload.id}/preview/"
+
+    def test_image_and_pdf_previews_are_small_webp_rendered_once(self):
+        from PIL import Image
+
+        photo = self._upload("xray.png", self._image_bytes("PNG"), "image/png")
+        scan = self._upload("scan.pdf", self._image_bytes("PDF", (1000, 1400)), "application/pdf")
+        for upload in (photo, scan):
+            response = self.client.get(self._preview_url(upload))
+            self.assertEqual((response.status_code, response["Content-Type"]), (200, "image/webp"))
+            preview = Image.open(io.BytesIO(b"".join(response.streaming_content)))
+            self.assertEqual(preview.format, "WEBP")
+            self.assertLessEqual(max(preview.size), report_previews.REPORT_PREVIEW_SIZE)
+
+        with mock.patch.object(report_previews, "render_preview") as render:
+            self.assertEqual(self.client.get(self._preview_url(photo)).status_code, 200)
+        render.assert_not_called()
+
+        payload = self.client.get(f"/api/reports/{self.report.id}/").data["data"]["report"]
+        self.assertTrue(payload["preview_url"].endswith(self._preview_url(photo)))
+
+    def test_files_without_an_image_have_no_preview(self):
+        from pypdf import PdfWriter
+
+        writer = PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        output = io.BytesIO()
+        writer.write(output)
+        text_only = self._upload("letter.pdf", output.getvalue(), "application/pdf")
+        notes = self._upload("notes.txt", b"LDL: 160", "text/plain")
+
+        self.assertEqual(self.client.get(self._preview_url(text_only)).status_code, 404)
+        with mock.patch.object(report_previews, "render_preview") as render:
+            self.assertEqual(self.client.get(self._preview_url(text_only)).status_code, 404)
+        render.assert_not_called()
+        self.assertEqual(self.client.get(self._preview_url(notes)).status_code, 404)
+        files = self.client.get(f"/api/reports/{self.report.id}/").data["data"]["report"]["uploaded_files"]
+        self.assertEqual({item["original_name"]: item["preview_url"] is None for item in files}, {"letter.pdf": False, "notes.txt": True})
+
+    def test_transient_render_errors_are_retried_and_races_keep_one_file(self):
+        photo = self._upload("xray.png", self._image_bytes("PNG"), "image/png")
+        with mock.patch.object(report_previews, "render_preview", side_effect=OSError("disk busy")):
+            self.assertEqual(self.client.get(self._preview_url(photo)).status_code, 500)
+        self.assertEqual(list(Path(self.media_root, report_previews.PREVIEW_DIR).rglob("*")), [])
+
+        real_render = report_previews.render_preview
+
+        def render_while_another_process_finishes(*args):
+            data = real_render(*args)
+            report_previews._put(report_previews._storage(), report_previews.preview_name(photo.blob.sha256), data)
+            return data
+
+        with mock.patch.object(report_previews, "render_preview", side_effect=render_while_another_process_finishes):
+            self.assertEqual(self.client.get(self._preview_url(photo)).status_code, 200)
+        stored = [p.name for p in Path(self.media_root, report_previews.PREVIEW_DIR).rglob("*") if p.is_file()]
+        self.assertEqual(stored, [f"{photo.blob.sha256}-{report_previews.REPORT_PREVIEW_SIZE}.webp"])
+
+    def test_previews_are_reclaimed_with_their_blob(self):
+        photo = self._upload("xray.jpg", self._image_bytes("JPEG"), "image/jpeg")
+        self.client.get(self._preview_url(photo))
+        self.assertTrue(any(Path(self.media_root, report_previews.PREVIEW_DIR).rglob("*.webp")))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.report.delete()
+        self.assertEqual([p for p in Path(self.media_root).rglob("*") if p.is_file()], [])
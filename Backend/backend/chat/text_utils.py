@@ -0,0 +1,26 @@
+import re
+import unicodedata
+
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+MAX_TOKEN_LENGTH = 64
+# Common English words that match nearly every message or report; search and retrieval skip them.
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from had has have how i if in is it its me my of on or "
+    "should so than that the their them there these they this to was we were what when which who why will "
+    "with you your".split()
+)
+
+
+def normalize_text(value):
+    """Casefold and strip accents so 'Zoë' and 'zoe' compare equal."""
+    decomposed = unicodedata.normalize("NFKD", str(value or ""))
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(value):
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(normalize_text(value))]
+
+
+def index_tokens(value):
+    return [token for token in tokenize(value) if token not in STOPWORDS]
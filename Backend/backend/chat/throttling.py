@@ -0,0 +1,132 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+# "local" keeps buckets per worker process; "cache" shares them through the Django cache.
+THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND", "local").strip().lower()
+THROTTLE_LOCAL_MAX_KEYS = int(os.getenv("THROTTLE_LOCAL_MAX_KEYS", "50000"))
+THROTTLE_RATES = {
+    # scope: (burst, tokens refilled per minute)
+    "chat": (
+        int(os.getenv("CHAT_THROTTLE_BURST", "10")),
+        float(os.getenv("CHAT_THROTTLE_PER_MINUTE", "20")),
+    ),
+    "report": (
+        int(os.getenv("REPORT_THROTTLE_BURST", "3")),
+        float(os.getenv("REPORT_THROTTLE_PER_MINUTE", "4")),
+    ),
+    "report_batch": (
+        int(os.getenv("REPORT_BATCH_THROTTLE_BURST", "2")),
+        float(os.getenv("REPORT_BATCH_THROTTLE_PER_MINUTE", "1")),
+    ),
+}
+THROTTLE_STATE_ATTR = "_token_bucket_state"
+LOCK_ATTEMPTS = 20
+LOCK_WAIT_SECONDS = 0.005
+
+
+def take(state, burst, per_second, now, cost=1):
+    """Token-bucket step; returns (allowed, new_state, remaining, wait_seconds)."""
+    tokens, updated_at = state if state else (float(burst), now)
+    # Callers may arrive with a slightly older clock reading; never move the bucket back in time,
+    # or the same interval would be refilled twice.
+    now = max(now, updated_at)
+    tokens = min(float(burst), tokens + (now - updated_at) * per_second)
+    if tokens >= cost:
+        tokens -= cost
+        return True, (tokens, now), tokens, 0.0
+    wait = (cost - tokens) / per_second if per_second > 0 else None
+    return False, (tokens, now), tokens, wait
+
+
+class LocalBucketStore:
+    def __init__(self, max_keys=THROTTLE_LOCAL_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, burst, per_second, now):
+        with self._lock:
+            allowed, state, remaining, wait = take(self._buckets.get(key), burst, per_second, now)
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, remaining, wait
+
+
+class CacheBucketStore:
+    """Buckets in the shared cache; a short add()-based lock makes each read-modify-write atomic."""
+
+    def consume(self, key, burst, per_second, now):
+        lock_key = f"{key}:lock"
+        timeout = math.ceil(burst / per_second) + 60 if per_second > 0 else None
+        try:
+            for _ in range(LOCK_ATTEMPTS):
+                if cache.add(lock_key, 1, 2):
+                    try:
+                        allowed, state, remaining, wait = take(cache.get(key), burst, per_second, now)
+                        cache.set(key, state, timeout)
+                    finally:
+                        cache.delete(lock_key)
+                    return allowed, remaining, wait
+                time.sleep(LOCK_WAIT_SECONDS)
+        except Exception:
+            # Fail open if the cache itself is down rather than locking everyone out.
+            return True, None, 0.0
+        # The lock is per bucket, so sustained contention means this caller is already hammering.
+        return False, None, 1 / per_second if per_second > 0 else None
+
+
+_local_store = LocalBucketStore()
+_cache_store = CacheBucketStore()
+
+
+def bucket_store():
+    return _cache_store if THROTTLE_BACKEND == "cache" else _local_store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Per-user (or per-IP for anonymous callers) token bucket for one scope in THROTTLE_RATES."""
+
+    scope = None
+
+    def get_cache_key(self, request, view):
+        ident = request.user.pk if request.user and request.user.is_authenticated else self.get_ident(request)
+        return f"chat:throttle:{self.scope}:{ident}"
+
+    def allow_request(self, request, view):
+        burst, per_minute = THROTTLE_RATES[self.scope]
+        if burst <= 0:
+            return True
+        per_second = per_minute / 60
+        allowed, remaining, self.wait_seconds = bucket_store().consume(
+            self.get_cache_key(request, view), burst, per_second, time.time()
+        )
+        if remaining is not None:
+            missing = burst - remaining
+            reset = math.ceil(missing / per_second) if per_second > 0 else 0
+            # Read by RateLimitHeadersMiddleware once the response exists.
+            setattr(request._request, THROTTLE_STATE_ATTR, (burst, math.floor(remaining), reset))
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ChatRateThrottle(TokenBucketThrottle):
+    scope = "chat"
+
+
+class ReportRateThrottle(TokenBucketThrottle):
+    scope = "report"
+
+
+class ReportBatchRateThrottle(TokenBucketThrottle):
+    scope = "report_batch"
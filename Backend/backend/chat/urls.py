@@ -2,8 +2,10 @@ from django.urls import path
 from .views import (
     admin_audit_logs_api,
     admin_health_api,
+    admin_llm_usage_api,
     admin_medical_data_api,
     admin_medical_versions_api,
+    admin_metrics_api,
     admin_overview_api,
     admin_restore_medical_version_api,
     admin_user_update_api,
@@ -23,9 +25,16 @@ from .views import (
     mobile_token_logout_api,
     profile_api,
     report_analysis_detail_api,
+    report_batch_job_api,
+    report_upload_download_api,
+    report_upload_preview_api,
     rename_session_api,
+    session_reports_api,
+    detach_session_report_api,
     register_api,
     analyze_report_api,
+    analyze_report_batch_api,
+    search_history_api,
     settings_api,
 )
 
@@ -44,11 +53,18 @@ urlpatterns = [
     path("sessions/", list_sessions_api),
     path("sessions/<int:session_id>/", delete_session_api),
     path("sessions/<int:session_id>/title/", rename_session_api),
+    path("sessions/<int:session_id>/reports/", session_reports_api),
+    path("sessions/<int:session_id>/reports/<int:report_id>/", detach_session_report_api),
     path("chat/", chat_api),
     path("history/<int:session_id>/", get_chat_history),
+    path("search/", search_history_api),
     path("reports/", list_report_analyses_api),
     path("reports/analyze/", analyze_report_api),
+    path("reports/analyze-batch/", analyze_report_batch_api),
+    path("reports/analyze-batch/<int:job_id>/", report_batch_job_api),
     path("reports/<int:report_id>/", report_analysis_detail_api),
+    path("reports/<int:report_id>/files/<int:upload_id>/", report_upload_download_api),
+    path("reports/<int:report_id>/files/<int:upload_id>/preview/", report_upload_preview_api),
     path("admin/overview/", admin_overview_api),
     path("admin/users/", admin_users_api),
     path("admin/users/<int:user_id>/", admin_user_update_api),
@@ -57,4 +73,6 @@ urlpatterns = [
     path("admin/medical-data/restore/<int:version_id>/", admin_restore_medical_version_api),
     path("admin/health/", admin_health_api),
     path("admin/audit-logs/", admin_audit_logs_api),
+    path("admin/llm-usage/", admin_llm_usage_api),
+    path("admin/metrics/", admin_metrics_api),
 ]
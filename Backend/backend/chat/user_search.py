@@ -0,0 +1,90 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import UserSearchToken
+from .text_utils import tokenize
+
+User = get_user_model()
+
+# "auto" uses trigram-indexed ILIKE on PostgreSQL and the prefix token table elsewhere.
+USER_SEARCH_BACKEND = os.getenv("USER_SEARCH_BACKEND", "auto").strip().lower()
+SEARCH_FIELDS = ("email", "first_name", "last_name")
+# Upper bound for prefix range scans: every string starting with p sorts below p + this character.
+PREFIX_RANGE_END = "\U0010ffff"
+
+
+def active_backend():
+    if USER_SEARCH_BACKEND in {"trigram", "prefix"}:
+        return USER_SEARCH_BACKEND
+    return "trigram" if connection.vendor == "postgresql" else "prefix"
+
+
+def user_tokens(user):
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        tokens.update(tokenize(getattr(user, field, "")))
+    return tokens
+
+
+def index_user(user):
+    tokens = user_tokens(user)
+    existing = set(UserSearchToken.objects.filter(user_id=user.id).values_list("token", flat=True))
+    if tokens == existing:
+        return
+    with transaction.atomic():
+        UserSearchToken.objects.filter(user_id=user.id, token__in=existing - tokens).delete()
+        UserSearchToken.objects.bulk_create(
+            [UserSearchToken(user_id=user.id, token=token) for token in tokens - existing]
+        )
+
+
+def rebuild_index(batch_size=2000):
+    """Re-tokenize every user; needed after bulk writes that bypass model signals."""
+    UserSearchToken.objects.all().delete()
+    users = User.objects.only("id", *SEARCH_FIELDS).order_by("id")
+    indexed = 0
+    last_id = 0
+    while True:
+        batch = list(users.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return indexed
+        UserSearchToken.objects.bulk_create(
+            [UserSearchToken(user_id=user.id, token=token) for user in batch for token in user_tokens(user)],
+            batch_size=5000,
+        )
+        indexed += len(batch)
+        last_id = batch[-1].id
+
+
+def _rank(query):
+    return Case(
+        When(email__iexact=query, then=Value(4)),
+        When(email__istartswith=query, then=Value(3)),
+        When(Q(first_name__istartswith=query) | Q(last_name__istartswith=query), then=Value(2)),
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+
+
+def search_users(queryset, query):
+    """Filter queryset to users matching every word of query, annotated with search_rank."""
+    query = " ".join(query.split())
+    if active_backend() == "trigram":
+        # UPPER(col) LIKE is served by the GIN trigram indexes created in migration 0017.
+        for word in query.split(" "):
+            queryset = queryset.filter(
+                Q(email__icontains=word) | Q(first_name__icontains=word) | Q(last_name__icontains=word)
+            )
+    else:
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        # Every word narrows the same SQL query, so the intersection is complete before the caller's
+        # ordering and page limit apply.
+        for token in dict.fromkeys(tokens):
+            matches = UserSearchToken.objects.filter(token__gte=token, token__lt=token + PREFIX_RANGE_END)
+            queryset = queryset.filter(id__in=matches.values("user_id"))
+    return queryset.annotate(search_rank=_rank(query))
@@ -1,26 +1,35 @@
 import os
 import json
-from pathlib import Path
+import time
 from datetime import datetime
 
 from django.contrib.auth import authenticate, get_user_model, login, logout, update_session_auth_hash
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
-from django.db import connection
-from django.db.models import Q, Count
+from django.db import connection, transaction
+from django.db.models import Q, Count, Max
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from django.views.decorators.csrf import ensure_csrf_cookie
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 
 from .ai_engine.llm_engine import generate_ai_response
 from .ai_engine import llm_engine
-from .api_utils import api_error, api_success
+from .ai_engine import providers as llm_providers
+from .api_utils import api_error, api_success, build_etag, not_modified
+from .audit import audit_log_writer, log_admin_action
+from .authentication import invalidate_token, invalidate_user_tokens, issue_token
 from .document_parser import parse_uploaded_attachments, persist_ocr_debug_output
+from .downloads import serve_file, serve_upload
 from .google_auth import GoogleTokenError, verify_google_id_token
+from .history_search import SEARCH_KINDS, active_backend as history_search_backend, search_history
+from .knowledge_store import MedicalDataConflict, MedicalDataValidationError, medical_store
+from .llm_usage import llm_call_writer, usage_summary
+from .medical_history import materialize
+from .metrics import render_prometheus, span
 from .models import (
     AdminAuditLog,
     ChatMessage,
@@ -28,12 +37,30 @@ from .models import (
     MedicalDataVersion,
     MedicalReportAnalysis,
     MedicalReportUpload,
+    ReportBatchJob,
     UserProfile,
 )
+from .pagination import InvalidCursor, paginate
+from .profile_cache import ALLOWED_THEMES, get_profile_view, get_profile_views
+from .reply_stats import record_bot_reply, reply_health_summary
+from .report_batch import (
+    ANALYSIS_FALLBACK,
+    REPORT_BATCH_MAX_GROUPS,
+    ReportGroup,
+    analyze_report_text,
+    combine_extracted_docs,
+    default_title,
+    fail_stale_jobs,
+    submit_batch_job,
+)
+from .report_previews import PREVIEW_CONTENT_TYPE, REPORT_PREVIEW_SIZE, ensure_preview, has_preview, schedule_previews
+from .report_retrieval import ensure_indexed, index_reports, session_document_context
+from .report_storage import build_upload, delete_new_blobs_on_error
+from .throttling import ChatRateThrottle, ReportBatchRateThrottle, ReportRateThrottle
+from .user_search import search_users
 
 User = get_user_model()
-ALLOWED_THEMES = {"light", "dark"}
-MEDICAL_DATA_PATH = Path(__file__).resolve().parent / "data" / "medical_data.json"
+FALLBACK_REPLY = "I'm sorry, something went wrong. Please try again."
 
 
 def _derive_title_from_text(text, max_length=80):
@@ -50,63 +77,57 @@ def _get_or_create_profile(user):
     return profile
 
 
-def _normalize_theme(value):
-    return value if value in ALLOWED_THEMES else "light"
-
-
 def _public_profile(user):
-    profile = _get_or_create_profile(user)
-    full_name = f"{user.first_name} {user.last_name}".strip()
+    view = get_profile_view(user)
     return {
-        "name": full_name or user.username,
-        "email": user.email,
-        "birth_date": profile.birth_date.isoformat() if profile.birth_date else None,
-        "gender": profile.gender,
-        "date_created": user.date_joined.isoformat() if user.date_joined else None,
-        "preferred_theme": _normalize_theme(profile.preferred_theme),
+        "name": view["name"],
+        "email": view["email"],
+        "birth_date": view["birth_date"],
+        "gender": view["gender"],
+        "date_created": view["date_joined"],
+        "preferred_theme": view["preferred_theme"],
     }
 
 
 def _public_user(user):
-    profile = _get_or_create_profile(user)
-    full_name = f"{user.first_name} {user.last_name}".strip()
+    view = get_profile_view(user)
+    # Authorization flags come from the authenticated user, never from the cached view, which other
+    # workers may still hold for up to PROFILE_CACHE_TIMEOUT after an admin change.
     return {
-        "id": user.id,
-        "email": user.email,
-        "name": full_name or user.username,
+        "id": view["id"],
+        "email": view["email"],
+        "name": view["name"],
         "is_verified": user.is_active,
         "is_staff": user.is_staff,
         "is_superuser": user.is_superuser,
         "is_admin": bool(user.is_staff or user.is_superuser),
-        "preferred_theme": _normalize_theme(profile.preferred_theme),
+        "preferred_theme": view["preferred_theme"],
     }
 
 
 def _auth_payload(user, include_token=False):
     payload = {"user": _public_user(user)}
     if include_token:
-        token, _ = Token.objects.get_or_create(user=user)
-        payload["token"] = token.key
+        payload["token"] = issue_token(user).key
     return payload
 
 
-def _admin_user_payload(user):
-    profile = _get_or_create_profile(user)
-    full_name = f"{user.first_name} {user.last_name}".strip()
+def _admin_user_payload(user, view=None):
+    view = view or get_profile_view(user)
     return {
         "id": user.id,
-        "name": full_name or user.username,
+        "name": view["name"],
         "email": user.email,
         "is_active": user.is_active,
         "is_staff": user.is_staff,
         "is_superuser": user.is_superuser,
         "date_joined": user.date_joined.isoformat() if user.date_joined else None,
         "last_login": user.last_login.isoformat() if user.last_login else None,
-        "birth_date": profile.birth_date.isoformat() if profile.birth_date else None,
-        "gender": profile.gender,
+        "birth_date": view["birth_date"],
+        "gender": view["gender"],
         "session_count": getattr(user, "session_count", 0),
         "message_count": getattr(user, "message_count", 0),
-        "preferred_theme": _normalize_theme(profile.preferred_theme),
+        "preferred_theme": view["preferred_theme"],
         "is_last_active_admin": False,
     }
 
@@ -140,47 +161,17 @@ def _parse_pagination_params(request):
 
 
 def _log_admin_action(actor, action, entity_type="", entity_id="", details=None):
-    try:
-        AdminAuditLog.objects.create(
-            actor=actor if getattr(actor, "is_authenticated", False) else None,
-            action=action,
-            entity_type=entity_type,
-            entity_id=str(entity_id or ""),
-            details=details or {},
-        )
-    except Exception:
-        # Never break main flow because logging fails.
-        pass
+    log_admin_action(actor, action, entity_type=entity_type, entity_id=entity_id, details=details)
 
 
-def _analyze_report_text_with_model(extracted_text: str) -> str:
-    completion = llm_engine.client.chat.completions.create(
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        messages=[
-            {
-                "role": "system",
-                "content": """
-You are a medical report analysis assistant.
-Provide concise, structured output with sections:
-1) Key Findings
-2) Potential Concerns
-3) Suggested Follow-up Questions for Doctor
-4) Lifestyle/Monitoring Suggestions
-5) Safety Note
-
-Rules:
-- Do not give final diagnosis.
-- If data is unclear, say what is missing.
-- Keep output patient-friendly.
-""",
-            },
-            {"role": "user", "content": f"Analyze this medical report text:\n\n{extracted_text}"},
-        ],
-        temperature=0.2,
-        max_completion_tokens=600,
-        top_p=1,
+def _llm_busy_response(exc):
+    response = api_error(
+        message="The assistant is busy right now. Please try again shortly.",
+        status=503,
+        code="LLM_OVERLOADED",
     )
-    return (completion.choices[0].message.content or "").strip()
+    response["Retry-After"] = str(exc.retry_after)
+    return response
 
 
 def _public_report_payload(report, request=None):
@@ -188,9 +179,11 @@ def _public_report_payload(report, request=None):
     uploaded_files = []
     if uploads is not None:
         for file_item in uploads.all():
-            file_url = file_item.file.url if file_item.file else ""
+            file_url = f"/api/reports/{report.id}/files/{file_item.id}/" if file_item.file else ""
+            preview_url = f"{file_url}preview/" if file_url and has_preview(file_item) else None
             if file_url and request is not None:
                 file_url = request.build_absolute_uri(file_url)
+                preview_url = request.build_absolute_uri(preview_url) if preview_url else None
             uploaded_files.append(
                 {
                     "id": file_item.id,
@@ -200,6 +193,7 @@ def _public_report_payload(report, request=None):
                     "uploaded_at": file_item.uploaded_at.isoformat() if file_item.uploaded_at else None,
                     "uploaded_by": file_item.uploaded_by.email if file_item.uploaded_by else None,
                     "url": file_url,
+                    "preview_url": preview_url,
                 }
             )
     return {
@@ -207,6 +201,8 @@ def _public_report_payload(report, request=None):
         "title": report.title or f"Report {report.id}",
         "file_names": report.file_names or [],
         "uploaded_files": uploaded_files,
+        # The first file that can have a thumbnail, for report lists.
+        "preview_url": next((item["preview_url"] for item in uploaded_files if item["preview_url"]), None),
         "analysis": report.analysis or "",
         "warnings": report.warnings or [],
         "created_at": report.created_at.isoformat() if report.created_at else None,
@@ -266,7 +262,6 @@ def register_api(request):
         )
         user.set_password(password)
         user.save()
-        _get_or_create_profile(user)
 
         return api_success(
             data={"email": user.email},
@@ -357,8 +352,6 @@ def google_login_api(request):
             user.is_active = True
             user.save(update_fields=["is_active"])
 
-        _get_or_create_profile(user)
-
         login(request, user)
         return api_success(
             data={**_auth_payload(user, include_token=True), "created": created},
@@ -380,6 +373,8 @@ def logout_api(request):
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def mobile_token_logout_api(request):
+    for key in Token.objects.filter(user=request.user).values_list("key", flat=True):
+        invalidate_token(key)
     Token.objects.filter(user=request.user).delete()
     return api_success(message="Mobile token revoked.")
 
@@ -389,14 +384,18 @@ def mobile_token_logout_api(request):
 def me_api(request):
     if not request.user.is_authenticated:
         return api_error(message="Authentication required.", status=401, code="UNAUTHENTICATED")
-    return api_success(data={"user": _public_user(request.user)})
+    user = request.user
+    etag = build_etag("me", get_profile_view(user)["etag"], user.is_active, user.is_staff, user.is_superuser)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return api_success(data={"user": _public_user(request.user)}, etag=etag)
 
 
 @api_view(["GET", "PATCH"])
 @permission_classes([IsAuthenticated])
 def profile_api(request):
     user = request.user
-    profile = _get_or_create_profile(user)
 
     if request.method == "GET":
         return api_success(data={"profile": _public_profile(user)})
@@ -426,7 +425,9 @@ def profile_api(request):
         user.first_name = first_name.strip()
         user.last_name = last_name.strip()
         user.save(update_fields=["first_name", "last_name"])
+        invalidate_user_tokens(user.id)
 
+        profile = _get_or_create_profile(user)
         profile.birth_date = parsed_birth_date
         if gender:
             profile.gender = gender
@@ -440,17 +441,11 @@ def profile_api(request):
 @api_view(["GET", "PATCH"])
 @permission_classes([IsAuthenticated])
 def settings_api(request):
-    profile = _get_or_create_profile(request.user)
-    normalized_theme = _normalize_theme(profile.preferred_theme)
-    if normalized_theme != profile.preferred_theme:
-        profile.preferred_theme = normalized_theme
-        profile.save(update_fields=["preferred_theme"])
-
     if request.method == "GET":
         return api_success(
             data={
                 "settings": {
-                    "preferred_theme": normalized_theme,
+                    "preferred_theme": get_profile_view(request.user)["preferred_theme"],
                     "password_required": request.user.has_usable_password(),
                 }
             }
@@ -466,6 +461,7 @@ def settings_api(request):
                 errors={"preferred_theme": "Choose a valid theme."},
             )
 
+        profile = _get_or_create_profile(request.user)
         profile.preferred_theme = preferred_theme
         profile.save(update_fields=["preferred_theme"])
         return api_success(
@@ -530,6 +526,7 @@ def change_password_api(request):
 
         request.user.set_password(new_password)
         request.user.save(update_fields=["password"])
+        invalidate_user_tokens(request.user.id)
         update_session_auth_hash(request, request.user)
         return api_success(message="Password changed successfully.")
     except Exception:
@@ -539,6 +536,12 @@ def change_password_api(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def list_sessions_api(request):
+    stats = ChatSession.objects.filter(user=request.user).aggregate(total=Count("id"), latest=Max("updated_at"))
+    etag = build_etag("sessions", request.user.id, stats["total"], stats["latest"])
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
     sessions = ChatSession.objects.filter(user=request.user).prefetch_related("messages").order_by("-created_at")
     data = [
         {
@@ -559,7 +562,7 @@ def list_sessions_api(request):
         }
         for s in sessions
     ]
-    return api_success(data={"sessions": data})
+    return api_success(data={"sessions": data}, etag=etag)
 
 
 @api_view(["PATCH"])
@@ -574,7 +577,7 @@ def rename_session_api(request, session_id):
             return api_error(message="Title must be 120 characters or fewer.", status=400, code="VALIDATION_ERROR")
 
         session.title = title
-        session.save(update_fields=["title"])
+        session.save(update_fields=["title", "updated_at"])
         return api_success(data={"id": session.id, "title": session.title}, message="Session title updated.")
     except Http404:
         return api_error(message="Session not found.", status=404, code="NOT_FOUND")
@@ -595,48 +598,134 @@ def delete_session_api(request, session_id):
         return api_error(message="Could not delete chat history.", status=500, code="SERVER_ERROR")
 
 
+def _owned_reports(request, report_ids):
+    """(reports, error response) for a client-supplied list of the user's report ids."""
+    if report_ids in (None, "", []):
+        return [], None
+    try:
+        if not isinstance(report_ids, (list, tuple)):
+            raise TypeError(report_ids)
+        ids = {int(report_id) for report_id in report_ids}
+    except (TypeError, ValueError):
+        return [], api_error(message="report_ids must be a list of report ids.", status=400, code="VALIDATION_ERROR")
+    reports = list(MedicalReportAnalysis.objects.filter(user=request.user, id__in=ids))
+    if len(reports) != len(ids):
+        return [], api_error(message="Report not found.", status=404, code="NOT_FOUND")
+    return reports, None
+
+
+def _session_report_payload(report):
+    return {
+        "id": report.id,
+        "title": report.title or f"Report {report.id}",
+        "created_at": report.created_at.isoformat() if report.created_at else None,
+    }
+
+
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def session_reports_api(request, session_id):
+    try:
+        session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+        if request.method == "POST":
+            reports, error = _owned_reports(request, request.data.get("report_ids"))
+            if error:
+                return error
+            if not reports:
+                return api_error(message="report_ids is required.", status=400, code="VALIDATION_ERROR")
+            ensure_indexed(reports)
+            session.reports.add(*reports)
+        reports = session.reports.order_by("-created_at")
+        return api_success(data={"session_id": session.id, "reports": [_session_report_payload(r) for r in reports]})
+    except Http404:
+        return api_error(message="Session not found.", status=404, code="NOT_FOUND")
+    except Exception:
+        return api_error(message="Could not update session reports.", status=500, code="SERVER_ERROR")
+
+
+@api_view(["DELETE"])
+@permission_classes([IsAuthenticated])
+def detach_session_report_api(request, session_id, report_id):
+    try:
+        session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+        report = get_object_or_404(session.reports, id=report_id)
+        session.reports.remove(report)
+        return api_success(message="Report detached from session.")
+    except Http404:
+        return api_error(message="Report not attached to this session.", status=404, code="NOT_FOUND")
+    except Exception:
+        return api_error(message="Could not update session reports.", status=500, code="SERVER_ERROR")
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ChatRateThrottle])
 def chat_api(request):
     try:
         user_message = (request.data.get("message") or "").strip()
         session_id = request.data.get("session_id")
         if not user_message:
             return api_error(message="Message is required.", status=400, code="VALIDATION_ERROR")
+        reports, error = _owned_reports(request, request.data.get("report_ids"))
+        if error:
+            return error
 
         if session_id:
             session = get_object_or_404(ChatSession, id=session_id, user=request.user)
         else:
             session = ChatSession.objects.create(user=request.user)
+        if reports:
+            ensure_indexed(reports)
+            session.reports.add(*reports)
 
         if not (session.title or "").strip():
             session.title = _derive_title_from_text(user_message)
             session.save(update_fields=["title"])
 
-        ChatMessage.objects.create(
+        # Outside the model call below, so a database error here is not reported as a provider error.
+        with span("retrieval"):
+            document_context = session_document_context(session, user_message)
+
+        user_entry = ChatMessage.objects.create(
             session=session,
             sender="user",
             message=user_message
         )
 
-        ai_reply = generate_ai_response(
-            user_query=user_message,
-            session=session,
-        )
+        reply_status = "ok"
+        started = time.monotonic()
+        try:
+            ai_reply = generate_ai_response(
+                user_query=user_message,
+                session=session,
+                document_context=document_context,
+            )
+        except llm_engine.LLMOverloaded as exc:
+            # Shed before the provider was called: undo this turn so the client can simply retry it.
+            if session_id:
+                user_entry.delete()
+            else:
+                session.delete()
+            return _llm_busy_response(exc)
+        except llm_engine.LLMTimeout:
+            ai_reply, reply_status = "", "timeout"
+        except Exception:
+            ai_reply, reply_status = "", "provider_error"
+        latency_ms = int((time.monotonic() - started) * 1000)
         if not ai_reply:
-            ai_reply = "I'm sorry, something went wrong. Please try again."
+            ai_reply = FALLBACK_REPLY
+            if reply_status == "ok":
+                reply_status = "fallback"
 
-        ChatMessage.objects.create(
-            session=session,
-            sender="bot",
-            message=ai_reply
-        )
+        record_bot_reply(session, ai_reply, status=reply_status, latency_ms=latency_ms)
+        session.save(update_fields=["updated_at"])
 
         return api_success(
             data={
                 "session_id": session.id,
                 "session_title": session.title or f"Session {session.id}",
                 "reply": ai_reply,
+                "reply_status": reply_status,
             }
         )
     except Http404:
@@ -650,6 +739,10 @@ def chat_api(request):
 def get_chat_history(request, session_id):
     try:
         session = get_object_or_404(ChatSession, id=session_id, user=request.user)
+        etag = build_etag("history", session.id, session.updated_at)
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
         messages = session.messages.all().order_by("created_at")
 
         data = [
@@ -666,7 +759,8 @@ def get_chat_history(request, session_id):
             data={
                 "session_id": session.id,
                 "messages": data,
-            }
+            },
+            etag=etag,
         )
     except Http404:
         return api_error(message="Session not found.", status=404, code="NOT_FOUND")
@@ -674,11 +768,44 @@ def get_chat_history(request, session_id):
         return api_error(message="Could not load chat history.", status=500, code="SERVER_ERROR")
 
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def search_history_api(request):
+    query = " ".join((request.query_params.get("q") or "").split())
+    if not query:
+        return api_error(message="Search query is required.", status=400, code="VALIDATION_ERROR")
+    if len(query) > 200:
+        return api_error(message="Search query must be 200 characters or fewer.", status=400, code="VALIDATION_ERROR")
+    kind = (request.query_params.get("type") or "").strip().lower()
+    if kind and kind not in SEARCH_KINDS:
+        return api_error(message="type must be 'message' or 'report'.", status=400, code="VALIDATION_ERROR")
+    try:
+        limit = int(request.query_params.get("limit") or 20)
+    except ValueError:
+        return api_error(message="limit must be a number.", status=400, code="VALIDATION_ERROR")
+
+    try:
+        with span("search"):
+            results = search_history(request.user, query, kinds=(kind,) if kind else SEARCH_KINDS, limit=limit)
+    except Exception:
+        return api_error(message="Could not search history.", status=500, code="SERVER_ERROR")
+    return api_success(data={"query": query, "backend": history_search_backend(), "results": results})
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def list_report_analyses_api(request):
+    stats = MedicalReportAnalysis.objects.filter(user=request.user).aggregate(total=Count("id"), latest=Max("id"))
+    etag = build_etag("reports", request.user.id, request.get_host(), stats["total"], stats["latest"])
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
     reports = MedicalReportAnalysis.objects.filter(user=request.user).prefetch_related("uploads").order_by("-created_at")
-    return api_success(data={"reports": [_public_report_payload(report, request=request) for report in reports[:50]]})
+    return api_success(
+        data={"reports": [_public_report_payload(report, request=request) for report in reports[:50]]},
+        etag=etag,
+    )
 
 
 @api_view(["GET", "DELETE"])
@@ -691,25 +818,70 @@ def report_analysis_detail_api(request, report_id):
             user=request.user,
         )
         if request.method == "DELETE":
-            for uploaded in report.uploads.all():
-                try:
-                    if uploaded.file:
-                        uploaded.file.delete(save=False)
-                except Exception:
-                    pass
+            # Each upload drops its blob reference (see signals); shared files outlive this report.
             report.delete()
             return api_success(message="Report deleted successfully.")
+        etag = build_etag("report", report.id, request.get_host(), report.created_at)
+        cached = not_modified(request, etag)
+        if cached:
+            return cached
         payload = _public_report_payload(report, request=request)
         payload["extracted_text"] = report.extracted_text or ""
-        return api_success(data={"report": payload})
+        return api_success(data={"report": payload}, etag=etag)
     except Http404:
         return api_error(message="Report not found.", status=404, code="NOT_FOUND")
     except Exception:
         return api_error(message="Could not load report.", status=500, code="SERVER_ERROR")
 
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def report_upload_download_api(request, report_id, upload_id):
+    try:
+        upload = get_object_or_404(
+            MedicalReportUpload.objects.select_related("blob"),
+            id=upload_id,
+            report_id=report_id,
+            report__user=request.user,
+        )
+        return serve_upload(request, upload, as_attachment=request.query_params.get("download") in {"1", "true"})
+    except (Http404, FileNotFoundError):
+        return api_error(message="File not found.", status=404, code="NOT_FOUND")
+    except Exception:
+        return api_error(message="Could not load file.", status=500, code="SERVER_ERROR")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def report_upload_preview_api(request, report_id, upload_id):
+    try:
+        upload = get_object_or_404(
+            MedicalReportUpload.objects.select_related("blob"),
+            id=upload_id,
+            report_id=report_id,
+            report__user=request.user,
+        )
+        name = ensure_preview(upload)
+        if name is None:
+            return api_error(message="No preview available for this file.", status=404, code="NOT_FOUND")
+        return serve_file(
+            request,
+            upload.blob.file.storage,
+            name,
+            etag=f'"{upload.blob.sha256}-{REPORT_PREVIEW_SIZE}"',
+            last_modified=int(upload.blob.created_at.timestamp()),
+            content_type=PREVIEW_CONTENT_TYPE,
+            filename=f"{os.path.splitext(upload.original_name)[0] or 'preview'}.webp",
+        )
+    except (Http404, FileNotFoundError):
+        return api_error(message="File not found.", status=404, code="NOT_FOUND")
+    except Exception:
+        return api_error(message="Could not load preview.", status=500, code="SERVER_ERROR")
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ReportRateThrottle])
 def analyze_report_api(request):
     try:
         uploaded_files = request.FILES.getlist("files")
@@ -725,9 +897,7 @@ def analyze_report_api(request):
         extracted_details = parsed.get("extracted_details", [])
         used_files = parsed.get("used_files", [])
 
-        combined_text = "\n\n".join(
-            [f"FILE: {doc.get('name', 'report')}\n{doc.get('text', '')}" for doc in extracted_docs]
-        ).strip()
+        combined_text = combine_extracted_docs(extracted_docs)
         if not combined_text:
             return api_error(
                 message="Could not extract readable text from uploaded report(s).",
@@ -736,51 +906,107 @@ def analyze_report_api(request):
                 errors={"warnings": warnings},
             )
 
-        analysis = _analyze_report_text_with_model(combined_text)
+        analysis = analyze_report_text(combined_text, user=request.user)
         if not analysis:
-            analysis = "Could not generate report analysis at the moment. Please try again."
-
-        title = (request.data.get("title") or "").strip()
-        if not title:
-            first_file = used_files[0] if used_files else "Medical Report"
-            title = f"Analysis - {first_file}"
+            analysis = ANALYSIS_FALLBACK
+        title = default_title(request.data.get("title"), used_files)
 
         report = MedicalReportAnalysis.objects.create(
             user=request.user,
-            title=title[:180],
+            title=title,
             file_names=used_files,
             extracted_text=combined_text,
             analysis=analysis,
             warnings=warnings,
         )
 
-        for uploaded in uploaded_files:
-            uploaded.seek(0)
-            MedicalReportUpload.objects.create(
-                report=report,
-                uploaded_by=request.user,
-                file=uploaded,
-                original_name=(uploaded.name or "").strip() or "report_file",
-                content_type=(getattr(uploaded, "content_type", "") or "").strip(),
-                size=getattr(uploaded, "size", 0) or 0,
-            )
+        with span("storage"):
+            index_reports([report])
+            with delete_new_blobs_on_error(), transaction.atomic():
+                uploads = [build_upload(uploaded, report=report, uploaded_by=request.user) for uploaded in uploaded_files]
+                for upload in uploads:
+                    upload.save()
+                schedule_previews(uploads)
 
-        try:
-            persist_ocr_debug_output(
-                session_id=f"report_{report.id}",
-                user_id=request.user.id,
-                extracted_details=extracted_details,
-                warnings=warnings,
-            )
-        except Exception:
-            pass
+            try:
+                persist_ocr_debug_output(
+                    session_id=f"report_{report.id}",
+                    user_id=request.user.id,
+                    extracted_details=extracted_details,
+                    warnings=warnings,
+                )
+            except Exception:
+                pass
 
         report = MedicalReportAnalysis.objects.prefetch_related("uploads").get(id=report.id)
         return api_success(data={"report": _public_report_payload(report, request=request)}, message="Report analyzed successfully.")
+    except llm_engine.LLMOverloaded as exc:
+        return _llm_busy_response(exc)
     except Exception:
         return api_error(message="Could not analyze uploaded report.", status=500, code="SERVER_ERROR")
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@throttle_classes([ReportBatchRateThrottle])
+def analyze_report_batch_api(request):
+    # Multipart: each file field is one report group, e.g. `patient-001` with that patient's files.
+    groups = [ReportGroup(key, files) for key, files in request.FILES.lists() if files]
+    if not groups:
+        return api_error(message="Please upload at least one report group.", status=400, code="VALIDATION_ERROR")
+    if len(groups) > REPORT_BATCH_MAX_GROUPS:
+        return api_error(
+            message=f"You can submit up to {REPORT_BATCH_MAX_GROUPS} report groups at a time.",
+            status=400,
+            code="VALIDATION_ERROR",
+        )
+
+    try:
+        with transaction.atomic():
+            job = submit_batch_job(groups, user=request.user)
+    except Exception:
+        return api_error(message="Could not start report batch.", status=500, code="SERVER_ERROR")
+    # OCR and LLM calls for up to REPORT_BATCH_MAX_GROUPS groups outlast a worker timeout; poll the job instead.
+    return api_success(
+        data={"job": _report_batch_job_payload(job, request)},
+        message=f"Analyzing {len(groups)} report groups.",
+        status=202,
+    )
+
+
+def _report_batch_job_payload(job, request):
+    payload = {
+        "id": job.id,
+        "status": job.status,
+        "groups": job.groups,
+        "completed": len(job.results),
+        "results": job.results,
+        "summary": job.summary,
+        "error": job.error,
+        "url": request.build_absolute_uri(f"/api/reports/analyze-batch/{job.id}/"),
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+    report_ids = [item["report_id"] for item in job.results if item.get("report_id")]
+    reports = MedicalReportAnalysis.objects.filter(id__in=report_ids, user_id=job.user_id).prefetch_related("uploads")
+    payload["reports"] = [_public_report_payload(report, request=request) for report in reports.order_by("id")]
+    return payload
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def report_batch_job_api(request, job_id):
+    try:
+        # A job whose worker died never finishes on its own; fail it here so pollers stop waiting.
+        fail_stale_jobs(ReportBatchJob.objects.filter(id=job_id, user=request.user))
+        job = get_object_or_404(ReportBatchJob, id=job_id, user=request.user)
+        return api_success(data={"job": _report_batch_job_payload(job, request)})
+    except Http404:
+        return api_error(message="Report batch not found.", status=404, code="NOT_FOUND")
+    except Exception:
+        return api_error(message="Could not load report batch.", status=500, code="SERVER_ERROR")
+
+
 @api_view(["GET"])
 @permission_classes([IsAdminUser])
 def admin_overview_api(request):
@@ -794,9 +1020,7 @@ def admin_overview_api(request):
         total_messages = ChatMessage.objects.count()
         bot_messages = ChatMessage.objects.filter(sender="bot").count()
         user_messages = ChatMessage.objects.filter(sender="user").count()
-        with open(MEDICAL_DATA_PATH, "r", encoding="utf-8") as f:
-            medical_data = json.load(f)
-        medical_entries = len(medical_data) if isinstance(medical_data, list) else 0
+        medical_entries = len(medical_store.data())
         recent_sessions = ChatSession.objects.order_by("-created_at")[:5]
 
         return api_success(
@@ -847,9 +1071,9 @@ def admin_users_api(request):
             "session_count": "session_count",
             "message_count": "message_count",
         }
-        order_by_field = sort_map.get(sort_field, "date_joined")
+        ordering = [sort_map.get(sort_field, "date_joined"), "id"]
         if sort_dir != "asc":
-            order_by_field = f"-{order_by_field}"
+            ordering = [f"-{key}" for key in ordering]
 
         users = User.objects.all().annotate(
             session_count=Count("chat_sessions", distinct=True),
@@ -867,33 +1091,28 @@ def admin_users_api(request):
             users = users.filter(is_active=False)
 
         if query:
-            users = users.filter(
-                Q(email__icontains=query) | Q(first_name__icontains=query) | Q(last_name__icontains=query)
-            )
+            users = search_users(users, query)
+            if sort_field == "relevance":
+                ordering = ["-search_rank", "-id"] if sort_dir != "asc" else ["search_rank", "id"]
 
-        total_count = users.count()
-        users = list(users.order_by(order_by_field)[offset : offset + page_size])
+        users, pagination = paginate(request, users, ordering, page=page, page_size=page_size, offset=offset)
+        profile_views = get_profile_views(users)
         active_admin_ids = set(User.objects.filter(is_staff=True, is_active=True).values_list("id", flat=True))
         data = []
         for user in users:
-            item = _admin_user_payload(user)
+            item = _admin_user_payload(user, profile_views.get(user.id))
             item["is_last_active_admin"] = user.id in active_admin_ids and len(active_admin_ids) == 1
             data.append(item)
         return api_success(
             data={
                 "users": data,
                 "summary": {
-                    "total": total_count,
+                    "total": pagination.get("total"),
                     "admins": len([u for u in data if u["is_staff"]]),
                     "regular_users": len([u for u in data if not u["is_staff"]]),
                     "active_admins": len(active_admin_ids),
                 },
-                "pagination": {
-                    "page": page,
-                    "page_size": page_size,
-                    "total": total_count,
-                    "total_pages": (total_count + page_size - 1) // page_size,
-                },
+                "pagination": pagination,
                 "filters": {
                     "q": query,
                     "role": role_filter,
@@ -903,6 +1122,8 @@ def admin_users_api(request):
                 },
             }
         )
+    except InvalidCursor as exc:
+        return api_error(message=str(exc), status=400, code="INVALID_CURSOR")
     except Exception:
         return api_error(message="Could not load users.", status=500, code="SERVER_ERROR")
 
@@ -961,6 +1182,7 @@ def admin_user_update_api(request, user_id):
 
         if update_fields:
             target.save(update_fields=list(set(update_fields)))
+            invalidate_user_tokens(target.id)
             _log_admin_action(
                 request.user,
                 action="user_permissions_updated",
@@ -981,21 +1203,55 @@ def admin_user_update_api(request, user_id):
         return api_error(message="Could not update user.", status=500, code="SERVER_ERROR")
 
 
-@api_view(["GET", "PUT"])
+@api_view(["GET", "PUT", "PATCH"])
 @permission_classes([IsAdminUser])
 def admin_medical_data_api(request):
     try:
         if request.method == "GET":
-            with open(MEDICAL_DATA_PATH, "r", encoding="utf-8") as f:
-                content = json.load(f)
+            etag = build_etag("medical-data", medical_store.current_version())
+            cached = not_modified(request, etag)
+            if cached:
+                return cached
+            version, content = medical_store.snapshot()
+            etag = build_etag("medical-data", version)
             return api_success(
                 data={
                     "medical_data": content,
+                    "version": version,
                     "stats": {
-                        "entries": len(content) if isinstance(content, list) else 0,
-                        "path": str(MEDICAL_DATA_PATH),
+                        "entries": len(content),
+                        "path": str(medical_store.path),
+                        "version": version,
                     },
-                }
+                },
+                etag=etag,
+            )
+
+        expected_version = request.data.get("version")
+        if expected_version is not None:
+            try:
+                expected_version = int(expected_version)
+            except (TypeError, ValueError):
+                return api_error(message="version must be an integer.", status=400, code="VALIDATION_ERROR")
+
+        if request.method == "PATCH":
+            version, content, changed_ids = medical_store.patch(
+                request.data.get("operations"),
+                actor=request.user,
+                note="Autosave snapshot before medical data patch",
+                expected_version=expected_version,
+            )
+            changed = sorted(changed_ids, key=str)
+            _log_admin_action(
+                request.user,
+                action="medical_data_patched",
+                entity_type="medical_data",
+                entity_id="json_file",
+                details={"entries": len(content), "version": version, "changed_ids": changed},
+            )
+            return api_success(
+                data={"entries": len(content), "version": version, "changed_ids": changed},
+                message="Medical data updated successfully.",
             )
 
         payload = request.data.get("medical_data")
@@ -1011,34 +1267,32 @@ def admin_medical_data_api(request):
         if not isinstance(payload, list):
             return api_error(message="medical_data JSON root must be an array.", status=400, code="VALIDATION_ERROR")
 
-        previous_data = []
-        try:
-            with open(MEDICAL_DATA_PATH, "r", encoding="utf-8") as f:
-                previous_data = json.load(f)
-        except Exception:
-            previous_data = []
-
-        MedicalDataVersion.objects.create(
+        version = medical_store.replace(
+            payload,
             actor=request.user,
             note="Autosave snapshot before medical data update",
-            snapshot=previous_data if isinstance(previous_data, list) else [],
+            expected_version=expected_version,
         )
-
-        with open(MEDICAL_DATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2)
-
-        llm_engine.MEDICAL_DATA = payload
         _log_admin_action(
             request.user,
             action="medical_data_updated",
             entity_type="medical_data",
             entity_id="json_file",
-            details={"entries": len(payload)},
+            details={"entries": len(payload), "version": version},
         )
         return api_success(
-            data={"entries": len(payload)},
+            data={"entries": len(payload), "version": version},
             message="Medical data updated successfully.",
         )
+    except MedicalDataConflict as exc:
+        return api_error(
+            message="Medical data was changed by someone else. Reload and try again.",
+            status=409,
+            code="VERSION_CONFLICT",
+            errors={"current_version": exc.current_version},
+        )
+    except MedicalDataValidationError as exc:
+        return api_error(message="Validation failed.", errors=exc.errors, status=400, code="VALIDATION_ERROR")
     except Exception:
         _log_admin_action(
             request.user,
@@ -1055,30 +1309,31 @@ def admin_medical_data_api(request):
 def admin_medical_versions_api(request):
     try:
         page, page_size, offset = _parse_pagination_params(request)
-        queryset = MedicalDataVersion.objects.select_related("actor").order_by("-created_at")
-        total = queryset.count()
-        versions = queryset[offset : offset + page_size]
+        queryset = (
+            MedicalDataVersion.objects.select_related("actor")
+            .only("id", "created_at", "note", "entry_count", "actor__email")
+        )
+        versions, pagination = paginate(
+            request, queryset, ["-created_at", "-id"], page=page, page_size=page_size, offset=offset
+        )
         data = [
             {
                 "id": version.id,
                 "created_at": version.created_at.isoformat() if version.created_at else None,
                 "note": version.note,
                 "actor_email": version.actor.email if version.actor else None,
-                "entries": len(version.snapshot) if isinstance(version.snapshot, list) else 0,
+                "entries": version.entry_count,
             }
             for version in versions
         ]
         return api_success(
             data={
                 "versions": data,
-                "pagination": {
-                    "page": page,
-                    "page_size": page_size,
-                    "total": total,
-                    "total_pages": (total + page_size - 1) // page_size,
-                },
+                "pagination": pagination,
             }
         )
+    except InvalidCursor as exc:
+        return api_error(message=str(exc), status=400, code="INVALID_CURSOR")
     except Exception:
         return api_error(message="Could not load medical versions.", status=500, code="SERVER_ERROR")
 
@@ -1087,11 +1342,9 @@ def admin_medical_versions_api(request):
 @permission_classes([IsAdminUser])
 def admin_restore_medical_version_api(request, version_id):
     try:
-        version = get_object_or_404(MedicalDataVersion, id=version_id)
-        snapshot = version.snapshot if isinstance(version.snapshot, list) else []
-        with open(MEDICAL_DATA_PATH, "w", encoding="utf-8") as f:
-            json.dump(snapshot, f, indent=2)
-        llm_engine.MEDICAL_DATA = snapshot
+        version = get_object_or_404(MedicalDataVersion.objects.select_related("checkpoint"), id=version_id)
+        snapshot = materialize(version)
+        medical_store.replace(snapshot, actor=request.user, record_history=False)
         _log_admin_action(
             request.user,
             action="medical_data_restored",
@@ -1119,11 +1372,13 @@ def admin_audit_logs_api(request):
     try:
         page, page_size, offset = _parse_pagination_params(request)
         action_query = (request.query_params.get("action") or "").strip().lower()
-        queryset = AdminAuditLog.objects.select_related("actor").order_by("-created_at")
+        audit_log_writer.flush()
+        queryset = AdminAuditLog.objects.select_related("actor")
         if action_query:
             queryset = queryset.filter(action__icontains=action_query)
-        total = queryset.count()
-        logs = queryset[offset : offset + page_size]
+        logs, pagination = paginate(
+            request, queryset, ["-created_at", "-id"], page=page, page_size=page_size, offset=offset
+        )
         data = [
             {
                 "id": log.id,
@@ -1139,14 +1394,11 @@ def admin_audit_logs_api(request):
         return api_success(
             data={
                 "logs": data,
-                "pagination": {
-                    "page": page,
-                    "page_size": page_size,
-                    "total": total,
-                    "total_pages": (total + page_size - 1) // page_size,
-                },
+                "pagination": pagination,
             }
         )
+    except InvalidCursor as exc:
+        return api_error(message=str(exc), status=400, code="INVALID_CURSOR")
     except Exception:
         return api_error(message="Could not load audit logs.", status=500, code="SERVER_ERROR")
 
@@ -1169,42 +1421,37 @@ def admin_health_api(request):
         health["database"] = {"ok": False, "detail": str(exc)}
 
     try:
-        with open(MEDICAL_DATA_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, list):
-            health["medical_json"] = {"ok": True, "detail": f"Loaded {len(data)} entries."}
-        else:
-            health["medical_json"] = {"ok": False, "detail": "JSON root is not an array."}
+        version, data = medical_store.snapshot()
+        health["medical_json"] = {"ok": True, "detail": f"Loaded {len(data)} entries (version {version})."}
     except Exception as exc:
         health["medical_json"] = {"ok": False, "detail": str(exc)}
 
-    try:
-        has_key = bool(os.getenv("GROQ_API") or os.getenv("GROQ_API_KEY"))
-        health["model_config"] = {"ok": has_key, "detail": "GROQ_API key present." if has_key else "Missing GROQ_API key."}
-    except Exception as exc:
-        health["model_config"] = {"ok": False, "detail": str(exc)}
+    health["model_config"] = llm_providers.config_status()
 
     probe_enabled = (request.query_params.get("probe") or "").lower() in {"1", "true", "yes"}
     probe_result = None
     if probe_enabled:
         try:
-            completion = llm_engine.client.chat.completions.create(
-                model="meta-llama/llama-4-scout-17b-16e-instruct",
-                messages=[
+            text = llm_engine.complete(
+                [
                     {"role": "system", "content": "Reply with one short line."},
                     {"role": "user", "content": "Is the model reachable?"},
                 ],
+                priority="probe",
+                purpose="health_probe",
+                user=request.user,
                 temperature=0,
                 max_completion_tokens=24,
                 top_p=1,
-            )
-            text = (completion.choices[0].message.content or "").strip()
+            ).strip()
             probe_result = {"ok": bool(text), "detail": text or "Empty response from model."}
+        except llm_engine.LLMOverloaded:
+            probe_result = {"ok": False, "detail": "Skipped: LLM capacity is saturated."}
         except Exception as exc:
             probe_result = {"ok": False, "detail": str(exc)}
 
-    fallback_reply_count = ChatMessage.objects.filter(sender="bot", message__icontains="something went wrong").count()
-    last_bot = ChatMessage.objects.filter(sender="bot").order_by("-created_at").first()
+    response_quality = reply_health_summary()
+    audit_log_writer.flush()
     recent_errors = AdminAuditLog.objects.filter(
         Q(action__icontains="failed") | Q(action__icontains="error")
     ).order_by("-created_at")[:8]
@@ -1215,10 +1462,12 @@ def admin_health_api(request):
             "status": "healthy" if all_ok else "degraded",
             "checks": health,
             "probe": probe_result,
-            "response_quality": {
-                "fallback_reply_count": fallback_reply_count,
-                "last_bot_message_at": last_bot.created_at.isoformat() if last_bot else None,
-            },
+            "response_quality": response_quality,
+            "audit_log": audit_log_writer.stats(),
+            "llm_call_log": llm_call_writer.stats(),
+            "llm_scheduler": llm_engine.scheduler.stats(),
+            "llm_single_flight": llm_engine.single_flight.stats(),
+            "llm_routing": llm_engine.router.stats(),
             "recent_errors": [
                 {
                     "id": err.id,
@@ -1231,3 +1480,34 @@ def admin_health_api(request):
             ],
         }
     )
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def admin_llm_usage_api(request):
+    try:
+        try:
+            days = int(request.query_params.get("days", 7))
+        except ValueError:
+            days = 7
+        purpose = (request.query_params.get("purpose") or "").strip() or None
+        llm_call_writer.flush()
+        return api_success(data=usage_summary(days=days, purpose=purpose))
+    except Exception:
+        return api_error(message="Could not load LLM usage.", status=500, code="SERVER_ERROR")
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def admin_metrics_api(request):
+    # Histograms are merged across workers; gauges describe the worker answering the scrape.
+    scheduler_stats = llm_engine.scheduler.stats()
+    gauges = {
+        "llm_in_flight": ("LLM calls currently running in this worker.", [({}, scheduler_stats["in_flight"])]),
+        "llm_queue_depth": (
+            "LLM calls waiting for a scheduler slot in this worker.",
+            [({"priority": name}, count) for name, count in scheduler_stats["queued"].items()],
+        ),
+        "audit_log_pending": ("Audit log rows buffered in this worker.", [({}, audit_log_writer.stats()["pending"])]),
+    }
+    return HttpResponse(render_prometheus(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
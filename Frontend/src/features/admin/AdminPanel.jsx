@@ -252,9 +252,13 @@ const AdminPanel = ({ user, onBackToApp, onLogout }) => {
     try {
       const response = await apiFetch("/api/admin/medical-data/", {
         method: "PUT",
-        body: { medical_data: medicalRows },
+        body: { medical_data: medicalRows, version: medicalStats?.version },
       });
-      setMedicalStats((prev) => ({ ...(prev || {}), entries: response?.data?.entries || medicalRows.length }));
+      setMedicalStats((prev) => ({
+        ...(prev || {}),
+        entries: response?.data?.entries || medicalRows.length,
+        version: response?.data?.version ?? prev?.version,
+      }));
       setSuccess("Medical data saved.");
     } catch (err) {
       setError(parseError(err, "Could not save medical data."));
@@ -66,6 +66,7 @@ export const UsersTab = ({
             }}
             className="rounded-lg border border-slate-300 bg-slate-50/80 px-3 py-2 text-sm"
           >
+            <option value="relevance">Relevance</option>
             <option value="date_joined">Joined Date</option>
             <option value="last_login">Last Login</option>
             <option value="name">Name</option>